@@ -0,0 +1,121 @@
+"""
+SSE 接收吞吐量基准。
+
+启动一个本地的替身后端，以随机大小的块推送 text/event-stream 事件，分别测量：
+
+- decoder: SSEDecoder 解码内存中的事件流；
+- listen_sse: HttpSseTransport.listen_sse 通过 HTTP 接收事件并放入 recv_queue。
+
+用法: python benchmarks/sse_throughput.py --events 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_manager import MessageManager  # noqa: E402
+from utils.sse import SSEDecoder  # noqa: E402
+from utils.transport import HttpSseTransport  # noqa: E402
+
+
+def build_stream(count: int, start: int = 0) -> bytes:
+    """
+    生成 count 个事件，格式与后端推送的回复相同。
+    """
+    parts = []
+    for i in range(start, count):
+        data = json.dumps({
+            'data': {
+                'receiver_id': f'@user{i % 100}',
+                'reply': '收到' * 20,
+                'context': {'msg_id': i}
+            }
+        }, ensure_ascii=False)
+        parts.append(f'id: {i + 1}\ndata: {data}\n\n')
+        if i % 1000 == 0:
+            parts.append(': heartbeat\n\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def split_chunks(data: bytes, max_chunk: int):
+    i = 0
+    while i < len(data):
+        n = random.randint(1, max_chunk)
+        yield data[i:i + n]
+        i += n
+
+
+def make_handler(count: int, max_chunk: int):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            # 按 Last-Event-ID 续传，重连后不重复推送
+            start = int(self.headers.get('Last-Event-ID') or 0)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for chunk in split_chunks(build_stream(count, start), max_chunk):
+                self.wfile.write(chunk)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def bench_decoder(stream: bytes, max_chunk: int) -> float:
+    chunks = list(split_chunks(stream, max_chunk))
+    decoder = SSEDecoder()
+    started = time.perf_counter()
+    count = 0
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            json.loads(event.data)
+            count += 1
+    return count, time.perf_counter() - started
+
+
+def bench_listen_sse(count: int, port: int) -> float:
+    manager = MessageManager(f'http://127.0.0.1:{port}', lambda message: None)
+    transport = HttpSseTransport(manager.base_url)
+    transport.manager = manager
+    thread = threading.Thread(target=transport.listen_sse, daemon=True)
+    started = time.perf_counter()
+    thread.start()
+    for _ in range(count):
+        manager.recv_queue.get()
+    elapsed = time.perf_counter() - started
+    transport.closing.set()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSE 接收吞吐量基准')
+    parser.add_argument('--events', type=int, default=100000)
+    parser.add_argument('--max-chunk', type=int, default=16384,
+                        help='替身后端每次写入的最大字节数')
+    args = parser.parse_args()
+
+    stream = build_stream(args.events)
+    count, elapsed = bench_decoder(stream, args.max_chunk)
+    print(f'decoder:    {count} events, {len(stream) / 2**20:.1f} MiB in '
+          f'{elapsed:.2f}s, {count / elapsed:,.0f} events/s')
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                 make_handler(args.events, args.max_chunk))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    elapsed = bench_listen_sse(args.events, server.server_address[1])
+    print(f'listen_sse: {args.events} events in {elapsed:.2f}s, '
+          f'{args.events / elapsed:,.0f} events/s')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+WebSocket 传输的本地回显测试工具。
+
+启动一个实现 WebSocketTransport 帧协议的回显后端：每条 send 帧先回复 ack（响应中的
+data 带有原消息的 MsgId），再推送一条 reply。用 MessageManager 发送消息，检查每条
+消息都收到了对应的确认和推送，并统计吞吐量。--drop-every 让后端每收到 N 帧断开一次连接，
+用于验证断线后的重连和重试。--wire-format 选择消息编码，后端按收到的帧自动解码
+（msgpack 需要安装 msgpack）。
+
+用法:
+    python benchmarks/ws_echo_harness.py --messages 10000
+    python benchmarks/ws_echo_harness.py --wire-format compact
+    python benchmarks/ws_echo_harness.py --serve --port 8765   # 只运行回显后端
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from aiohttp import WSMsgType, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message.universal_message import UniversalMessageWrapper  # noqa: E402
+from message.wire_message import (decode_wire, pack_msgpack,  # noqa: E402
+                                  unpack_msgpack)
+from message_manager import MessageManager  # noqa: E402
+from utils.transport import WebSocketTransport  # noqa: E402
+
+
+def message_id(message) -> str:
+    """
+    取出 send 帧中消息的 MsgId，json 编码时在 raw_message 中，compact 和 msgpack
+    编码时是字段编号为键的 WireMessage。
+    """
+    if '0' in message or 0 in message:
+        return decode_wire(message).message_id
+    return str(message['raw_message']['MsgId'])
+
+
+def make_app(drop_every: int = 0) -> web.Application:
+    frames = 0
+
+    async def handle_ws(request):
+        nonlocal frames
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type not in (WSMsgType.TEXT, WSMsgType.BINARY):
+                continue
+            frames += 1
+            if drop_every and frames % drop_every == 0:
+                # 不回复直接断开，模拟后端重启
+                await ws.close()
+                break
+            binary = msg.type == WSMsgType.BINARY
+            frame = unpack_msgpack(msg.data) if binary else msg.json()
+            echo = {'MsgId': message_id(frame['message'])}
+            # 用与收到的帧相同的编码回复
+            send = (lambda f: ws.send_bytes(pack_msgpack(f))) if binary \
+                else ws.send_json
+            await send({
+                'type': 'ack',
+                'id': frame['id'],
+                'response': {'data': {'ack': echo}}
+            })
+            await send({'type': 'reply', 'data': {'reply': echo}})
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handle_ws)
+    return app
+
+
+def run_server(app: web.Application, port: int) -> web.AppRunner:
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return runner
+
+
+def run_client(count: int, port: int, drop_every: int,
+               wire_format: str = 'json'):
+    received = []
+    done = threading.Event()
+
+    def collect(message):
+        received.append(message)
+        if len(received) == count * 2:
+            done.set()
+
+    transport = WebSocketTransport(f'ws://127.0.0.1:{port}/ws')
+    transport.wire_format = wire_format
+    manager = MessageManager(f'http://127.0.0.1:{port}', collect, transport)
+    manager.retry_interval = 0.05
+    manager.max_retry = 100
+    manager.dead_letter_path = os.devnull
+    manager.start()
+    started = time.perf_counter()
+    for i in range(count):
+        manager.send_message(
+            UniversalMessageWrapper(raw_message={'MsgId': i},
+                                    source='itchat',
+                                    app='wechat',
+                                    receiver_id='harness'))
+    ok = done.wait(60)
+    elapsed = time.perf_counter() - started
+    status = manager.status()
+    manager.stop()
+
+    acks = {m['ack']['MsgId'] for m in received if 'ack' in m}
+    replies = {m['reply']['MsgId'] for m in received if 'reply' in m}
+    missing = {str(i) for i in range(count)} - acks
+    print(f'{count} {wire_format} messages in {elapsed:.2f}s, {count / elapsed:,.0f} msg/s')
+    print(f'acks: {len(acks)}, replies: {len(replies)}, '
+          f'missing: {sorted(missing)[:10]}')
+    print(f'transport: {status["transport"]}')
+    if not ok or missing:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket 传输回显测试')
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--drop-every', type=int, default=0,
+                        help='后端每收到 N 帧断开一次连接，0 表示不断开')
+    parser.add_argument('--wire-format', default='json',
+                        choices=('json', 'compact', 'msgpack'),
+                        help='客户端的消息编码')
+    parser.add_argument('--serve', action='store_true', help='只运行回显后端')
+    args = parser.parse_args()
+
+    app = make_app(args.drop_every)
+    if args.serve:
+        web.run_app(app, host='127.0.0.1', port=args.port)
+        return
+    run_server(app, args.port)
+    run_client(args.messages, args.port, args.drop_every, args.wire_format)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 from .core import Core
 from .config import VERSION, ASYNC_COMPONENTS
 from .log import set_logging
+from .pool import CorePool
 
 if ASYNC_COMPONENTS:
     from .async_components import load_components
@@ -55,6 +56,7 @@ check_login                 = instance.check_login
 web_init                    = instance.web_init
 show_mobile_login           = instance.show_mobile_login
 start_receiving             = instance.start_receiving
+messages                    = instance.messages
 get_msg                     = instance.get_msg
 logout                      = instance.logout
 # components.contact
@@ -3,7 +3,6 @@ import json, copy
 import logging
 
 from .. import config, utils
-from ..components.contact import accept_friend
 from ..returnvalues import ReturnValue
 from ..storage import contact_change
 from ..utils import update_info_dict
@@ -26,7 +25,7 @@ def load_contact(core):
     core.delete_member_from_chatroom = delete_member_from_chatroom
     core.add_member_into_chatroom    = add_member_into_chatroom
 
-def update_chatroom(self, userName, detailedMember=False):
+async def update_chatroom(self, userName, detailedMember=False):
     if not isinstance(userName, list):
         userName = [userName]
     url = '%s/webwxbatchgetcontact?type=ex&r=%s' % (
@@ -40,15 +39,15 @@ def update_chatroom(self, userName, detailedMember=False):
         'List': [{
             'UserName': u,
             'ChatRoomId': '', } for u in userName], }
-    chatroomList = json.loads(self.s.post(url, data=json.dumps(data), headers=headers
-            ).content.decode('utf8', 'replace')).get('ContactList')
+    r = await self.transport.post(url, data=json.dumps(data), headers=headers)
+    chatroomList = json.loads(r.content.decode('utf8', 'replace')).get('ContactList')
     if not chatroomList:
         return ReturnValue({'BaseResponse': {
                 'ErrMsg': 'No chatroom found',
                 'Ret': -1001, }})
 
     if detailedMember:
-        def get_detailed_member_info(encryChatroomId, memberList):
+        async def get_detailed_member_info(encryChatroomId, memberList):
             url = '%s/webwxbatchgetcontact?type=ex&r=%s' % (
                 self.loginInfo['url'], int(time.time()))
             headers = {
@@ -61,14 +60,14 @@ def update_chatroom(self, userName, detailedMember=False):
                     'UserName': member['UserName'],
                     'EncryChatRoomId': encryChatroomId} \
                         for member in memberList], }
-            return json.loads(self.s.post(url, data=json.dumps(data), headers=headers
-                    ).content.decode('utf8', 'replace'))['ContactList']
+            r = await self.transport.post(url, data=json.dumps(data), headers=headers)
+            return json.loads(r.content.decode('utf8', 'replace'))['ContactList']
         MAX_GET_NUMBER = 50
         for chatroom in chatroomList:
             totalMemberList = []
             for i in range(int(len(chatroom['MemberList']) / MAX_GET_NUMBER + 1)):
                 memberList = chatroom['MemberList'][i*MAX_GET_NUMBER: (i+1)*MAX_GET_NUMBER]
-                totalMemberList += get_detailed_member_info(chatroom['EncryChatRoomId'], memberList)
+                totalMemberList += await get_detailed_member_info(chatroom['EncryChatRoomId'], memberList)
             chatroom['MemberList'] = totalMemberList
 
     update_local_chatrooms(self, chatroomList)
@@ -76,7 +75,7 @@ def update_chatroom(self, userName, detailedMember=False):
         for c in chatroomList]
     return r if 1 < len(r) else r[0]
 
-def update_friend(self, userName):
+async def update_friend(self, userName):
     if not isinstance(userName, list):
         userName = [userName]
     url = '%s/webwxbatchgetcontact?type=ex&r=%s' % (
@@ -90,8 +89,8 @@ def update_friend(self, userName):
         'List': [{
             'UserName': u,
             'EncryChatRoomId': '', } for u in userName], }
-    friendList = json.loads(self.s.post(url, data=json.dumps(data), headers=headers
-            ).content.decode('utf8', 'replace')).get('ContactList')
+    r = await self.transport.post(url, data=json.dumps(data), headers=headers)
+    friendList = json.loads(r.content.decode('utf8', 'replace')).get('ContactList')
 
     update_local_friends(self, friendList)
     r = [self.storageClass.search_friends(userName=f['UserName'])
@@ -160,6 +159,8 @@ def update_local_chatrooms(core, l):
         newSelf = utils.search_dict_list(oldChatroom['MemberList'],
             'UserName', core.storageClass.userName)
         oldChatroom['Self'] = newSelf or copy.deepcopy(core.loginInfo['User'])
+    if core.snapshotStore is not None:
+        core.snapshotStore.append('chatrooms', l)
     return {
         'Type'         : 'System',
         'Text'         : [chatroom['UserName'] for chatroom in l],
@@ -190,18 +191,19 @@ def update_local_friends(core, l):
                 core.mpList.append(oldInfoDict)
         else:
             update_info_dict(oldInfoDict, friend)
+    if core.snapshotStore is not None:
+        core.snapshotStore.append('friends', l)
 
-@contact_change
-def update_local_uin(core, msg):
+async def update_local_uin(core, msg):
     '''
         content contains uins and StatusNotifyUserName contains username
         they are in same order, so what I do is to pair them together
 
-        I caught an exception in this method while not knowing why
-        but don't worry, it won't cause any problem
+        updateLock is only held around local changes
+        so that it is never held while waiting for the server
     '''
     uins = re.search('<username>([^<]*?)<', msg['Content'])
-    usernameChangedList = []
+    usernameChangedList, uinList = [], []
     r = {
         'Type': 'System',
         'Text': usernameChangedList,
@@ -212,23 +214,24 @@ def update_local_uin(core, msg):
         if 0 < len(uins) == len(usernames):
             for uin, username in zip(uins, usernames):
                 if not '@' in username: continue
-                fullContact = core.memberList + core.chatroomList + core.mpList
-                userDicts = utils.search_dict_list(fullContact,
-                    'UserName', username)
-                if userDicts:
-                    if userDicts.get('Uin', 0) == 0:
-                        userDicts['Uin'] = uin
-                        usernameChangedList.append(username)
-                        logger.debug('Uin fetched: %s, %s' % (username, uin))
-                    else:
-                        if userDicts['Uin'] != uin:
-                            logger.debug('Uin changed: %s, %s' % (
-                                userDicts['Uin'], uin))
-                else:
-                    if '@@' in username:
-                        core.storageClass.updateLock.release()
-                        update_chatroom(core, username)
-                        core.storageClass.updateLock.acquire()
+                with core.storageClass.updateLock:
+                    fullContact = core.memberList + core.chatroomList + core.mpList
+                    userDicts = utils.search_dict_list(fullContact,
+                        'UserName', username)
+                    if userDicts:
+                        if userDicts.get('Uin', 0) == 0:
+                            userDicts['Uin'] = uin
+                            usernameChangedList.append(username)
+                            uinList.append((username, uin))
+                            logger.debug('Uin fetched: %s, %s' % (username, uin))
+                        else:
+                            if userDicts['Uin'] != uin:
+                                logger.debug('Uin changed: %s, %s' % (
+                                    userDicts['Uin'], uin))
+                        continue
+                if '@@' in username:
+                    await update_chatroom(core, username)
+                    with core.storageClass.updateLock:
                         newChatroomDict = utils.search_dict_list(
                             core.chatroomList, 'UserName', username)
                         if newChatroomDict is None:
@@ -239,10 +242,9 @@ def update_local_uin(core, msg):
                             core.chatroomList.append(newChatroomDict)
                         else:
                             newChatroomDict['Uin'] = uin
-                    elif '@' in username:
-                        core.storageClass.updateLock.release()
-                        update_friend(core, username)
-                        core.storageClass.updateLock.acquire()
+                elif '@' in username:
+                    await update_friend(core, username)
+                    with core.storageClass.updateLock:
                         newFriendDict = utils.search_dict_list(
                             core.memberList, 'UserName', username)
                         if newFriendDict is None:
@@ -252,37 +254,40 @@ def update_local_uin(core, msg):
                             core.memberList.append(newFriendDict)
                         else:
                             newFriendDict['Uin'] = uin
-                    usernameChangedList.append(username)
-                    logger.debug('Uin fetched: %s, %s' % (username, uin))
+                usernameChangedList.append(username)
+                uinList.append((username, uin))
+                logger.debug('Uin fetched: %s, %s' % (username, uin))
         else:
             logger.debug('Wrong length of uins & usernames: %s, %s' % (
                 len(uins), len(usernames)))
     else:
         logger.debug('No uins in 51 message')
         logger.debug(msg['Content'])
+    if uinList and core.snapshotStore is not None:
+        core.snapshotStore.append('uins', uinList)
     return r
 
-def get_contact(self, update=False):
+async def get_contact(self, update=False):
     if not update:
         return utils.contact_deep_copy(self, self.chatroomList)
-    def _get_contact(seq=0):
+    async def _get_contact(seq=0):
         url = '%s/webwxgetcontact?r=%s&seq=%s&skey=%s' % (self.loginInfo['url'],
             int(time.time()), seq, self.loginInfo['skey'])
         headers = {
             'ContentType': 'application/json; charset=UTF-8',
             'User-Agent' : config.USER_AGENT, }
         try:
-            r = self.s.get(url, headers=headers)
+            r = await self.transport.get(url, headers=headers)
         except:
             logger.info('Failed to fetch contact, that may because of the amount of your chatrooms')
-            for chatroom in self.get_chatrooms():
-                self.update_chatroom(chatroom['UserName'], detailedMember=True)
+            for chatroom in await self.get_chatrooms():
+                await self.update_chatroom(chatroom['UserName'], detailedMember=True)
             return 0, []
         j = json.loads(r.content.decode('utf-8', 'replace'))
         return j.get('Seq', 0), j.get('MemberList')
     seq, memberList = 0, []
     while 1:
-        seq, batchMemberList = _get_contact(seq)
+        seq, batchMemberList = await _get_contact(seq)
         memberList.extend(batchMemberList)
         if seq == 0:
             break
@@ -301,24 +306,24 @@ def get_contact(self, update=False):
         update_local_friends(self, otherList)
     return utils.contact_deep_copy(self, chatroomList)
 
-def get_friends(self, update=False):
+async def get_friends(self, update=False):
     if update:
-        self.get_contact(update=True)
+        await self.get_contact(update=True)
     return utils.contact_deep_copy(self, self.memberList)
 
-def get_chatrooms(self, update=False, contactOnly=False):
+async def get_chatrooms(self, update=False, contactOnly=False):
     if contactOnly:
-        return self.get_contact(update=True)
+        return await self.get_contact(update=True)
     else:
         if update:
-            self.get_contact(True)
+            await self.get_contact(True)
         return utils.contact_deep_copy(self, self.chatroomList)
 
-def get_mps(self, update=False):
-    if update: self.get_contact(update=True)
+async def get_mps(self, update=False):
+    if update: await self.get_contact(update=True)
     return utils.contact_deep_copy(self, self.mpList)
 
-def set_alias(self, userName, alias):
+async def set_alias(self, userName, alias):
     oldFriendInfo = utils.search_dict_list(
         self.memberList, 'UserName', userName)
     if oldFriendInfo is None:
@@ -332,14 +337,14 @@ def set_alias(self, userName, alias):
         'RemarkName'  : alias,
         'BaseRequest' : self.loginInfo['BaseRequest'], }
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.post(url, json.dumps(data, ensure_ascii=False).encode('utf8'),
+    r = await self.transport.post(url, json.dumps(data, ensure_ascii=False).encode('utf8'),
         headers=headers)
     r = ReturnValue(rawResponse=r)
     if r:
         oldFriendInfo['RemarkName'] = alias
     return r
 
-def set_pinned(self, userName, isPinned=True):
+async def set_pinned(self, userName, isPinned=True):
     url = '%s/webwxoplog?pass_ticket=%s' % (
         self.loginInfo['url'], self.loginInfo['pass_ticket'])
     data = {
@@ -348,10 +353,10 @@ def set_pinned(self, userName, isPinned=True):
         'OP'          : int(isPinned),
         'BaseRequest' : self.loginInfo['BaseRequest'], }
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.post(url, json=data, headers=headers)
+    r = await self.transport.post(url, json=data, headers=headers)
     return ReturnValue(rawResponse=r)
 
-def accept_friend(self, userName, v4= '', autoUpdate=True):
+async def accept_friend(self, userName, v4= '', autoUpdate=True):
     url = f"{self.loginInfo['url']}/webwxverifyuser?r={int(time.time())}&pass_ticket={self.loginInfo['pass_ticket']}"
     data = {
         'BaseRequest': self.loginInfo['BaseRequest'],
@@ -367,13 +372,13 @@ def accept_friend(self, userName, v4= '', autoUpdate=True):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8', 'replace'))
     if autoUpdate:
-        self.update_friend(userName)
+        await self.update_friend(userName)
     return ReturnValue(rawResponse=r)
 
-def get_head_img(self, userName=None, chatroomUserName=None, picDir=None):
+async def get_head_img(self, userName=None, chatroomUserName=None, picDir=None):
     ''' get head image
      * if you want to get chatroom header: only set chatroomUserName
      * if you want to get friend header: only set userName
@@ -403,7 +408,7 @@ def get_head_img(self, userName=None, chatroomUserName=None, picDir=None):
                 params['chatroomid'] = chatroom['EncryChatRoomId']
             params['chatroomid'] =  params.get('chatroomid') or chatroom['UserName']
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.get(url, params=params, stream=True, headers=headers)
+    r = await self.transport.get(url, params=params, stream=True, headers=headers)
     tempStorage = io.BytesIO()
     for block in r.iter_content(1024):
         tempStorage.write(block)
@@ -417,7 +422,7 @@ def get_head_img(self, userName=None, chatroomUserName=None, picDir=None):
         'Ret': 0, },
         'PostFix': utils.get_image_postfix(tempStorage.read(20)), })
 
-def create_chatroom(self, memberList, topic=''):
+async def create_chatroom(self, memberList, topic=''):
     url = '%s/webwxcreatechatroom?pass_ticket=%s&r=%s' % (
         self.loginInfo['url'], self.loginInfo['pass_ticket'], int(time.time()))
     data = {
@@ -428,11 +433,11 @@ def create_chatroom(self, memberList, topic=''):
     headers = {
         'content-type': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8', 'ignore'))
     return ReturnValue(rawResponse=r)
 
-def set_chatroom_name(self, chatroomUserName, name):
+async def set_chatroom_name(self, chatroomUserName, name):
     url = '%s/webwxupdatechatroom?fun=modtopic&pass_ticket=%s' % (
         self.loginInfo['url'], self.loginInfo['pass_ticket'])
     data = {
@@ -442,11 +447,11 @@ def set_chatroom_name(self, chatroomUserName, name):
     headers = {
         'content-type': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8', 'ignore'))
     return ReturnValue(rawResponse=r)
 
-def delete_member_from_chatroom(self, chatroomUserName, memberList):
+async def delete_member_from_chatroom(self, chatroomUserName, memberList):
     url = '%s/webwxupdatechatroom?fun=delmember&pass_ticket=%s' % (
         self.loginInfo['url'], self.loginInfo['pass_ticket'])
     data = {
@@ -456,10 +461,10 @@ def delete_member_from_chatroom(self, chatroomUserName, memberList):
     headers = {
         'content-type': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT}
-    r = self.s.post(url, data=json.dumps(data),headers=headers)
+    r = await self.transport.post(url, data=json.dumps(data),headers=headers)
     return ReturnValue(rawResponse=r)
 
-def add_member_into_chatroom(self, chatroomUserName, memberList,
+async def add_member_into_chatroom(self, chatroomUserName, memberList,
         useInvitation=False):
     ''' add or invite member into chatroom
      * there are two ways to get members into chatroom: invite or directly add
@@ -468,7 +473,7 @@ def add_member_into_chatroom(self, chatroomUserName, memberList,
     '''
     if not useInvitation:
         chatroom = self.storageClass.search_chatrooms(userName=chatroomUserName)
-        if not chatroom: chatroom = self.update_chatroom(chatroomUserName)
+        if not chatroom: chatroom = await self.update_chatroom(chatroomUserName)
         if len(chatroom['MemberList']) > self.loginInfo['InviteStartCount']:
             useInvitation = True
     if useInvitation:
@@ -484,5 +489,5 @@ def add_member_into_chatroom(self, chatroomUserName, memberList,
     headers = {
         'content-type': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT}
-    r = self.s.post(url, data=json.dumps(params),headers=headers)
+    r = await self.transport.post(url, data=json.dumps(params),headers=headers)
     return ReturnValue(rawResponse=r)
@@ -1,6 +1,5 @@
 import asyncio
 import os, time, re, io
-import threading
 import json
 import random
 import traceback
@@ -15,6 +14,7 @@ from pyqrcode import QRCode
 
 from .. import config, utils
 from ..returnvalues import ReturnValue
+from ..storage import AsyncQueue
 from ..storage.templates import wrap_user_dict
 from .contact import update_local_chatrooms, update_local_friends
 from .messages import produce_msg
@@ -30,8 +30,10 @@ def load_login(core):
     core.web_init          = web_init
     core.show_mobile_login = show_mobile_login
     core.start_receiving   = start_receiving
+    core.messages          = messages
     core.get_msg           = get_msg
     core.logout            = logout
+    core.msgQueueClass     = AsyncQueue
 
 async def login(self, enableCmdQR=False, picDir=None, qrCallback=None, EventScanPayload=None,ScanStatus=None,event_stream=None,
         loginCallback=None, exitCallback=None):
@@ -51,7 +53,7 @@ async def login(self, enableCmdQR=False, picDir=None, qrCallback=None, EventScan
             await asyncio.sleep(0.1)
         else:
             logger.info('Getting uuid of QR code.')
-            self.get_QRuuid()
+            await self.get_QRuuid()
             payload = EventScanPayload(
                 status=ScanStatus.Waiting,
                 qrcode=f"https://login.weixin.qq.com/l/{self.uuid}"
@@ -112,7 +114,7 @@ async def login(self, enableCmdQR=False, picDir=None, qrCallback=None, EventScan
     logger.info('Loading the contact, this may take a little while.')
     await self.web_init()
     await self.show_mobile_login()
-    self.get_contact(True)
+    await self.get_contact(True)
     if hasattr(loginCallback, '__call__'):
         r = await loginCallback(self.storageClass.userName)
     else:
@@ -129,13 +131,13 @@ async def push_login(core):
         url = '%s/cgi-bin/mmwebwx-bin/webwxpushloginurl?uin=%s' % (
             config.BASE_URL, cookiesDict['wxuin'])
         headers = { 'User-Agent' : config.USER_AGENT}
-        r = core.s.get(url, headers=headers).json()
+        r = (await core.transport.get(url, headers=headers)).json()
         if 'uuid' in r and r.get('ret') in (0, '0'):
             core.uuid = r['uuid']
             return r['uuid']
     return False
 
-def get_QRuuid(self):
+async def get_QRuuid(self):
     url = '%s/jslogin' % config.BASE_URL
     params = {
         'appid' : 'wx782c26e4c19acffb',
@@ -143,7 +145,7 @@ def get_QRuuid(self):
         'redirect_uri' : 'https://wx.qq.com/cgi-bin/mmwebwx-bin/webwxnewloginpage?mod=desktop',
         'lang'  : 'zh_CN' }
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.get(url, params=params, headers=headers)
+    r = await self.transport.get(url, params=params, headers=headers)
     regx = r'window.QRLogin.code = (\d+); window.QRLogin.uuid = "(\S+?)";'
     data = re.search(regx, r.text)
     if data and data.group(1) == '200':
@@ -174,7 +176,7 @@ async def check_login(self, uuid=None):
     params = 'loginicon=true&uuid=%s&tip=1&r=%s&_=%s' % (
         uuid, int(-localTime / 1579), localTime)
     headers = { 'User-Agent' : config.USER_AGENT}
-    r = self.s.get(url, params=params, headers=headers)
+    r = await self.transport.get(url, params=params, headers=headers)
     regx = r'window.code=(\d+)'
     data = re.search(regx, r.text)
     if data and data.group(1) == '200':
@@ -200,7 +202,7 @@ async def process_login_info(core, loginContent):
                 'extspam' : config.UOS_PATCH_EXTSPAM,
                 'referer' : 'https://wx.qq.com/?&lang=zh_CN&target=t'
               }
-    r = core.s.get(core.loginInfo['url'], headers=headers, allow_redirects=False)
+    r = await core.transport.get(core.loginInfo['url'], headers=headers, allow_redirects=False)
     core.loginInfo['url'] = core.loginInfo['url'][:core.loginInfo['url'].rfind('/')]
     for indexUrl, detailedUrl in (
             ("wx2.qq.com"      , ("file.wx2.qq.com", "webpush.wx2.qq.com")),
@@ -254,7 +256,7 @@ async def web_init(self):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT, }
-    r = self.s.post(url, params=params, data=json.dumps(data), headers=headers)
+    r = await self.transport.post(url, params=params, data=json.dumps(data), headers=headers)
     dic = json.loads(r.content.decode('utf-8', 'replace'))
     # deal with login info
     utils.emoji_formatter(dic['User'], 'NickName')
@@ -296,48 +298,62 @@ async def show_mobile_login(self):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT, }
-    r = self.s.post(url, data=json.dumps(data), headers=headers)
+    r = await self.transport.post(url, data=json.dumps(data), headers=headers)
     return ReturnValue(rawResponse=r)
 
 async def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
     self.alive = True
-    def maintain_loop():
+    self.msgList.open()
+    # raw (AddMsgList, ModContactList, SyncKey) batches waiting to be processed
+    syncQueue = asyncio.Queue(config.SYNC_QUEUE_SIZE)
+    async def process_loop():
+        while True:
+            syncResult = await syncQueue.get()
+            if syncResult is None:
+                break
+            msgList, contactList, syncKey = syncResult
+            try:
+                if msgList or contactList:
+                    await process_sync_result(self, msgList, contactList)
+            except asyncio.CancelledError:
+                raise
+            except:
+                logger.error(traceback.format_exc())
+            save_sync_state(self, syncKey, msgList)
+    async def maintain_loop():
+        processTask = asyncio.ensure_future(process_loop())
         retryCount = 0
         while self.alive:
             try:
-                i = sync_check(self)
+                i = await sync_check(self)
                 if i is None:
                     self.alive = False
                 elif i == '0':
                     pass
                 else:
-                    msgList, contactList = self.get_msg()
-                    if msgList:
-                        msgList = produce_msg(self, msgList)
-                        for msg in msgList:
-                            self.msgList.put(msg)
-                    if contactList:
-                        chatroomList, otherList = [], []
-                        for contact in contactList:
-                            if '@@' in contact['UserName']:
-                                chatroomList.append(contact)
-                            else:
-                                otherList.append(contact)
-                        chatroomMsg = update_local_chatrooms(self, chatroomList)
-                        chatroomMsg['User'] = self.loginInfo['User']
-                        self.msgList.put(chatroomMsg)
-                        update_local_friends(self, otherList)
+                    # SyncKey is updated by get_msg, so next synccheck
+                    # goes out while this batch is being processed
+                    msgList, contactList = await self.get_msg()
+                    if msgList is not None or contactList is not None:
+                        await syncQueue.put((msgList, contactList,
+                            self.loginInfo['SyncKey']))
                 retryCount = 0
             except requests.exceptions.ReadTimeout:
                 pass
+            except asyncio.CancelledError:
+                processTask.cancel()
+                raise
             except:
                 retryCount += 1
                 logger.error(traceback.format_exc())
                 if self.receivingRetryCount < retryCount:
                     self.alive = False
                 else:
-                    time.sleep(1)
-        self.logout()
+                    await asyncio.sleep(1)
+        await syncQueue.put(None)
+        await processTask
+        await self.logout()
+        self.msgList.close()
         if hasattr(exitCallback, '__call__'):
             exitCallback(self.storageClass.userName)
         else:
@@ -345,11 +361,50 @@ async def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
     if getReceivingFnOnly:
         return maintain_loop
     else:
-        maintainThread = threading.Thread(target=maintain_loop)
-        maintainThread.setDaemon(True)
-        maintainThread.start()
+        self.receivingTask = asyncio.ensure_future(maintain_loop())
+
+async def process_sync_result(core, msgList, contactList):
+    ''' turn raw webwxsync result into messages and contact updates
+        it runs as its own task, apart from the polling one
+    '''
+    if msgList:
+        msgList = await produce_msg(core, msgList)
+        for msg in msgList:
+            await core.msgList.put(msg)
+    if contactList:
+        chatroomList, otherList = [], []
+        for contact in contactList:
+            if '@@' in contact['UserName']:
+                chatroomList.append(contact)
+            else:
+                otherList.append(contact)
+        chatroomMsg = update_local_chatrooms(core, chatroomList)
+        chatroomMsg['User'] = core.loginInfo['User']
+        await core.msgList.put(chatroomMsg)
+        update_local_friends(core, otherList)
+
+def messages(self):
+    ''' async iterator of received messages
+        iteration stops after the receiving loop logs out
+        ..code::python
+
+            async for msg in core.messages():
+                print(msg.text)
+    '''
+    return self.msgList
+
+def save_sync_state(core, syncKey, msgList):
+    ''' journal SyncKey of a processed batch into hot reload file
+        so a restart resumes right after it '''
+    if core.snapshotStore is None:
+        return
+    try:
+        core.snapshotStore.save_sync_state(core.loginInfo.get('wxsid'), syncKey,
+            [core.msgIdWindow.key(msg) for msg in msgList or ()])
+    except:
+        logger.warning('Failed to journal SyncKey: %s' % traceback.format_exc())
 
-def sync_check(self):
+async def sync_check(self):
     url = '%s/synccheck' % self.loginInfo.get('syncUrl', self.loginInfo['url'])
     params = {
         'r'        : int(time.time() * 1000),
@@ -362,7 +417,7 @@ def sync_check(self):
     headers = { 'User-Agent' : config.USER_AGENT}
     self.loginInfo['logintime'] += 1
     try:
-        r = self.s.get(url, params=params, headers=headers, timeout=config.TIMEOUT)
+        r = await self.transport.get(url, params=params, headers=headers, timeout=config.TIMEOUT)
     except requests.exceptions.ConnectionError as e:
         try:
             if not isinstance(e.args[0].args[1], BadStatusLine):
@@ -382,7 +437,7 @@ def sync_check(self):
         return None
     return pm.group(2)
 
-def get_msg(self):
+async def get_msg(self):
     self.loginInfo['deviceid'] = 'e' + repr(random.random())[2:17]
     url = '%s/webwxsync?sid=%s&skey=%s&pass_ticket=%s' % (
         self.loginInfo['url'], self.loginInfo['wxsid'],
@@ -394,7 +449,7 @@ def get_msg(self):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, data=json.dumps(data), headers=headers, timeout=config.TIMEOUT)
+    r = await self.transport.post(url, data=json.dumps(data), headers=headers, timeout=config.TIMEOUT)
     dic = json.loads(r.content.decode('utf-8', 'replace'))
     if dic['BaseResponse']['Ret'] != 0: return None, None
     self.loginInfo['SyncKey'] = dic['SyncKey']
@@ -402,7 +457,7 @@ def get_msg(self):
         for item in dic['SyncCheckKey']['List']])
     return dic['AddMsgList'], dic['ModContactList']
 
-def logout(self):
+async def logout(self):
     if self.alive:
         url = '%s/webwxlogout' % self.loginInfo['url']
         params = {
@@ -410,7 +465,7 @@ def logout(self):
             'type'     : 1,
             'skey'     : self.loginInfo['skey'], }
         headers = { 'User-Agent' : config.USER_AGENT}
-        self.s.get(url, params=params, headers=headers)
+        await self.transport.get(url, params=params, headers=headers)
         self.alive = False
     self.isLogging = False
     self.s.cookies.clear()
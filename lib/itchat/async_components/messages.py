@@ -22,13 +22,13 @@ def load_messages(core):
     core.send         = send
     core.revoke       = revoke
 
-async def get_download_fn(core, url, msgId):
+def get_download_fn(core, url, msgId):
     async def download_fn(downloadDir=None):
         params = {
             'msgid': msgId,
             'skey': core.loginInfo['skey'],}
         headers = { 'User-Agent' : config.USER_AGENT}
-        r = core.s.get(url, params=params, stream=True, headers = headers)
+        r = await core.transport.get(url, params=params, stream=True, headers = headers)
         tempStorage = io.BytesIO()
         for block in r.iter_content(1024):
             tempStorage.write(block)
@@ -43,7 +43,7 @@ async def get_download_fn(core, url, msgId):
             'PostFix': utils.get_image_postfix(tempStorage.read(20)), })
     return download_fn
 
-def produce_msg(core, msgList):
+async def produce_msg(core, msgList):
     ''' for messages types
      * 40 msg, 43 videochat, 50 VOIPMSG, 52 voipnotifymsg
      * 53 webwxvoipnotifymsg, 9999 sysnotice
@@ -51,6 +51,10 @@ def produce_msg(core, msgList):
     rl = []
     srl = [40, 43, 50, 52, 53, 9999]
     for m in msgList:
+        if core.msgIdWindow.seen(m):
+            # long-poll retries, hot reload replays and multi-device sync
+            # may deliver the same message again
+            continue
         # get actual opposite
         if m['FromUserName'] == core.storageClass.userName:
             actualOpposite = m['ToUserName']
@@ -58,7 +62,7 @@ def produce_msg(core, msgList):
             actualOpposite = m['FromUserName']
         # produce basic message
         if '@@' in m['FromUserName'] or '@@' in m['ToUserName']:
-            produce_group_chat(core, m)
+            await produce_group_chat(core, m)
         else:
             utils.msg_formatter(m, 'Content')
         # set user of msg
@@ -124,7 +128,7 @@ def produce_msg(core, msgList):
                     'msgid': msgId,
                     'skey': core.loginInfo['skey'],}
                 headers = {'Range': 'bytes=0-', 'User-Agent' : config.USER_AGENT}
-                r = core.s.get(url, params=params, headers=headers, stream=True)
+                r = await core.transport.get(url, params=params, headers=headers, stream=True)
                 tempStorage = io.BytesIO()
                 for block in r.iter_content(1024):
                     tempStorage.write(block)
@@ -157,7 +161,7 @@ def produce_msg(core, msgList):
                         'pass_ticket': 'undefined',
                         'webwx_data_ticket': cookiesList['webwx_data_ticket'],}
                     headers = { 'User-Agent' : config.USER_AGENT}
-                    r = core.s.get(url, params=params, stream=True, headers=headers)
+                    r = await core.transport.get(url, params=params, stream=True, headers=headers)
                     tempStorage = io.BytesIO()
                     for block in r.iter_content(1024):
                         tempStorage.write(block)
@@ -198,7 +202,7 @@ def produce_msg(core, msgList):
                     'Type': 'Sharing',
                     'Text': m['FileName'], }
         elif m['MsgType'] == 51: # phone init
-            msg = update_local_uin(core, m)
+            msg = await update_local_uin(core, m)
         elif m['MsgType'] == 10000:
             msg = {
                 'Type': 'Note',
@@ -223,7 +227,7 @@ def produce_msg(core, msgList):
         rl.append(m)
     return rl
 
-def produce_group_chat(core, msg):
+async def produce_group_chat(core, msg):
     r = re.match('(@[0-9a-z]*?):<br/>(.*)$', msg['Content'])
     if r:
         actualUserName, content = r.groups()
@@ -242,7 +246,7 @@ def produce_group_chat(core, msg):
     member = utils.search_dict_list((chatroom or {}).get(
         'MemberList') or [], 'UserName', actualUserName)
     if member is None:
-        chatroom = core.update_chatroom(chatroomUserName)
+        chatroom = await core.update_chatroom(chatroomUserName)
         member = utils.search_dict_list((chatroom or {}).get(
             'MemberList') or [], 'UserName', actualUserName)
     if member is None:
@@ -273,7 +277,7 @@ async def send_raw_msg(self, msgType, content, toUserName):
             },
         'Scene': 0, }
     headers = { 'ContentType': 'application/json; charset=UTF-8', 'User-Agent' : config.USER_AGENT}
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -303,7 +307,7 @@ def _prepare_file(fileDir, file_=None):
     fileDict['file_'] = io.BytesIO(file_)
     return fileDict
 
-def upload_file(self, fileDir, isPicture=False, isVideo=False,
+async def upload_file(self, fileDir, isPicture=False, isVideo=False,
         toUserName='filehelper', file_=None, preparedFile=None):
     logger.debug('Request to upload a %s: %s' % (
         'picture' if isPicture else 'video' if isVideo else 'file', fileDir))
@@ -330,14 +334,14 @@ def upload_file(self, fileDir, isPicture=False, isVideo=False,
         ), separators = (',', ':'))
     r = {'BaseResponse': {'Ret': -1005, 'ErrMsg': 'Empty file detected'}}
     for chunk in range(chunks):
-        r = upload_chunk_file(self, fileDir, fileSymbol, fileSize,
+        r = await upload_chunk_file(self, fileDir, fileSymbol, fileSize,
             file_, chunk, chunks, uploadMediaRequest)
     file_.close()
     if isinstance(r, dict):
         return ReturnValue(r)
     return ReturnValue(rawResponse=r)
 
-def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
+async def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
         file_, chunk, chunks, uploadMediaRequest):
     url = core.loginInfo.get('fileUrl', core.loginInfo['url']) + \
         '/webwxuploadmedia?f=json'
@@ -363,7 +367,7 @@ def upload_chunk_file(core, fileDir, fileSymbol, fileSize,
     else:
         files['chunk'], files['chunks'] = (None, str(chunk)), (None, str(chunks))
     headers = { 'User-Agent' : config.USER_AGENT}
-    return core.s.post(url, files=files, headers=headers, timeout=config.TIMEOUT)
+    return await core.transport.post(url, files=files, headers=headers, timeout=config.TIMEOUT)
 
 async def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
     logger.debug('Request to send a file(mediaId: %s) to %s: %s' % (
@@ -379,7 +383,7 @@ async def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
         return preparedFile
     fileSize = preparedFile['fileSize']
     if mediaId is None:
-        r = self.upload_file(fileDir, preparedFile=preparedFile)
+        r = await self.upload_file(fileDir, preparedFile=preparedFile)
         if r:
             mediaId = r['MediaId']
         else:
@@ -401,7 +405,7 @@ async def send_file(self, fileDir, toUserName=None, mediaId=None, file_=None):
     headers = {
         'User-Agent': config.USER_AGENT,
         'Content-Type': 'application/json;charset=UTF-8', }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -420,7 +424,7 @@ async def send_image(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     if toUserName is None:
         toUserName = self.storageClass.userName
     if mediaId is None:
-        r = self.upload_file(fileDir, isPicture=not fileDir[-4:] == '.gif', file_=file_)
+        r = await self.upload_file(fileDir, isPicture=not fileDir[-4:] == '.gif', file_=file_)
         if r:
             mediaId = r['MediaId']
         else:
@@ -443,7 +447,7 @@ async def send_image(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     headers = {
         'User-Agent': config.USER_AGENT,
         'Content-Type': 'application/json;charset=UTF-8', }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -462,7 +466,7 @@ async def send_video(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     if toUserName is None:
         toUserName = self.storageClass.userName
     if mediaId is None:
-        r = self.upload_file(fileDir, isVideo=True, file_=file_)
+        r = await self.upload_file(fileDir, isVideo=True, file_=file_)
         if r:
             mediaId = r['MediaId']
         else:
@@ -482,7 +486,7 @@ async def send_video(self, fileDir=None, toUserName=None, mediaId=None, file_=No
     headers = {
         'User-Agent' : config.USER_AGENT,
         'Content-Type': 'application/json;charset=UTF-8', }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
 
@@ -522,6 +526,6 @@ async def revoke(self, msgId, toUserName, localId=None):
     headers = {
         'ContentType': 'application/json; charset=UTF-8',
         'User-Agent' : config.USER_AGENT }
-    r = self.s.post(url, headers=headers,
+    r = await self.transport.post(url, headers=headers,
         data=json.dumps(data, ensure_ascii=False).encode('utf8'))
     return ReturnValue(rawResponse=r)
@@ -1,8 +1,5 @@
-import logging, traceback, sys, threading
-try:
-    import Queue
-except ImportError:
-    import queue as Queue  # type: ignore
+import asyncio
+import logging, traceback, sys
 
 from ..log import set_logging
 from ..utils import test_connect
@@ -36,35 +33,33 @@ async def auto_login(self, EventScanPayload=None,ScanStatus=None,event_stream=No
         await self.login(enableCmdQR=enableCmdQR, picDir=picDir, qrCallback=qrCallback, EventScanPayload=EventScanPayload, ScanStatus=ScanStatus, event_stream=event_stream,
             loginCallback=loginCallback, exitCallback=exitCallback)
 
-async def configured_reply(self, event_stream, payload, message_container):
+async def configured_reply(self, event_stream=None, payload=None, message_container=None):
     ''' determine the type of message and reply if its method is defined
         however, I use a strange way to determine whether a msg is from massive platform
         I haven't found a better solution here
         The main problem I'm worrying about is the mismatching of new friends added on phone
         If you have any good idea, pleeeease report an issue. I will be more than grateful.
     '''
-    try:
-        msg = self.msgList.get(timeout=1)
-        if 'MsgId' in msg.keys():
-            message_container[msg['MsgId']] = msg
-    except Queue.Empty:
-        pass
+    msg = await self.msgList.get()
+    if msg is None: # receiving loop stopped
+        return
+    if message_container is not None and 'MsgId' in msg.keys():
+        message_container[msg['MsgId']] = msg
+    if isinstance(msg['User'], templates.User):
+        replyFn = self.functionDict['FriendChat'].get(msg['Type'])
+    elif isinstance(msg['User'], templates.MassivePlatform):
+        replyFn = self.functionDict['MpChat'].get(msg['Type'])
+    elif isinstance(msg['User'], templates.Chatroom):
+        replyFn = self.functionDict['GroupChat'].get(msg['Type'])
+    if replyFn is None:
+        r = None
     else:
-        if isinstance(msg['User'], templates.User):
-            replyFn = self.functionDict['FriendChat'].get(msg['Type'])
-        elif isinstance(msg['User'], templates.MassivePlatform):
-            replyFn = self.functionDict['MpChat'].get(msg['Type'])
-        elif isinstance(msg['User'], templates.Chatroom):
-            replyFn = self.functionDict['GroupChat'].get(msg['Type'])
-        if replyFn is None:
-            r = None
-        else:
-            try:
-                r = await replyFn(msg)
-                if r is not None:
-                    await self.send(r, msg.get('FromUserName'))
-            except:
-                logger.warning(traceback.format_exc())
+        try:
+            r = await replyFn(msg)
+            if r is not None:
+                await self.send(r, msg.get('FromUserName'))
+        except:
+            logger.warning(traceback.format_exc())
 
 def msg_register(self, msgType, isFriendChat=False, isGroupChat=False, isMpChat=False):
     ''' a decorator constructor
@@ -101,6 +96,4 @@ async def run(self, debug=False, blockThread=True):
     if blockThread:
         await reply_fn()
     else:
-        replyThread = threading.Thread(target=reply_fn)
-        replyThread.setDaemon(True)
-        replyThread.start()
+        return asyncio.ensure_future(reply_fn())
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import os
+import ssl
+import tempfile
+
+import requests  # type: ignore
+
+from .. import config
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger('itchat')
+
+def load_transport(core):
+    core.transport = property(get_transport, set_transport)
+
+def get_transport(self):
+    ''' transport is created on first use
+        so a custom one can be set before logging in '''
+    if getattr(self, '_transport', None) is None:
+        self._transport = create_transport(self.s)
+    return self._transport
+
+def set_transport(self, transport):
+    self._transport = transport
+
+def create_transport(session, connector=None):
+    ''' pick the transport named in config.ASYNC_TRANSPORT
+     * 'aiohttp': non-blocking, pooled keep-alive connections
+     * 'threadpool': requests.Session run in executor threads
+     * aiohttp falls back to threadpool if it is not installed
+    '''
+    if config.ASYNC_TRANSPORT == 'aiohttp':
+        if aiohttp is not None:
+            return AiohttpTransport(session, connector)
+        logger.debug('aiohttp is not installed, fall back to threadpool transport.')
+    return ThreadPoolTransport(session)
+
+class TransportResponse(object):
+    ''' a fully read response that looks like requests.Response
+        so ReturnValue and the old parsing code keep working
+     * body of a stream=True request is spooled into bodyFile
+        - kept in memory up to config.TRANSPORT_SPOOL_SIZE, then on disk
+        - iter_content reads it back without loading all of it
+    '''
+    def __init__(self, statusCode, content, headers=None, url='',
+            reason='', encoding=None, bodyFile=None):
+        self.status_code = statusCode
+        self._content = content
+        self.bodyFile = bodyFile
+        self.headers = headers or {}
+        self.url = url
+        self.reason = reason
+        self.encoding = encoding
+    @property
+    def content(self):
+        if self._content is None and self.bodyFile is not None:
+            self.bodyFile.seek(0)
+            self._content = self.bodyFile.read()
+            self.close()
+        return self._content
+    @property
+    def ok(self):
+        return self.status_code < 400
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', 'replace')
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        if self._content is None and self.bodyFile is not None:
+            self.bodyFile.seek(0)
+            for chunk in iter(lambda: self.bodyFile.read(chunk_size), b''):
+                yield chunk
+            return
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+    def close(self):
+        if self.bodyFile is not None:
+            self.bodyFile.close()
+            self.bodyFile = None
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError('%s Error: %s for url: %s' % (
+                self.status_code, self.reason, self.url), response=self)
+    def __bool__(self):
+        return self.ok
+    def __repr__(self):
+        return '<TransportResponse [%s]>' % self.status_code
+
+class BaseTransport(object):
+    ''' http layer used by async components
+     * cookies always live in the wrapped requests.Session
+        - so hot reload and cookie lookups need no change
+     * errors are raised as requests.exceptions
+        - so receiving loops can keep catching the same exceptions
+    '''
+    def __init__(self, session):
+        self.session = session
+    @property
+    def cookies(self):
+        return self.session.cookies
+    async def request(self, method, url, params=None, data=None, headers=None,
+            files=None, json=None, timeout=None, allow_redirects=True, stream=False):
+        raise NotImplementedError()
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+    async def post(self, url, data=None, **kwargs):
+        return await self.request('POST', url, data=data, **kwargs)
+    async def close(self):
+        pass
+
+class ThreadPoolTransport(BaseTransport):
+    ''' run the blocking requests.Session in an executor
+        event loop keeps running while the request is on the wire
+     * body is read in the worker thread, iter_content never blocks the loop
+        - with stream=True it is spooled, see TransportResponse
+    '''
+    def __init__(self, session, executor=None):
+        super(ThreadPoolTransport, self).__init__(session)
+        self.executor = executor
+    async def request(self, method, url, stream=False, **kwargs):
+        def _request():
+            r = self.session.request(method, url, stream=stream, **kwargs)
+            if not stream:
+                r.content # read body in worker thread
+                return r
+            with r:
+                bodyFile = spool_file()
+                for chunk in r.iter_content(SPOOL_CHUNK_SIZE):
+                    bodyFile.write(chunk)
+            return TransportResponse(r.status_code, None, r.headers, r.url,
+                r.reason or '', r.encoding, bodyFile)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, _request)
+
+class AiohttpTransport(BaseTransport):
+    ''' aiohttp transport with a pooled keep-alive connector
+     * requests is still used to prepare requests
+        - params, files and cookies are encoded exactly as before
+     * connector may be shared between transports
+        - it is not closed by transports that don't own it
+     * proxies, verify and cert of session are honored like requests does
+        - environment (HTTPS_PROXY, REQUESTS_CA_BUNDLE...) if trust_env
+        - socks proxies are not supported by aiohttp, use 'threadpool'
+    '''
+    def __init__(self, session, connector=None):
+        super(AiohttpTransport, self).__init__(session)
+        self.connector = connector
+        self.ownConnector = connector is None
+        self.client = None
+        self.sslDict = {}
+    def get_client(self):
+        if self.client is None or self.client.closed:
+            if self.ownConnector and (self.connector is None or self.connector.closed):
+                self.connector = create_connector()
+            self.client = aiohttp.ClientSession(
+                connector=self.connector,
+                connector_owner=self.ownConnector,
+                cookie_jar=aiohttp.DummyCookieJar())
+        return self.client
+    async def request(self, method, url, params=None, data=None, headers=None,
+            files=None, json=None, timeout=None, allow_redirects=True, stream=False):
+        prepared = self.session.prepare_request(requests.Request(method, url,
+            params=params, data=data, headers=headers, files=files, json=json))
+        headers = dict(prepared.headers)
+        headers.pop('Content-Length', None)
+        settings = self.session.merge_environment_settings(prepared.url,
+            {}, stream, None, None)
+        proxy = requests.utils.select_proxy(prepared.url, settings['proxies'])
+        if proxy and proxy.lower().startswith('socks'):
+            raise requests.exceptions.InvalidSchema(
+                'aiohttp transport does not support socks proxy %s' % proxy)
+        content = bodyFile = None
+        try:
+            async with self.get_client().request(prepared.method,
+                    URL(prepared.url, encoded=True), data=prepared.body,
+                    headers=headers, allow_redirects=allow_redirects,
+                    timeout=client_timeout(timeout), proxy=proxy,
+                    ssl=self.get_ssl(settings['verify'], settings['cert'])) as r:
+                if stream:
+                    bodyFile = spool_file()
+                    async for chunk in r.content.iter_chunked(SPOOL_CHUNK_SIZE):
+                        bodyFile.write(chunk)
+                else:
+                    content = await r.read()
+        except asyncio.TimeoutError as e:
+            if bodyFile is not None: bodyFile.close()
+            raise requests.exceptions.ReadTimeout(e)
+        except aiohttp.ClientConnectionError as e:
+            if bodyFile is not None: bodyFile.close()
+            raise requests.exceptions.ConnectionError(e)
+        self.extract_cookies(r)
+        return TransportResponse(r.status, content, r.headers, str(r.url),
+            r.reason or '', r.charset, bodyFile)
+    def get_ssl(self, verify, cert):
+        ''' ssl argument of aiohttp for requests style verify and cert '''
+        if verify is True and cert is None:
+            return True
+        if verify is False and cert is None:
+            return False
+        key = (verify, cert if not isinstance(cert, list) else tuple(cert))
+        if key not in self.sslDict:
+            if verify is False:
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            elif isinstance(verify, str) and os.path.isdir(verify):
+                context = ssl.create_default_context(capath=verify)
+            elif isinstance(verify, str):
+                context = ssl.create_default_context(cafile=verify)
+            else:
+                context = ssl.create_default_context()
+            if isinstance(cert, (tuple, list)):
+                context.load_cert_chain(*cert)
+            elif cert is not None:
+                context.load_cert_chain(cert)
+            self.sslDict[key] = context
+        return self.sslDict[key]
+    def extract_cookies(self, r):
+        for response in tuple(r.history) + (r,):
+            for name, morsel in response.cookies.items():
+                self.session.cookies.set(name, morsel.value,
+                    domain=morsel['domain'] or response.url.host,
+                    path=morsel['path'] or '/')
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+def spool_file():
+    return tempfile.SpooledTemporaryFile(config.TRANSPORT_SPOOL_SIZE)
+
+def create_connector(limit=None):
+    return aiohttp.TCPConnector(limit=limit or config.HTTP_POOL_SIZE,
+        ttl_dns_cache=300)
+
+def client_timeout(timeout):
+    ''' translate requests style timeout into aiohttp.ClientTimeout '''
+    if timeout is None:
+        return aiohttp.ClientTimeout(total=None)
+    if isinstance(timeout, tuple):
+        connectTimeout, readTimeout = timeout
+    else:
+        connectTimeout = readTimeout = timeout
+    return aiohttp.ClientTimeout(total=None,
+        sock_connect=connectTimeout, sock_read=readTimeout)
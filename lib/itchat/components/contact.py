@@ -169,6 +169,8 @@ def update_local_chatrooms(core, l):
         newSelf = utils.search_dict_list(oldChatroom['MemberList'],
                                          'UserName', core.storageClass.userName)
         oldChatroom['Self'] = newSelf or copy.deepcopy(core.loginInfo['User'])
+    if core.snapshotStore is not None:
+        core.snapshotStore.append('chatrooms', l)
     return {
         'Type': 'System',
         'Text': [chatroom['UserName'] for chatroom in l],
@@ -200,6 +202,8 @@ def update_local_friends(core, l):
                 core.mpList.append(oldInfoDict)
         else:
             update_info_dict(oldInfoDict, friend)
+    if core.snapshotStore is not None:
+        core.snapshotStore.append('friends', l)
 
 
 @contact_change
@@ -212,7 +216,7 @@ def update_local_uin(core, msg):
         but don't worry, it won't cause any problem
     '''
     uins = re.search('<username>([^<]*?)<', msg['Content'])
-    usernameChangedList = []
+    usernameChangedList, uinList = [], []
     r = {
         'Type': 'System',
         'Text': usernameChangedList,
@@ -231,6 +235,7 @@ def update_local_uin(core, msg):
                     if userDicts.get('Uin', 0) == 0:
                         userDicts['Uin'] = uin
                         usernameChangedList.append(username)
+                        uinList.append((username, uin))
                         logger.debug('Uin fetched: %s, %s' % (username, uin))
                     else:
                         if userDicts['Uin'] != uin:
@@ -265,6 +270,7 @@ def update_local_uin(core, msg):
                         else:
                             newFriendDict['Uin'] = uin
                     usernameChangedList.append(username)
+                    uinList.append((username, uin))
                     logger.debug('Uin fetched: %s, %s' % (username, uin))
         else:
             logger.debug('Wrong length of uins & usernames: %s, %s' % (
@@ -272,6 +278,8 @@ def update_local_uin(core, msg):
     else:
         logger.debug('No uins in 51 message')
         logger.debug(msg['Content'])
+    if uinList and core.snapshotStore is not None:
+        core.snapshotStore.append('uins', uinList)
     return r
 
 
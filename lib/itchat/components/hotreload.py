@@ -1,11 +1,13 @@
-import pickle, os
+import os
 import logging
 
 import requests
 
-from ..config import VERSION
+from .. import config, utils
+from ..config import VERSION, SNAPSHOT_COMPACT_RECORDS
 from ..returnvalues import ReturnValue
 from ..storage import templates
+from ..storage.snapshot import SnapshotStore, Checkpointer
 from .contact import update_local_chatrooms, update_local_friends
 from .messages import produce_msg
 
@@ -17,26 +19,27 @@ def load_hotreload(core):
 
 def dump_login_status(self, fileDir=None):
     fileDir = fileDir or self.hotReloadDir
-    try:
-        with open(fileDir, 'w') as f:
+    try: # check with a temp file, base snapshot is only ever replaced
+        with open(fileDir + '.tmp', 'w') as f:
             f.write('itchat - DELETE THIS')
-        os.remove(fileDir)
+        os.remove(fileDir + '.tmp')
     except:
         raise Exception('Incorrect fileDir')
-    status = {
-        'version'   : VERSION,
-        'loginInfo' : self.loginInfo,
-        'cookies'   : self.s.cookies.get_dict(),
-        'storage'   : self.storageClass.dumps()}
-    with open(fileDir, 'wb') as f:
-        pickle.dump(status, f)
+    store = self.snapshotStore
+    if store is None or store.fileDir != fileDir:
+        store = SnapshotStore(fileDir)
+    # journal is only written under updateLock, so no delta slips
+    # between taking the snapshot and truncating the journal
+    with self.storageClass.updateLock:
+        store.dump(get_login_status(self))
+    attach_snapshot_store(self, store)
     logger.debug('Dump login status for hot reload successfully.')
 
 def load_login_status(self, fileDir,
-        loginCallback=None, exitCallback=None):
+        loginCallback=None, exitCallback=None, lazy=None):
+    store = SnapshotStore(fileDir)
     try:
-        with open(fileDir, 'rb') as f:
-            j = pickle.load(f)
+        j, deltaList = store.load()
     except Exception as e:
         logger.debug('No such file, loading login status failed.')
         return ReturnValue({'BaseResponse': {
@@ -54,7 +57,17 @@ def load_login_status(self, fileDir,
     self.loginInfo['User'] = templates.User(self.loginInfo['User'])
     self.loginInfo['User'].core = self
     self.s.cookies = requests.utils.cookiejar_from_dict(j['cookies'])
-    self.storageClass.loads(j['storage'])
+    # resume after the last processed batch, not the dumped SyncKey
+    syncKey, msgIdList = store.load_sync_state(self.loginInfo.get('wxsid'))
+    if syncKey:
+        self.loginInfo['SyncKey'] = syncKey
+        self.loginInfo['synckey'] = '|'.join(['%s_%s' % (item['Key'], item['Val'])
+            for item in syncKey['List']])
+    self.msgIdWindow.update(msgIdList)
+    self.storageClass.loads(j['storage'],
+        config.SNAPSHOT_LAZY if lazy is None else lazy)
+    replay_contact_deltas(self, deltaList)
+    attach_snapshot_store(self, store)
     try:
         msgList, contactList = self.get_msg()
     except:
@@ -84,6 +97,48 @@ def load_login_status(self, fileDir,
             'ErrMsg': 'loading login status succeeded.',
             'Ret': 0, }})
 
+def get_login_status(core):
+    return {
+        'version'   : VERSION,
+        'loginInfo' : core.loginInfo,
+        'cookies'   : core.s.cookies.get_dict(),
+        'storage'   : core.storageClass.dumps()}
+
+def attach_snapshot_store(core, store):
+    ''' from now on contact updates of core are journaled into store
+        and login status is checkpointed into it in the background '''
+    if core.snapshotStore is not None and core.snapshotStore is not store:
+        core.snapshotStore.close()
+    store.statusFn = lambda: get_login_status(core)
+    store.compactRecords = SNAPSHOT_COMPACT_RECORDS
+    core.snapshotStore = store
+    if core.checkpointer is None and \
+            (config.CHECKPOINT_INTERVAL or SNAPSHOT_COMPACT_RECORDS):
+        core.checkpointer = Checkpointer(core)
+        core.checkpointer.start()
+    if core.checkpointer is not None:
+        # compact on the checkpointer thread, not the one applying updates
+        store.compactFn = core.checkpointer.notify
+
+def replay_contact_deltas(core, deltaList):
+    ''' apply contact deltas journaled after base snapshot was taken '''
+    for kind, payload in deltaList:
+        if kind == 'chatrooms':
+            update_local_chatrooms(core, payload)
+        elif kind == 'friends':
+            update_local_friends(core, payload)
+        elif kind == 'uins':
+            with core.storageClass.updateLock:
+                fullContact = core.memberList + core.chatroomList + core.mpList
+                for username, uin in payload:
+                    userDicts = utils.search_dict_list(fullContact,
+                        'UserName', username)
+                    if userDicts:
+                        userDicts['Uin'] = uin
+    if deltaList:
+        logger.debug('%s contact deltas replayed from hot reload journal.' %
+            len(deltaList))
+
 def load_last_login_status(session, cookiesDict):
     try:
         session.cookies = requests.utils.cookiejar_from_dict({
@@ -3,6 +3,7 @@ import time
 import re
 import io
 import threading
+import queue
 import json
 import xml.dom.minidom
 import random
@@ -287,8 +288,26 @@ def show_mobile_login(self):
 
 def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
     self.alive = True
+    # raw (AddMsgList, ModContactList, SyncKey) batches waiting to be processed
+    syncQueue = queue.Queue(config.SYNC_QUEUE_SIZE)
+
+    def process_loop():
+        while True:
+            syncResult = syncQueue.get()
+            if syncResult is None:
+                break
+            msgList, contactList, syncKey = syncResult
+            try:
+                if msgList or contactList:
+                    process_sync_result(self, msgList, contactList)
+            except:
+                logger.error(traceback.format_exc())
+            save_sync_state(self, syncKey, msgList)
 
     def maintain_loop():
+        processThread = threading.Thread(target=process_loop)
+        processThread.daemon = True
+        processThread.start()
         retryCount = 0
         while self.alive:
             try:
@@ -298,23 +317,12 @@ def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
                 elif i == '0':
                     pass
                 else:
+                    # SyncKey is updated by get_msg, so next synccheck
+                    # goes out while this batch is being processed
                     msgList, contactList = self.get_msg()
-                    if msgList:
-                        msgList = produce_msg(self, msgList)
-                        for msg in msgList:
-                            self.msgList.put(msg)
-                    if contactList:
-                        chatroomList, otherList = [], []
-                        for contact in contactList:
-                            if '@@' in contact['UserName']:
-                                chatroomList.append(contact)
-                            else:
-                                otherList.append(contact)
-                        chatroomMsg = update_local_chatrooms(
-                            self, chatroomList)
-                        chatroomMsg['User'] = self.loginInfo['User']
-                        self.msgList.put(chatroomMsg)
-                        update_local_friends(self, otherList)
+                    if msgList is not None or contactList is not None:
+                        syncQueue.put((msgList, contactList,
+                            self.loginInfo['SyncKey']))
                 retryCount = 0
             except requests.exceptions.ReadTimeout:
                 pass
@@ -327,6 +335,8 @@ def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
                     self.alive = False
                 else:
                     time.sleep(1)
+        syncQueue.put(None)
+        processThread.join()
         self.logout()
         if hasattr(exitCallback, '__call__'):
             exitCallback()
@@ -340,6 +350,39 @@ def start_receiving(self, exitCallback=None, getReceivingFnOnly=False):
         maintainThread.start()
 
 
+def process_sync_result(core, msgList, contactList):
+    ''' turn raw webwxsync result into messages and contact updates
+        it runs on processing thread, apart from the polling one
+    '''
+    if msgList:
+        msgList = produce_msg(core, msgList)
+        for msg in msgList:
+            core.msgList.put(msg)
+    if contactList:
+        chatroomList, otherList = [], []
+        for contact in contactList:
+            if '@@' in contact['UserName']:
+                chatroomList.append(contact)
+            else:
+                otherList.append(contact)
+        chatroomMsg = update_local_chatrooms(core, chatroomList)
+        chatroomMsg['User'] = core.loginInfo['User']
+        core.msgList.put(chatroomMsg)
+        update_local_friends(core, otherList)
+
+
+def save_sync_state(core, syncKey, msgList):
+    ''' journal SyncKey of a processed batch into hot reload file
+        so a restart resumes right after it '''
+    if core.snapshotStore is None:
+        return
+    try:
+        core.snapshotStore.save_sync_state(core.loginInfo.get('wxsid'), syncKey,
+            [core.msgIdWindow.key(msg) for msg in msgList or ()])
+    except:
+        logger.warning('Failed to journal SyncKey: %s' % traceback.format_exc())
+
+
 def sync_check(self):
     url = '%s/synccheck' % self.loginInfo.get('syncUrl', self.loginInfo['url'])
     params = {
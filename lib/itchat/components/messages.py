@@ -52,6 +52,10 @@ def produce_msg(core, msgList):
     rl = []
     srl = [40, 43, 50, 52, 53, 9999]
     for m in msgList:
+        if core.msgIdWindow.seen(m):
+            # long-poll retries, hot reload replays and multi-device sync
+            # may deliver the same message again
+            continue
         # get actual opposite
         if m['FromUserName'] == core.storageClass.userName:
             actualOpposite = m['ToUserName']
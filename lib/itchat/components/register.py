@@ -50,21 +50,25 @@ def configured_reply(self):
     except Queue.Empty:
         pass
     else:
-        if isinstance(msg['User'], templates.User):
-            replyFn = self.functionDict['FriendChat'].get(msg['Type'])
-        elif isinstance(msg['User'], templates.MassivePlatform):
-            replyFn = self.functionDict['MpChat'].get(msg['Type'])
-        elif isinstance(msg['User'], templates.Chatroom):
-            replyFn = self.functionDict['GroupChat'].get(msg['Type'])
-        if replyFn is None:
-            r = None
-        else:
-            try:
-                r = replyFn(msg)
-                if r is not None:
-                    self.send(r, msg.get('FromUserName'))
-            except:
-                logger.warning(traceback.format_exc())
+        reply_msg(self, msg)
+
+def reply_msg(core, msg):
+    ''' pass msg to its registered function and send back what it returns '''
+    if isinstance(msg['User'], templates.User):
+        replyFn = core.functionDict['FriendChat'].get(msg['Type'])
+    elif isinstance(msg['User'], templates.MassivePlatform):
+        replyFn = core.functionDict['MpChat'].get(msg['Type'])
+    elif isinstance(msg['User'], templates.Chatroom):
+        replyFn = core.functionDict['GroupChat'].get(msg['Type'])
+    if replyFn is None:
+        r = None
+    else:
+        try:
+            r = replyFn(msg)
+            if r is not None:
+                core.send(r, msg.get('FromUserName'))
+        except:
+            logger.warning(traceback.format_exc())
 
 def msg_register(self, msgType, isFriendChat=False, isGroupChat=False, isMpChat=False):
     ''' a decorator constructor
@@ -4,12 +4,39 @@ VERSION = '1.5.0.dev'
 
 # use this envrionment to initialize the async & sync componment
 ASYNC_COMPONENTS = os.environ.get('ITCHAT_UOS_ASYNC', False)
+# http transport of async components: 'aiohttp' or 'threadpool'
+ASYNC_TRANSPORT = os.environ.get('ITCHAT_UOS_TRANSPORT', 'aiohttp')
+HTTP_POOL_SIZE = int(os.environ.get('ITCHAT_UOS_POOL_SIZE', 100))
+# bytes of a stream=True response kept in memory before spooling to disk
+TRANSPORT_SPOOL_SIZE = 1024 * 1024
 
 BASE_URL = 'https://login.weixin.qq.com'
 OS = platform.system() # Windows, Linux, Darwin
 DIR = os.getcwd()
 DEFAULT_QR = 'QR.png'
 TIMEOUT = (10, 60)
+# raw webwxsync batches buffered between polling and processing
+SYNC_QUEUE_SIZE = 64
+# contact deltas journaled before hot reload file is compacted
+SNAPSHOT_COMPACT_RECORDS = 1000
+# hot reload file format: 'binary' or 'pickle', both can be loaded
+SNAPSHOT_FORMAT = 'binary'
+SNAPSHOT_MMAP = True
+# build member lists of chatrooms on first access when loading hot reload file
+SNAPSHOT_LAZY = False
+# seconds between background checks of hot reload status, 0 disables them
+# (the checker thread still compacts the journal)
+CHECKPOINT_INTERVAL = int(os.environ.get('ITCHAT_UOS_CHECKPOINT_INTERVAL', 30))
+# changes that make background checker write hot reload file
+# SyncKey is journaled on its own and changes on nearly every poll
+CHECKPOINT_TRIGGERS = ('skey', 'cookies')
+# processed webwxsync batches kept in SyncKey journal of hot reload file
+SYNC_KEY_JOURNAL_SIZE = 64
+SYNC_KEY_FSYNC = False
+# recent message ids remembered to drop messages delivered twice
+MSG_ID_WINDOW_SIZE = 100000
+# contacts whose sending core is remembered by CorePool
+POOL_ROUTE_SIZE = 100000
 
 USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/54.0.2840.71 Safari/537.36'
 
@@ -1,6 +1,6 @@
 import requests
 
-from . import storage
+from . import config, storage
 
 class Core(object):
     def __init__(self):
@@ -25,6 +25,8 @@ class Core(object):
         self.uuid = None
         self.functionDict = {'FriendChat': {}, 'GroupChat': {}, 'MpChat': {}}
         self.useHotReload, self.hotReloadDir = False, 'itchat.pkl'
+        self.snapshotStore, self.checkpointer = None, None
+        self.msgIdWindow = storage.MessageIdWindow(config.MSG_ID_WINDOW_SIZE)
         self.receivingRetryCount = 5
     def login(self, enableCmdQR=False, picDir=None, qrCallback=None,
             loginCallback=None, exitCallback=None):
@@ -121,6 +123,19 @@ class Core(object):
             it is defined in components/login.py
         '''
         raise NotImplementedError()
+    def messages(self):
+        ''' async iterator of received messages
+            for usage
+                ..code::python
+
+                    async for msg in core.messages():
+                        print(msg.text)
+
+            iteration stops after receiving loop logs out
+            it is only available with async components
+            it is defined in async_components/login.py
+        '''
+        raise NotImplementedError()
     def get_msg(self):
         ''' fetch messages
             for fetching
@@ -383,7 +398,7 @@ class Core(object):
         '''
         raise NotImplementedError()
     def load_login_status(self, fileDir,
-            loginCallback=None, exitCallback=None):
+            loginCallback=None, exitCallback=None, lazy=None):
         ''' load login status from a specific file
             for option
                 - fileDir: file for loading login status
@@ -391,6 +406,9 @@ class Core(object):
                     - if not set, screen is cleared and qrcode is deleted
                 - exitCallback: callback after logged out
                     - it contains calling of logout
+                - lazy: build member lists of chatrooms on first access
+                    - receiving starts without waiting for them
+                    - defaults to config.SNAPSHOT_LAZY
             it is defined in components/hotreload.py
         '''
         raise NotImplementedError()
@@ -0,0 +1,145 @@
+import logging, threading, traceback
+from collections import OrderedDict
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import requests
+
+from . import config, utils
+from .core import Core
+from .log import set_logging
+from .components.register import msg_register, reply_msg
+from .storage.messagequeue import Message
+
+logger = logging.getLogger('itchat')
+
+class PoolMessageQueue(object):
+    ''' msgList of a pooled core
+        messages are passed to the pool queue together with their core
+    '''
+    def __init__(self, core, poolQueue):
+        self.core = core
+        self.poolQueue = poolQueue
+    def put(self, message):
+        self.poolQueue.put((self.core, Message(message)))
+
+class CorePool(object):
+    ''' host many accounts in one process
+     * every core keeps its own storage and hot reload file
+     * all cores share one http connection pool
+     * messages of all cores go through one dispatcher
+        - functions registered on the pool are used by every core
+        - messages of one conversation are replied in order
+     * it works with sync components, use it instead of core.run
+    '''
+    def __init__(self, workerCount=4, poolSize=None):
+        self.coreDict = {}
+        self.functionDict = {'FriendChat': {}, 'GroupChat': {}, 'MpChat': {}}
+        self.msgList = queue.Queue()
+        # contact userName -> core that talked to it, least recent dropped first
+        self.routeDict = OrderedDict()
+        self.routeLock = threading.Lock()
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=10,
+            pool_maxsize=poolSize or config.HTTP_POOL_SIZE)
+        self.workerCount = workerCount
+        self.workerQueueList = []
+    msg_register = msg_register
+    def new_core(self, name, statusStorageDir=None):
+        ''' create a core for account name
+         * statusStorageDir defaults to '<name>.pkl'
+        '''
+        if name in self.coreDict:
+            return self.coreDict[name]
+        core = Core()
+        core.s.mount('https://', self.adapter)
+        core.s.mount('http://', self.adapter)
+        core.hotReloadDir = statusStorageDir or '%s.pkl' % name
+        core.functionDict = self.functionDict
+        core.msgList = core.storageClass.msgList = \
+            PoolMessageQueue(core, self.msgList)
+        self.coreDict[name] = core
+        return core
+    def auto_login(self, name, hotReload=True, statusStorageDir=None, **kwargs):
+        ''' log in account name, options are the same as core.auto_login '''
+        core = self.new_core(name, statusStorageDir)
+        core.auto_login(hotReload=hotReload,
+            statusStorageDir=statusStorageDir or core.hotReloadDir, **kwargs)
+        return core
+    def get_core(self, userName):
+        ''' find the core that should send messages to userName
+         * core that last received a message from userName
+         * core that owns userName in its contact
+        '''
+        core = self.routeDict.get(userName)
+        if core is not None and core.alive:
+            return core
+        for core in list(self.coreDict.values()):
+            if not core.alive:
+                continue
+            if core.storageClass.userName == userName:
+                return core
+            with core.storageClass.updateLock:
+                for contactList in (core.memberList, core.chatroomList, core.mpList):
+                    if utils.search_dict_list(contactList, 'UserName', userName):
+                        self.set_route(userName, core)
+                        return core
+    def set_route(self, userName, core):
+        ''' remember that messages to userName go out through core
+            only the latest config.POOL_ROUTE_SIZE contacts are kept '''
+        with self.routeLock:
+            self.routeDict[userName] = core
+            self.routeDict.move_to_end(userName)
+            while config.POOL_ROUTE_SIZE < len(self.routeDict):
+                self.routeDict.popitem(last=False)
+    @property
+    def alive(self):
+        return any(core.alive for core in self.coreDict.values())
+    def dispatch(self, core, msg):
+        if msg.get('FromUserName') == core.storageClass.userName:
+            userName = msg.get('ToUserName')
+        else:
+            userName = msg.get('FromUserName')
+        if userName and userName != core.storageClass.userName:
+            self.set_route(userName, core)
+        workerQueue = self.workerQueueList[hash(userName) % len(self.workerQueueList)]
+        workerQueue.put((core, msg))
+    def run(self, debug=False, blockThread=True):
+        logger.info('Start auto replying for %s accounts.' % len(self.coreDict))
+        if debug:
+            set_logging(loggingLevel=logging.DEBUG)
+        def worker_fn(workerQueue):
+            while True:
+                core, msg = workerQueue.get()
+                try:
+                    reply_msg(core, msg)
+                except Exception:
+                    logger.warning(traceback.format_exc())
+        if not self.workerQueueList:
+            for i in range(self.workerCount):
+                workerQueue = queue.Queue()
+                workerThread = threading.Thread(target=worker_fn, args=(workerQueue,))
+                workerThread.daemon = True
+                workerThread.start()
+                self.workerQueueList.append(workerQueue)
+        def dispatch_fn():
+            try:
+                while self.alive:
+                    try:
+                        core, msg = self.msgList.get(timeout=1)
+                    except queue.Empty:
+                        continue
+                    self.dispatch(core, msg)
+            except KeyboardInterrupt:
+                for core in self.coreDict.values():
+                    if core.useHotReload:
+                        core.dump_login_status()
+                    core.alive = False
+                logger.debug('itchat received an ^C and exit.')
+                logger.info('Bye~')
+        if blockThread:
+            dispatch_fn()
+        else:
+            dispatchThread = threading.Thread(target=dispatch_fn, daemon=True)
+            dispatchThread.start()
@@ -1,7 +1,8 @@
 import os, time, copy
 from threading import Lock
 
-from .messagequeue import Queue
+from .messagequeue import Queue, AsyncQueue, MessageIdWindow
+from .snapshot import StorageSnapshot
 from .templates import (
     ContactList, AbstractUserDict, User,
     MassivePlatform, Chatroom, ChatroomMember)
@@ -20,7 +21,7 @@ class Storage(object):
         self.memberList        = ContactList()
         self.mpList            = ContactList()
         self.chatroomList      = ContactList()
-        self.msgList           = Queue(-1)
+        self.msgList           = getattr(core, 'msgQueueClass', Queue)(-1)
         self.lastInputUserName = None
         self.memberList.set_default_value(contactClass=User)
         self.memberList.core = core
@@ -36,7 +37,11 @@ class Storage(object):
             'mpList'            : self.mpList,
             'chatroomList'      : self.chatroomList,
             'lastInputUserName' : self.lastInputUserName, }
-    def loads(self, j):
+    def loads(self, j, lazy=False):
+        ''' lazy only applies to binary snapshots
+            member lists of chatrooms are then built on first access '''
+        if isinstance(j, StorageSnapshot):
+            return j.restore(self, lazy)
         self.userName = j.get('userName', None)
         self.nickName = j.get('nickName', None)
         del self.memberList[:]
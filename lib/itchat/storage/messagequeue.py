@@ -1,4 +1,7 @@
+import asyncio
 import logging
+from collections import OrderedDict
+from threading import Lock
 try:
     import Queue as queue
 except ImportError:
@@ -12,6 +15,82 @@ class Queue(queue.Queue):
     def put(self, message):
         queue.Queue.put(self, Message(message))
 
+class AsyncQueue(asyncio.Queue):
+    ''' message queue used by async components
+     * get never blocks the event loop
+     * async for msg in queue: iterates until close is called
+        - messages put before close are still delivered
+     * close is called when receiving loop stops, open when it starts
+    '''
+    def __init__(self, maxsize=0):
+        super(AsyncQueue, self).__init__(maxsize)
+        self.closed = False
+    def put_nowait(self, message):
+        if message is not closeSignal:
+            message = Message(message)
+        asyncio.Queue.put_nowait(self, message)
+    def open(self):
+        self.closed = False
+    def close(self):
+        self.closed = True
+        self.put_nowait(closeSignal)
+    async def get(self):
+        ''' return None once queue is closed and drained '''
+        while True:
+            message = await asyncio.Queue.get(self)
+            if message is not closeSignal:
+                return message
+            elif self.closed:
+                self.put_nowait(closeSignal) # wake up other consumers
+                return None
+    def __aiter__(self):
+        return self
+    async def __anext__(self):
+        message = await self.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+closeSignal = object()
+
+class MessageIdWindow(object):
+    ''' bounded window of recently seen message ids
+     * NewMsgId is used if message has it, otherwise MsgId
+     * once size ids are kept, the least recently seen one is dropped
+        - so memory stays the same however many messages come
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.idDict = OrderedDict()
+        self.lock = Lock()
+    @staticmethod
+    def key(msg):
+        return msg.get('NewMsgId') or msg.get('MsgId')
+    def seen(self, msg):
+        ''' remember msg, return whether it was seen before '''
+        msgId = self.key(msg)
+        if msgId is None:
+            return False
+        with self.lock:
+            if msgId in self.idDict:
+                self.idDict.move_to_end(msgId)
+                return True
+            self.add(msgId)
+            return False
+    def update(self, msgIdList):
+        with self.lock:
+            for msgId in msgIdList:
+                self.add(msgId)
+    def add(self, msgId):
+        self.idDict[msgId] = None
+        self.idDict.move_to_end(msgId)
+        while self.size < len(self.idDict):
+            self.idDict.popitem(last=False)
+    def __contains__(self, msgId):
+        return msgId in self.idDict
+    def __len__(self):
+        return len(self.idDict)
+
 class Message(AttributeDict):
     def download(self, fileName):
         if hasattr(self.text, '__call__'):
@@ -0,0 +1,539 @@
+import os, struct, pickle, mmap
+import logging
+from threading import Lock, RLock, Thread, Event
+from weakref import ref
+
+from .. import config
+from .templates import (ContactList, User, MassivePlatform, Chatroom,
+    ChatroomMember, fakeContactList)
+
+logger = logging.getLogger('itchat')
+
+RECORD_HEADER = struct.Struct('>I')
+SNAPSHOT_MAGIC = b'ITCHATSS'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('>8sH') # magic, format version
+SNAPSHOT_FOOTER = struct.Struct('>QQ') # index offset, index size
+
+class SnapshotStore(object):
+    ''' hot reload file made of a base snapshot and an append-only journal
+     * base snapshot: the full login status
+        - written by dump and compaction, replaced atomically
+     * journal: contact deltas appended by update_local_*
+        - stored in fileDir + '.journal', one length-prefixed pickle per record
+        - a torn record at the tail (crash while writing) is ignored
+     * journal is folded into base every compactRecords records
+        - statusFn returns the status to compact with
+        - compactFn, if set, is called instead so that a background
+          thread (Checkpointer.notify) writes base off the appending thread
+     * replaying a delta twice is harmless, so a crash between
+       replacing base and truncating journal loses nothing
+     * base can be written without blocking journal appends
+        - prepare_dump copies status and journal position under updateLock
+        - write_base writes the copy and keeps records appended after it
+     * sync state: SyncKey of every processed webwxsync batch
+        - stored in fileDir + '.synckey' together with MsgIds of the batch
+        - rewritten with its newest half every SYNC_KEY_JOURNAL_SIZE records
+        - records of other sessions (wxsid) are ignored
+    '''
+    def __init__(self, fileDir, statusFn=None, compactRecords=None):
+        self.fileDir = fileDir
+        self.journalDir = fileDir + '.journal'
+        self.statusFn = statusFn
+        self.compactRecords = compactRecords
+        self.compactFn = None
+        self.recordCount = 0
+        self.journalSize = 0
+        self.journalFile = None
+        self.snapshot = None
+        self.lock = RLock()
+        self.dumpLock = RLock() # one base write at a time, taken before lock
+        self.syncKeyDir = fileDir + '.synckey'
+        self.syncKeyFile = None
+        self.syncKeyRecordList = []
+        self.syncKeyLock = Lock()
+    def dump(self, status):
+        ''' write status as base and empty the journal
+            caller holds updateLock, so status and journal agree '''
+        with self.dumpLock:
+            self.write_base(*self.prepare_dump(status))
+    def prepare_dump(self, status):
+        ''' copy status for write_base, call it under updateLock
+            return the copy and the journal position it matches '''
+        with self.lock:
+            if config.SNAPSHOT_FORMAT == 'binary':
+                payload = encode_snapshot(status)
+            else:
+                payload = pickle.dumps(status, pickle.HIGHEST_PROTOCOL)
+            return payload, (self.journalSize, self.recordCount)
+    def write_base(self, payload, position):
+        ''' replace base with payload from prepare_dump
+            records journaled after position are kept in the journal '''
+        with self.dumpLock:
+            tmpDir = self.fileDir + '.tmp'
+            with open(tmpDir, 'wb') as f:
+                if isinstance(payload, bytes):
+                    f.write(payload)
+                else:
+                    write_encoded_snapshot(f, payload)
+                f.flush()
+                os.fsync(f.fileno())
+            with self.lock:
+                if self.snapshot is not None and os.name == 'nt':
+                    # a mapped file can't be replaced on windows, stop reading
+                    # from it; elsewhere the old file stays readable
+                    self.snapshot.release()
+                    self.snapshot = None
+                journalSize, recordCount = position
+                tail = b''
+                if journalSize < self.journalSize:
+                    with open(self.journalDir, 'rb') as f:
+                        f.seek(journalSize)
+                        tail = f.read(self.journalSize - journalSize)
+                os.replace(tmpDir, self.fileDir)
+                self.close()
+                if tail:
+                    tmpDir = self.journalDir + '.tmp'
+                    with open(tmpDir, 'wb') as f:
+                        f.write(tail)
+                    os.replace(tmpDir, self.journalDir)
+                    self.journalFile = open(self.journalDir, 'ab')
+                else:
+                    self.journalFile = open(self.journalDir, 'wb')
+                self.journalSize = len(tail)
+                self.recordCount -= recordCount
+    def load(self):
+        ''' return base status and the list of (kind, payload) deltas
+            raise if base snapshot can't be read '''
+        with self.lock:
+            status = read_snapshot(self.fileDir)
+            if isinstance(status.get('storage'), StorageSnapshot):
+                self.snapshot = status['storage']
+            deltaList, validSize = read_records(self.journalDir)
+            if os.path.exists(self.journalDir) and \
+                    validSize < os.path.getsize(self.journalDir):
+                # drop torn tail so new records are appended after valid ones
+                with open(self.journalDir, 'r+b') as f:
+                    f.truncate(validSize)
+            self.recordCount = len(deltaList)
+            self.journalSize = validSize
+            return status, deltaList
+    def append(self, kind, payload):
+        data = pack_record((kind, payload))
+        with self.lock:
+            if self.journalFile is None:
+                self.journalFile = open(self.journalDir, 'ab')
+            self.journalFile.write(data)
+            self.journalFile.flush()
+            self.recordCount += 1
+            self.journalSize += len(data)
+            if self.need_compact():
+                if self.compactFn is None:
+                    self.compact()
+                else:
+                    self.compactFn()
+    def need_compact(self):
+        return self.statusFn is not None and bool(self.compactRecords) and \
+            self.compactRecords <= self.recordCount
+    def compact(self):
+        # a checkpoint writing base right now shortens the journal anyway,
+        # and waiting for it here would invert the dumpLock -> lock order
+        if not self.dumpLock.acquire(False):
+            return
+        try:
+            with self.lock:
+                self.dump(self.statusFn())
+                logger.debug('Hot reload journal compacted into %s.' % self.fileDir)
+        finally:
+            self.dumpLock.release()
+    def load_sync_state(self, sessionId):
+        ''' return newest SyncKey of session and MsgIds of its recent batches '''
+        with self.syncKeyLock:
+            syncStateList = [syncState for syncState in
+                read_records(self.syncKeyDir)[0] if syncState[0] == sessionId]
+            syncStateList = syncStateList[-config.SYNC_KEY_JOURNAL_SIZE:]
+            self.syncKeyRecordList = [pack_record(syncState)
+                for syncState in syncStateList]
+            if not syncStateList:
+                return None, []
+            return syncStateList[-1][1], \
+                [msgId for syncState in syncStateList for msgId in syncState[2]]
+    def save_sync_state(self, sessionId, syncKey, msgIdList):
+        data = pack_record((sessionId, syncKey, msgIdList))
+        with self.syncKeyLock:
+            if config.SYNC_KEY_JOURNAL_SIZE <= len(self.syncKeyRecordList):
+                self.syncKeyRecordList = self.syncKeyRecordList[
+                    -(config.SYNC_KEY_JOURNAL_SIZE // 2):]
+                self.close_sync_state()
+            if self.syncKeyFile is None:
+                # start from records of this session only
+                tmpDir = self.syncKeyDir + '.tmp'
+                with open(tmpDir, 'wb') as f:
+                    f.write(b''.join(self.syncKeyRecordList))
+                os.replace(tmpDir, self.syncKeyDir)
+                self.syncKeyFile = open(self.syncKeyDir, 'ab')
+            self.syncKeyFile.write(data)
+            self.syncKeyFile.flush()
+            if config.SYNC_KEY_FSYNC:
+                os.fsync(self.syncKeyFile.fileno())
+            self.syncKeyRecordList.append(data)
+    def close_sync_state(self):
+        if self.syncKeyFile is not None:
+            self.syncKeyFile.close()
+            self.syncKeyFile = None
+    def close(self):
+        with self.lock:
+            if self.journalFile is not None:
+                self.journalFile.close()
+                self.journalFile = None
+
+def pack_record(obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    return RECORD_HEADER.pack(len(data)) + data
+
+def read_records(fileDir):
+    ''' return records in fileDir and size of the valid part
+        records are packed by pack_record, a torn tail is ignored '''
+    recordList, validSize = [], 0
+    try:
+        f = open(fileDir, 'rb')
+    except IOError:
+        return recordList, validSize
+    with f:
+        while 1:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            size = RECORD_HEADER.unpack(header)[0]
+            data = f.read(size)
+            try:
+                if len(data) < size:
+                    raise EOFError()
+                recordList.append(pickle.loads(data))
+            except Exception:
+                logger.debug('Torn record at the end of %s is ignored.' % fileDir)
+                break
+            validSize += RECORD_HEADER.size + size
+    return recordList, validSize
+
+class Checkpointer(object):
+    ''' write hot reload status of a core in the background
+     * status is checked every interval seconds
+        - it is written only if something in triggers changed
+        - triggers: 'skey' and 'cookies' by default, 'SyncKey' is
+          journaled separately and would rewrite base on nearly every poll
+        - notify wakes it up before interval is over
+        - a journal longer than compactRecords is written as well,
+          appends only notify so compaction happens on this thread
+        - interval 0 means it only wakes up for compaction
+     * writes go through core.snapshotStore, so base is replaced atomically
+        - status is copied under updateLock and written outside of it,
+          so the sync thread is only blocked for the copy
+     * nothing is written while core is not alive
+    '''
+    def __init__(self, core, interval=None, triggers=None):
+        self.core = ref(core)
+        self.interval = interval or config.CHECKPOINT_INTERVAL
+        self.triggers = triggers or config.CHECKPOINT_TRIGGERS
+        self.lastFingerprint = self.fingerprint(core)
+        self.wakeEvent = Event()
+        self.thread = None
+    def fingerprint(self, core):
+        r = []
+        for trigger in self.triggers:
+            if trigger == 'cookies':
+                r.append(tuple(sorted(core.s.cookies.get_dict().items())))
+            elif trigger == 'SyncKey':
+                r.append(core.loginInfo.get('synckey'))
+            else:
+                r.append(core.loginInfo.get(trigger))
+        return tuple(r)
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = Thread(target=self.checkpoint_loop)
+            self.thread.daemon = True
+            self.thread.start()
+    def notify(self):
+        self.wakeEvent.set()
+    def checkpoint_loop(self):
+        while 1:
+            self.wakeEvent.wait(self.interval or None)
+            self.wakeEvent.clear()
+            core = self.core()
+            if core is None:
+                break
+            try:
+                self.checkpoint(core)
+            except Exception:
+                logger.warning('Failed to checkpoint login status.', exc_info=True)
+            del core
+    def checkpoint(self, core):
+        store = core.snapshotStore
+        if store is None or store.statusFn is None or not core.alive:
+            return False
+        fingerprint = self.fingerprint(core)
+        if fingerprint == self.lastFingerprint and not store.need_compact():
+            return False
+        with core.storageClass.updateLock:
+            if not core.alive:
+                return False
+            payload, position = store.prepare_dump(store.statusFn())
+        store.write_base(payload, position)
+        self.lastFingerprint = fingerprint
+        logger.debug('Login status checkpointed to %s.' % store.fileDir)
+        return True
+
+def encode_contacts(contactList, skipKeys=('MemberList',)):
+    ''' turn a list of contacts into a flat table of plain tuples
+     * table is (keySetList, rowList), row is (keySetIndex, valueTuple)
+     * contacts rarely differ in keys, so key names are stored only once
+    '''
+    keySetDict, rowList = {}, []
+    for contact in contactList:
+        keySet = tuple(k for k in contact if k not in skipKeys)
+        keySetIndex = keySetDict.setdefault(keySet, len(keySetDict))
+        rowList.append((keySetIndex, tuple(contact[k] for k in keySet)))
+    return list(keySetDict), rowList
+
+def build_contacts(contactClass, table, attrDict):
+    ''' build contacts from table without calling their init
+        attrDict is copied into every contact as its attributes '''
+    keySetList, rowList = table
+    keySetList = [keySet + ('MemberList',) for keySet in keySetList]
+    contactList, new, init = [], contactClass.__new__, dict.__init__
+    for keySetIndex, values in rowList:
+        contact = new(contactClass)
+        init(contact, zip(keySetList[keySetIndex], values + (fakeContactList,)))
+        contact.__dict__ = attrDict.copy()
+        contactList.append(contact)
+    return contactList
+
+def write_snapshot(f, status):
+    ''' write status in binary snapshot format
+     * header: magic and format version
+     * sections: pickled flat tables of plain python types
+        - friends, mps, chatrooms and one member table per chatroom
+     * index: pickled status without contacts and offsets of sections
+     * footer: offset and size of index
+    '''
+    write_encoded_snapshot(f, encode_snapshot(status))
+
+def encode_snapshot(status):
+    ''' copy status into the sections of a binary snapshot
+     * the copy shares nothing mutable with live storage
+     * member lists not built yet (LazyContactList) are not built here,
+       their encoded section is copied as it is
+    '''
+    storage = status['storage']
+    sectionDict = {
+        'friends': encode_contacts(storage['memberList']),
+        'mps': encode_contacts(storage['mpList']),
+        'chatrooms': encode_contacts(storage['chatroomList'],
+            ('MemberList', 'Self')), }
+    selfList, memberTableList = [], []
+    for chatroom in storage['chatroomList']:
+        memberList = chatroom.get('MemberList')
+        encoded = encoded_members(memberList)
+        if encoded is None:
+            memberList = memberList or []
+        chatroomSelf = chatroom.get('Self')
+        if chatroomSelf is None:
+            selfList.append(None)
+        else:
+            if encoded is None:
+                isMember = any(member is chatroomSelf for member in memberList)
+            else:
+                # Self is replaced by the member of the same name once built
+                isMember = encoded[0] is not None and encoded[0][0]
+            selfList.append((isMember,
+                dict((k, v) for k, v in chatroomSelf.items()
+                    if k != 'MemberList')))
+        memberTableList.append(encode_contacts(memberList)
+            if encoded is None else encoded[1])
+    sectionDict['selfs'] = selfList
+    index = dict((k, dict(v) if isinstance(v, dict) else v)
+        for k, v in status.items() if k != 'storage')
+    index['storage'] = dict((k, v) for k, v in storage.items()
+        if k not in ('memberList', 'mpList', 'chatroomList'))
+    return sectionDict, memberTableList, index
+
+def encoded_members(memberList):
+    ''' return (chatroomSelf, pickled member table) of a LazyContactList
+        that is not built yet, None for any other member list '''
+    if getattr(memberList, 'pending', None) is None:
+        return None
+    snapshot = memberList.pending[0]
+    with snapshot.lock:
+        if memberList.pending is None:
+            return None
+        offset, size = memberList.pending[2]
+        return memberList.pending[3], bytes(snapshot.buf[offset:offset + size])
+
+def write_encoded_snapshot(f, encoded):
+    ''' write sections from encode_snapshot, see write_snapshot
+        sections already pickled (bytes) are written as they are '''
+    sectionDict, memberTableList, index = encoded
+    f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+    def write_section(obj):
+        data = obj if isinstance(obj, bytes) else \
+            pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        offset = f.tell()
+        f.write(data)
+        return offset, len(data)
+    index = dict(index)
+    index['sections'] = dict((name, write_section(table))
+        for name, table in sectionDict.items())
+    index['memberSections'] = [write_section(table)
+        for table in memberTableList]
+    f.write(SNAPSHOT_FOOTER.pack(*write_section(index)))
+
+def read_snapshot(fileDir, useMmap=None):
+    ''' read status written by write_snapshot or by pickle
+        for binary snapshots status['storage'] is a StorageSnapshot '''
+    useMmap = config.SNAPSHOT_MMAP if useMmap is None else useMmap
+    with open(fileDir, 'rb') as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size or \
+                SNAPSHOT_HEADER.unpack(header)[0] != SNAPSHOT_MAGIC:
+            f.seek(0)
+            return pickle.load(f)
+        formatVersion = SNAPSHOT_HEADER.unpack(header)[1]
+        if formatVersion != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot format version %s' % formatVersion)
+        if useMmap:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            f.seek(0)
+            buf = f.read()
+    snapshot = StorageSnapshot(buf)
+    status = dict(snapshot.index)
+    status['storage'] = snapshot
+    return status
+
+class StorageSnapshot(object):
+    ''' storage part of a binary snapshot, restored by Storage.loads
+     * contacts are built directly from flat tables
+        - no template init, no second walk to fix core and chatroom
+     * with lazy restore, member lists of chatrooms are LazyContactList
+        - members are built on first access to each chatroom
+        - chatroom['Self'] is usable before that
+     * buf is bytes or a read-only mmap
+        - it is closed once every member list is built
+    '''
+    def __init__(self, buf):
+        self.buf = buf
+        indexOffset, indexSize = SNAPSHOT_FOOTER.unpack_from(
+            buf, len(buf) - SNAPSHOT_FOOTER.size)
+        self.index = self.read_section((indexOffset, indexSize))
+        self.sectionDict = self.index.pop('sections')
+        self.memberSectionList = self.index.pop('memberSections')
+        self.storageDict = self.index.pop('storage')
+        self.pendingDict = {} # id of LazyContactList -> weak ref to it
+        self.lock = Lock()
+    def read_section(self, section):
+        offset, size = section
+        return pickle.loads(self.buf[offset:offset + size])
+    def read(self, name):
+        return self.read_section(self.sectionDict[name])
+    def restore(self, storage, lazy=False):
+        core = storage.memberList.core
+        coreRef = ref(core)
+        j = self.storageDict
+        storage.userName = j.get('userName', None)
+        storage.nickName = j.get('nickName', None)
+        storage.lastInputUserName = j.get('lastInputUserName', None)
+        del storage.memberList[:]
+        list.extend(storage.memberList,
+            build_contacts(User, self.read('friends'), {'_core': coreRef}))
+        for friend in storage.memberList:
+            friend.verifyDict = {}
+        del storage.mpList[:]
+        list.extend(storage.mpList, build_contacts(MassivePlatform,
+            self.read('mps'), {'_core': coreRef}))
+        del storage.chatroomList[:]
+        keySetList, rowList = self.read('chatrooms')
+        for (keySetIndex, values), chatroomSelf, memberSection in zip(
+                rowList, self.read('selfs'), self.memberSectionList):
+            chatroom = Chatroom(zip(keySetList[keySetIndex], values))
+            chatroom.core = core
+            if chatroomSelf is not None:
+                isMember, selfDict = chatroomSelf
+                chatroom['Self'] = (ChatroomMember if isMember else User)(selfDict)
+                chatroom['Self'].core = core
+                chatroom['Self'].chatroom = chatroom
+            if lazy:
+                memberList = LazyContactList()
+                memberList.set_default_value(chatroom.memberList.contactInitFn,
+                    ChatroomMember)
+                memberList.core = core
+                memberList.pending = (self, ref(chatroom), memberSection,
+                    chatroomSelf)
+                chatroom['MemberList'] = memberList
+                self.pendingDict[id(memberList)] = ref(memberList,
+                    lambda r, i=id(memberList): self.pendingDict.pop(i, None))
+            else:
+                self.restore_members(chatroom, chatroom['MemberList'],
+                    memberSection, chatroomSelf)
+            list.append(storage.chatroomList, chatroom)
+        if not self.pendingDict:
+            self.close()
+    def restore_members(self, chatroom, memberList, memberSection, chatroomSelf):
+        members = build_contacts(ChatroomMember,
+            self.read_section(memberSection), {
+                '_core': chatroom._core,
+                '_chatroom': ref(chatroom),
+                '_chatroomUserName': chatroom.get('UserName', ''), })
+        # list methods are used directly, a LazyContactList would
+        # otherwise try to hydrate itself again
+        list.extend(memberList, members)
+        if chatroomSelf is not None and chatroomSelf[0]:
+            # Self was one of the members, keep them the same object
+            for member in members:
+                if member['UserName'] == chatroomSelf[1].get('UserName'):
+                    chatroom['Self'] = member
+                    break
+    def hydrate(self, memberList):
+        with self.lock:
+            if memberList.pending is None:
+                return
+            chatroom = memberList.pending[1]()
+            if chatroom is not None:
+                self.restore_members(chatroom, memberList,
+                    *memberList.pending[2:])
+            memberList.pending = None
+            self.pendingDict.pop(id(memberList), None)
+            if not self.pendingDict:
+                self.close()
+    def release(self):
+        ''' build every pending member list and close buf '''
+        for memberListRef in list(self.pendingDict.values()):
+            memberList = memberListRef()
+            if memberList is not None:
+                self.hydrate(memberList)
+        self.close()
+    def close(self):
+        if isinstance(self.buf, mmap.mmap) and not self.buf.closed:
+            self.buf.close()
+
+class LazyContactList(ContactList):
+    ''' member list of a chatroom restored lazily from a StorageSnapshot
+        members are built before the list is used in any way '''
+    pending = None
+    def hydrate(self):
+        if self.pending is not None:
+            self.pending[0].hydrate(self)
+
+def hydrate_first(name):
+    method = getattr(ContactList, name)
+    def _hydrate_first(self, *args, **kwargs):
+        self.hydrate()
+        return method(self, *args, **kwargs)
+    _hydrate_first.__name__ = name
+    return _hydrate_first
+
+for name in ('__iter__', '__reversed__', '__len__', '__contains__',
+        '__getitem__', '__setitem__', '__delitem__', '__eq__', '__ne__',
+        '__add__', '__iadd__', '__mul__', '__deepcopy__', 'append', 'extend',
+        'insert', 'remove', 'pop', 'clear', 'index', 'count', 'sort',
+        'reverse', 'copy'):
+    setattr(LazyContactList, name, hydrate_first(name))
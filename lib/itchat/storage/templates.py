@@ -1,4 +1,4 @@
-import logging, copy, pickle
+import logging, copy, pickle, asyncio
 from weakref import ref
 
 from ..returnvalues import ReturnValue
@@ -66,6 +66,8 @@ class ContactList(list):
             self.__str__())
 
 class AbstractUserDict(AttributeDict):
+    ''' wrappers return whatever core returns: with async components loaded
+        core methods are coroutines, so the results must be awaited '''
     def __init__(self, *args, **kwargs):
         super(AbstractUserDict, self).__init__(*args, **kwargs)
     @property
@@ -147,6 +149,13 @@ class User(AbstractUserDict):
         self.__setstate__(None)
     def update(self):
         r = self.core.update_friend(self.userName)
+        if asyncio.iscoroutine(r):
+            return self._async_update(r)
+        if r:
+            update_info_dict(self, r)
+        return r
+    async def _async_update(self, coro):
+        r = await coro
         if r:
             update_info_dict(self, r)
         return r
@@ -198,6 +207,14 @@ class Chatroom(AbstractUserDict):
             member.core = value
     def update(self, detailedMember=False):
         r = self.core.update_chatroom(self.userName, detailedMember)
+        if asyncio.iscoroutine(r):
+            return self._async_update(r)
+        if r:
+            update_info_dict(self, r)
+            self['MemberList'] = r['MemberList']
+        return r
+    async def _async_update(self, coro):
+        r = await coro
         if r:
             update_info_dict(self, r)
             self['MemberList'] = r['MemberList']
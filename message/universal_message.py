@@ -1,5 +1,20 @@
+import json
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 发往后端的 raw_message 字段。OriContent、RecommendInfo、AppInfo 等原始字段不发送；
+# Media 是 MediaStore 保存媒体文件后加入的文件引用
+WIRE_RAW_FIELDS = ('MsgId', 'NewMsgId', 'MsgType', 'Type', 'FromUserName',
+                   'ToUserName', 'CreateTime', 'Content', 'Text', 'FileName',
+                   'FileSize', 'Url', 'AppMsgType', 'MediaId', 'ImgHeight',
+                   'ImgWidth', 'VoiceLength', 'PlayLength', 'ActualUserName',
+                   'ActualNickName', 'IsAt', 'IsGroup', 'Media')
+WIRE_USER_FIELDS = ('UserName', 'NickName', 'RemarkName')
 
 
 class UniversalMessageWrapper(BaseModel):
@@ -30,6 +45,107 @@ class UniversalMessageWrapper(BaseModel):
         }
 
 
+def normalize_raw_message(msg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把 itchat 消息转换为可以序列化的普通字典。
+
+    下载函数无法序列化，会被丢弃；User 只保留基本信息，避免带上整个群成员列表。
+
+    :param msg: itchat 消息对象。
+    :return: 普通字典。
+    """
+    data = {}
+    for key, value in msg.items():
+        if callable(value):
+            continue
+        if key == 'User':
+            value = {
+                k: value.get(k)
+                for k in ('UserName', 'NickName', 'RemarkName')
+            }
+        elif isinstance(value, dict):
+            value = dict(value)
+        data[key] = value
+    return data
+
+
+def message_to_dict(message: UniversalMessageWrapper) -> Dict[str, Any]:
+    """
+    把 UniversalMessageWrapper 转换为普通字典，raw_message 经过 normalize_raw_message 处理。
+
+    :param message: 封装后的消息。
+    :return: 可以序列化的字典。
+    """
+    return {
+        'raw_message': normalize_raw_message(message.raw_message),
+        'source': message.source,
+        'app': message.app,
+        'receiver_id': message.receiver_id,
+        'sender_id': message.sender_id,
+        'group_flag': message.group_flag,
+    }
+
+
+def message_to_wire_dict(message: UniversalMessageWrapper) -> Dict[str, Any]:
+    """
+    生成发往后端的消息字典，结构与 message_to_dict 相同，但 raw_message 只保留
+    WIRE_RAW_FIELDS 中的字段。
+
+    直接从原始消息中取值，不经过 model_dump：群消息的 User 是整个群对象，带有完整的
+    成员列表，这里只取 WIRE_USER_FIELDS 和自己的群昵称。下载函数等不能序列化的值会被丢弃。
+
+    :param message: 封装后的消息。
+    :return: 可以序列化的字典。
+    """
+    raw_message = message.raw_message
+    raw = {}
+    for key in WIRE_RAW_FIELDS:
+        value = raw_message.get(key)
+        if value is not None and not callable(value):
+            raw[key] = value
+    user = raw_message.get('User')
+    if user:
+        raw['User'] = {key: user.get(key) for key in WIRE_USER_FIELDS}
+        chatroom_self = user.get('Self')
+        if chatroom_self:
+            raw['User']['Self'] = {
+                'DisplayName': chatroom_self.get('DisplayName')
+            }
+    return {
+        'raw_message': raw,
+        'source': message.source,
+        'app': message.app,
+        'receiver_id': message.receiver_id,
+        'sender_id': message.sender_id,
+        'group_flag': message.group_flag,
+    }
+
+
+def dumps_wire(obj: Any) -> bytes:
+    """
+    把对象编码为 UTF-8 JSON，安装了 orjson 时使用 orjson。
+
+    :param obj: 要编码的对象。
+    :return: JSON 字节串。
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj,
+                      ensure_ascii=False,
+                      separators=(',', ':'),
+                      default=str).encode('utf-8')
+
+
+def message_to_wire(message: UniversalMessageWrapper) -> bytes:
+    """
+    把消息编码为发往后端的 JSON。
+
+    :param message: 封装后的消息。
+    :return: JSON 字节串。
+    """
+    return dumps_wire(message_to_wire_dict(message))
+
+
 def main():
     example_message = UniversalMessageWrapper(
         raw_message={
@@ -27,17 +27,21 @@ class WechatMessage(ChatMessage):
         actual_sender_nickname (str): 实际发送者的昵称，仅在群聊中使用，表示消息的实际发送者昵称。
         self_display_name (str): 用户在群聊中的展示名称，如果设置了群昵称，则为群昵称。
         is_at (bool): 标识用户在消息中是否被@提及，仅在群聊中适用。
-        prepare_fn (function): 准备函数，用于准备消息内容，例如下载媒体文件。
+        prepare_fn (function): 准备函数，用于准备消息内容，例如下载媒体文件。与 ChatMessage 的
+            prepare_function 相同，通过 prepare() 调用时只会下载一次。
+        core (Core): 接收该消息的itchat账号实例。
     """
 
-    def __init__(self, itchat_msg, is_group=False):
+    def __init__(self, itchat_msg, is_group=False, core=None):
         """
         初始化WechatMessage实例。
 
         :param itchat_msg: 原始的itchat消息对象。
         :param is_group: 指示消息是否来自群聊。
+        :param core: 接收该消息的itchat账号实例，默认为 itchat.instance。
         """
         super().__init__(itchat_msg)
+        self.core = core or itchat.instance
         self.message_id = itchat_msg["MsgId"]
         self.create_time = itchat_msg["CreateTime"]
         self.is_group = is_group
@@ -54,8 +58,8 @@ class WechatMessage(ChatMessage):
         self.content, self.message_type, self.prepare_fn = None, None, None
 
         if msg_type in [TEXT, VOICE, PICTURE, ATTACHMENT]:
-            self.content = TmpDir().path() + self.raw_message["FileName"]
-            self.prepare_fn = lambda: self.raw_message.download(self.content)
+            self.content = TmpDir().new_file(self.raw_message["FileName"])
+            self.prepare_function = self.prepare_fn = self._download_media
             self.message_type = self._map_type_to_context(msg_type)
         elif msg_type == NOTE:
             self._process_note_message()
@@ -67,6 +71,18 @@ class WechatMessage(ChatMessage):
                 f"Unsupported message type: Type:{msg_type}, MsgType:{self.raw_message['MsgType']}"
             )
 
+    def _download_media(self):
+        """
+        把媒体文件下载到 content 指向的临时文件。
+
+        下载后释放 new_file 登记的引用，文件交给调用方使用，在 TmpDir 的 ttl 内
+        未再使用时被清理。
+        """
+        try:
+            self.raw_message.download(self.content)
+        finally:
+            TmpDir().release(self.content)
+
     def _map_type_to_context(self, msg_type):
         """
         将微信消息类型映射到上下文类型。
@@ -127,8 +143,8 @@ class WechatMessage(ChatMessage):
         """
         设置与消息相关的用户信息。
         """
-        user_id = itchat.instance.storageClass.userName
-        nickname = itchat.instance.storageClass.nickName
+        user_id = self.core.storageClass.userName
+        nickname = self.core.storageClass.nickName
 
         self._assign_user_nicknames(user_id, nickname)
         self._assign_other_user_info(user_id)
@@ -0,0 +1,264 @@
+import json
+from typing import Any, Dict, Optional, Union
+
+from pydantic import BaseModel
+
+from lib.itchat.content import (ATTACHMENT, PICTURE, SHARING, TEXT, VIDEO,
+                                VOICE)
+from message.chat_message import ChatMessage
+from message.meta_message import MetaMessageType
+from message.universal_message import UniversalMessageWrapper
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 字段编号变化时递增，后端据此判断能否解析
+WIRE_SCHEMA_VERSION = 1
+VERSION_FIELD_ID = 0
+
+ITCHAT_TYPE_MAP = {
+    TEXT: MetaMessageType.TEXT,
+    VOICE: MetaMessageType.VOICE,
+    PICTURE: MetaMessageType.IMAGE,
+    ATTACHMENT: MetaMessageType.FILE,
+    VIDEO: MetaMessageType.VIDEO,
+    SHARING: MetaMessageType.SHARING,
+}
+
+
+class WireMessage(BaseModel):
+    """
+    发往后端的精简消息结构，替代携带完整微信原始数据的 raw_message。
+
+    编码时每个字段使用 WIRE_FIELD_IDS 中固定的编号作为键，值为 None 或 False 的字段不写入，
+    新增字段只能使用新的编号，已有编号不能改变含义。
+
+    属性:
+        message_id (str): 消息ID。
+        create_time (int): 消息创建时间（秒级时间戳）。
+        message_type (int): MetaMessageType 的值，无法对应时为 None。
+        raw_type (str): itchat 的消息类型，例如 Text、Note。
+        content (str): 文本内容；媒体消息为文件名或文件路径，分享为链接。
+        is_group (bool): 是否为群聊消息。
+        is_at (bool): 群聊中是否@了自己。
+        actual_sender_id (str): 群聊中实际发送者的ID。
+        self_display_name (str): 自己在群里的昵称。
+        media_sha256 (str): 媒体文件内容的 SHA-256，见 utils.media_store。
+        media_path (str): 媒体文件的本地路径。
+        media_url (str): 媒体文件的访问地址。
+    """
+    message_id: Optional[str] = None
+    create_time: Optional[int] = None
+    message_type: Optional[int] = None
+    raw_type: Optional[str] = None
+    content: Optional[str] = None
+    sender_id: Optional[str] = None
+    sender_nickname: Optional[str] = None
+    receiver_id: Optional[str] = None
+    receiver_nickname: Optional[str] = None
+    other_user_id: Optional[str] = None
+    other_user_nickname: Optional[str] = None
+    is_group: bool = False
+    is_at: bool = False
+    actual_sender_id: Optional[str] = None
+    actual_sender_nickname: Optional[str] = None
+    self_display_name: Optional[str] = None
+    source: Optional[str] = None
+    app: Optional[str] = None
+    file_name: Optional[str] = None
+    file_size: Optional[int] = None
+    url: Optional[str] = None
+    media_sha256: Optional[str] = None
+    media_path: Optional[str] = None
+    media_url: Optional[str] = None
+
+    @classmethod
+    def from_wrapper(cls, message: UniversalMessageWrapper) -> 'WireMessage':
+        """
+        从 UniversalMessageWrapper 中的 itchat 原始消息生成，不需要登录的账号实例。
+
+        :param message: 封装后的消息。
+        """
+        raw = message.raw_message
+        raw_type = raw.get('Type')
+        meta_type = ITCHAT_TYPE_MAP.get(raw_type)
+        text = raw.get('Text')
+        if raw_type in (PICTURE, VOICE, ATTACHMENT, VIDEO):
+            content = raw.get('FileName')
+        elif raw_type == SHARING:
+            content = raw.get('Url')
+        else:
+            content = text if isinstance(text, str) else raw.get('Content')
+        user = raw.get('User') or {}
+        chatroom_self = user.get('Self') or {}
+        file_size = raw.get('FileSize')
+        media = raw.get('Media') or {}
+        return cls(message_id=_str(raw.get('MsgId')),
+                   create_time=raw.get('CreateTime'),
+                   message_type=meta_type.value if meta_type else None,
+                   raw_type=raw_type,
+                   content=content,
+                   sender_id=message.sender_id or raw.get('FromUserName'),
+                   receiver_id=message.receiver_id,
+                   other_user_id=user.get('UserName'),
+                   other_user_nickname=user.get('NickName'),
+                   is_group=bool(message.group_flag),
+                   is_at=bool(raw.get('IsAt')),
+                   actual_sender_id=raw.get('ActualUserName'),
+                   actual_sender_nickname=raw.get('ActualNickName'),
+                   self_display_name=chatroom_self.get('DisplayName'),
+                   source=message.source,
+                   app=message.app,
+                   file_name=raw.get('FileName') or None,
+                   file_size=int(file_size) if file_size else None,
+                   url=raw.get('Url') or None,
+                   media_sha256=media.get('sha256'),
+                   media_path=media.get('path'),
+                   media_url=media.get('url'))
+
+    @classmethod
+    def from_chat_message(cls,
+                          message: ChatMessage,
+                          source: str = 'itchat',
+                          app: str = 'wechat') -> 'WireMessage':
+        """
+        从 ChatMessage（包括 WechatMessage）生成。
+
+        WechatMessage 的部分属性名与 ChatMessage 不同，两种名称都会读取。
+
+        :param message: 聊天消息。
+        :param source: 消息来源。
+        :param app: 应用名。
+        """
+
+        def attr(*names):
+            for name in names:
+                value = getattr(message, name, None)
+                if value is not None:
+                    return value
+            return None
+
+        meta_type = message.message_type
+        raw = message.raw_message or {}
+        return cls(message_id=_str(message.message_id),
+                   create_time=attr('create_time', 'creation_time'),
+                   message_type=meta_type.value if isinstance(
+                       meta_type, MetaMessageType) else None,
+                   raw_type=raw.get('Type'),
+                   content=attr('content', 'message_content'),
+                   sender_id=message.sender_id,
+                   sender_nickname=message.sender_nickname,
+                   receiver_id=message.receiver_id,
+                   receiver_nickname=message.receiver_nickname,
+                   other_user_id=attr('other_user_id', 'other_party_id'),
+                   other_user_nickname=attr('other_user_nickname',
+                                            'other_party_nickname'),
+                   is_group=bool(attr('is_group', 'group_flag')),
+                   is_at=bool(attr('is_at', 'mentioned')),
+                   actual_sender_id=message.actual_sender_id,
+                   actual_sender_nickname=message.actual_sender_nickname,
+                   self_display_name=attr('self_display_name',
+                                          'display_name'),
+                   source=source,
+                   app=app,
+                   file_name=raw.get('FileName') or None,
+                   url=raw.get('Url') or None)
+
+
+# 字段编号一经发布不能修改，0 保留给结构版本号
+WIRE_FIELD_IDS = {
+    'message_id': 1,
+    'create_time': 2,
+    'message_type': 3,
+    'raw_type': 4,
+    'content': 5,
+    'sender_id': 6,
+    'sender_nickname': 7,
+    'receiver_id': 8,
+    'receiver_nickname': 9,
+    'other_user_id': 10,
+    'other_user_nickname': 11,
+    'is_group': 12,
+    'is_at': 13,
+    'actual_sender_id': 14,
+    'actual_sender_nickname': 15,
+    'self_display_name': 16,
+    'source': 17,
+    'app': 18,
+    'file_name': 19,
+    'file_size': 20,
+    'url': 21,
+    'media_sha256': 22,
+    'media_path': 23,
+    'media_url': 24,
+}
+WIRE_FIELD_NAMES = {i: name for name, i in WIRE_FIELD_IDS.items()}
+
+
+def encode_wire(message: WireMessage, binary: bool = False) -> Dict[Any, Any]:
+    """
+    把消息编码为以字段编号为键的字典。
+
+    :param message: 精简消息。
+    :param binary: 为 True 时键为整数（MessagePack），否则为字符串（JSON）。
+    :return: 编码后的字典，键 0 为结构版本号。
+    """
+    key = int if binary else str
+    data = {key(VERSION_FIELD_ID): WIRE_SCHEMA_VERSION}
+    for name, value in message:
+        if value is not None and value is not False:
+            data[key(WIRE_FIELD_IDS[name])] = value
+    return data
+
+
+def decode_wire(data: Dict[Union[int, str], Any]) -> WireMessage:
+    """
+    解码 encode_wire 的结果。不认识的字段编号会被忽略。
+
+    :param data: 以字段编号为键的字典。
+    :raises ValueError: 结构版本比当前版本新。
+    """
+    fields = {int(k): v for k, v in data.items()}
+    version = fields.pop(VERSION_FIELD_ID, None)
+    if version is None or version > WIRE_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported wire schema version: {version}")
+    return WireMessage(**{
+        WIRE_FIELD_NAMES[i]: v
+        for i, v in fields.items() if i in WIRE_FIELD_NAMES
+    })
+
+
+def pack_msgpack(obj: Any) -> bytes:
+    """
+    用 MessagePack 编码，需要安装 msgpack。
+    """
+    if msgpack is None:
+        raise ImportError('MessagePack wire format requires msgpack')
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpack_msgpack(data: bytes) -> Any:
+    if msgpack is None:
+        raise ImportError('MessagePack wire format requires msgpack')
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def main():
+    example = WireMessage(message_id='1',
+                          create_time=1700000000,
+                          message_type=MetaMessageType.TEXT.value,
+                          raw_type=TEXT,
+                          content='Hello!',
+                          sender_id='sender456',
+                          receiver_id='receiver123')
+    print(json.dumps(encode_wire(example), ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
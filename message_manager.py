@@ -1,32 +1,96 @@
 import asyncio
+import heapq
+import itertools
 import json
+import os
+import random
 import threading
 import queue
-import requests
 import time
-from message.universal_message import UniversalMessageWrapper
+from concurrent.futures import wait as wait_futures
+from message.universal_message import UniversalMessageWrapper, message_to_dict
 
 from utils.singleton import singleton
 from utils.log_setup import log
+from utils.transport import HttpSseTransport, SendError
+
+# 放入队列以通知消费线程退出
+STOP_SIGNAL = object()
 
 
 @singleton
 class MessageManager:
 
-    def __init__(self, base_url, process_fn):
+    def __init__(self, base_url, process_fn, transport=None):
         self.base_url = base_url
         self.process_fn = process_fn
         self.recv_queue = queue.Queue()
         self.send_queue = queue.Queue()
-        self.message_post_path = '/send'
-        self.sse_path = '/events'
+        # 与后端通信的方式，默认通过 HTTP 发送、SSE 接收，见 utils.transport
+        self.transport = transport or HttpSseTransport(base_url)
+        # 发送失败后按 retry_interval * 2^(n-1) 退避（带随机抖动），最长 retry_delay 秒；
+        # 重试 max_retry 次仍失败的消息写入 dead_letter_path，可用 replay_dead_letters 重发
         self.max_retry = 5
         self.retry_delay = 300  # 5 minutes
+        self.retry_interval = 1  # 发送或连接失败后的等待秒数
+        self.dead_letter_path = 'dead_letters.jsonl'
+        self.retry_heap = []
+        self.retry_seq = itertools.count()
+        self.retry_condition = threading.Condition()
+        self.dead_letter_lock = threading.Lock()
+        self.max_in_flight = 32  # 同时发往后端的最大请求数
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.loop = None
+        self.in_flight = set()
+        self.in_flight_slots = None
 
     def start(self):
-        threading.Thread(target=self.listen_sse).start()
-        threading.Thread(target=self.process_recv_queue).start()
-        threading.Thread(target=self.process_send_queue).start()
+        self.stop_event.clear()
+        # 所有发送共用一个常驻事件循环，传输方式在其中复用连接
+        self.loop = asyncio.new_event_loop()
+        self.in_flight_slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.threads = [
+            threading.Thread(target=self.loop.run_forever,
+                             name='message-loop',
+                             daemon=True),
+            threading.Thread(target=self.process_retry_heap,
+                             name='message-retry'),
+            threading.Thread(target=self.process_recv_queue,
+                             name='message-recv'),
+            threading.Thread(target=self.process_send_queue,
+                             name='message-send'),
+        ]
+        self.threads[0].start()
+        # 先启动传输方式，再开始发送
+        self.transport.start(self)
+        for thread in self.threads[1:]:
+            thread.start()
+
+    def stop(self, timeout=10):
+        """
+        通知所有线程退出。队列中已有的消息会先处理完。
+
+        :param timeout: 等待每个线程退出的最长秒数。
+        """
+        # 在锁内设置，保证重试线程不会在停止信号之后再放入消息
+        with self.retry_condition:
+            self.stop_event.set()
+            self.retry_condition.notify_all()
+        self.send_queue.put(STOP_SIGNAL)
+        self.recv_queue.put(STOP_SIGNAL)
+        for thread in self.threads:
+            if not thread.daemon and thread is not threading.current_thread():
+                thread.join(timeout)
+        # 发送线程退出前已等待在途请求完成，此时可以关闭传输方式和事件循环
+        if self.loop is not None and self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self.transport.close(),
+                                                 self.loop).result(timeout)
+            except Exception as e:
+                log.error(f"Failed to close transport: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.threads[0].join(timeout)
 
     def send_message(self, message):
         self._add_message_to_send_queue(message)
@@ -39,72 +103,222 @@ class MessageManager:
             'retry_count': 0
         })
 
-    async def async_send_message(self, message_data):
-        message_json = json.dumps(message_data['message'].model_dump())
-        log.info('🚀🚀🚀🚀🚀🚀消息管理器发送消息到后端')
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(self.base_url + self.message_post_path,
-                                 data=message_json,
-                                 headers=headers)
-        log.debug(f'🚀🚀🚀🚀🚀🚀请求回复：{response}')
-        if response.status_code == 200:
-            # 如果请求成功，则将响应的内容放入接收队列
-            res = response.json()
-            data = res.get('data', None)
-            if data is not None:
-                self.recv_queue.put(data)
-
-            message = res.get('message', None)
-            if message is not None:
-                log.info(message)
-        else:
-            # 如果请求失败，则重新加入发送队列末尾等待再次发送
-            self.send_queue.put(message_data)
-
-    def listen_sse(self):
-        while True:
+    async def async_send_batch(self, batch):
+        log.info(f'🚀🚀🚀🚀🚀🚀消息管理器发送{len(batch)}条消息到后端')
+        try:
+            results = await self.transport.send(
+                [message_data['message'] for message_data in batch])
+        except SendError as e:
+            # 如果请求失败，按退避时间重新发送
+            for message_data in batch:
+                self.schedule_retry(message_data, str(e), e.status)
+            return
+        except Exception as e:
+            # 编码失败或传输方式本身出错，消息同样重试，超过次数后写入死信文件
+            log.exception(f"Transport failed to send {len(batch)} messages")
+            for message_data in batch:
+                self.schedule_retry(message_data, f"{type(e).__name__}: {e}")
+            return
+        if not isinstance(results, list):
+            results = []
+        if len(results) != len(batch):
+            log.warning(f"Batch of {len(batch)} messages got "
+                        f"{len(results)} responses")
+        for i, message_data in enumerate(batch):
+            res = results[i] if i < len(results) else None
+            if not isinstance(res, dict):
+                # 没有对应响应的消息视为发送失败
+                self.schedule_retry(message_data,
+                                    f"Missing or invalid response: {res!r}")
+                continue
             try:
-                log.debug('listening...')
-                headers = {'Accept': 'text/event-stream'}
-                with requests.get(self.base_url + self.sse_path,
-                                  stream=True,
-                                  headers=headers,
-                                  timeout=80) as r:
-                    for chunk in r.iter_content(chunk_size=102400):
-                        log.debug(chunk)
-                        # 首先，将字节数据解码为字符串
-                        string_data = chunk.decode('utf-8')
-
-                        # 然后，使用json.loads将字符串转换为字典
-                        json_data = json.loads(string_data)
-                        data = json_data.get('data', None)
-                        log.debug(data)
-                        if data is not None:
-                            self.recv_queue.put(data)
-            except requests.exceptions.RequestException as e:
-                # 处理网络请求相关的异常
-                log.error(f"Network error occurred: {e}")
+                self._handle_response(res)
             except Exception as e:
-                # 处理其他可能的异常
-                log.error(f"An error occurred: {e}")
+                log.error(f"Failed to handle backend response: {e}")
+
+    def schedule_retry(self, message_data, error, status=None):
+        """
+        安排发送失败的消息重试。超过 max_retry 次、后端明确拒绝（4xx，408 和 429 除外）
+        或正在停止时，消息写入死信文件。
+
+        :param message_data: 发送队列中的消息。
+        :param error: 失败原因。
+        :param status: HTTP 状态码，网络错误时为 None。
+        """
+        message_data['retry_count'] += 1
+        permanent = status is not None and 400 <= status < 500 \
+            and status not in (408, 429)
+        if permanent or message_data['retry_count'] > self.max_retry:
+            self.dead_letter(message_data, error)
+            return
+        delay = min(self.retry_delay,
+                    self.retry_interval * 2**(message_data['retry_count'] - 1))
+        # 抖动避免大量消息在同一时刻重试
+        delay *= random.uniform(0.5, 1)
+        log.warning(f"Failed to send message ({error}), retry "
+                    f"{message_data['retry_count']}/{self.max_retry} "
+                    f"in {delay:.1f}s")
+        with self.retry_condition:
+            if not self.stop_event.is_set():
+                heapq.heappush(self.retry_heap,
+                               (time.monotonic() + delay, next(self.retry_seq),
+                                message_data))
+                self.retry_condition.notify()
+                return
+        self.dead_letter(message_data, error)
+
+    def process_retry_heap(self):
+        """
+        到期的重试消息重新放入发送队列。停止时尚未到期的消息写入死信文件。
+        """
+        with self.retry_condition:
+            while not self.stop_event.is_set():
+                if not self.retry_heap:
+                    self.retry_condition.wait()
+                    continue
+                wait_time = self.retry_heap[0][0] - time.monotonic()
+                if wait_time > 0:
+                    self.retry_condition.wait(wait_time)
+                    continue
+                _, _, message_data = heapq.heappop(self.retry_heap)
+                self.send_queue.put(message_data)
+            pending, self.retry_heap = self.retry_heap, []
+        for _, _, message_data in sorted(pending):
+            self.dead_letter(message_data, 'stopped before retry')
+
+    def dead_letter(self, message_data, error):
+        """
+        把无法发送的消息追加到死信文件，每行一条 JSON。
+        """
+        log.error(f"Message dropped to dead letter after "
+                  f"{message_data['retry_count']} attempts: {error}")
+        record = {
+            'message': message_to_dict(message_data['message']),
+            'retry_count': message_data['retry_count'],
+            'failed_at': time.time(),
+            'error': error
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self.dead_letter_lock:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def replay_dead_letters(self, path=None):
+        """
+        把死信文件中的消息重新放入发送队列，重试次数从零开始。
+
+        文件先被改名再读取，重放期间再次失败的消息会写入新的死信文件。
+
+        :param path: 死信文件路径，默认为 dead_letter_path。
+        :return: 重新发送的消息数。
+        """
+        path = path or self.dead_letter_path
+        replay_path = path + '.replay'
+        with self.dead_letter_lock:
+            if not os.path.exists(path):
+                return 0
+            os.replace(path, replay_path)
+        count = 0
+        with open(replay_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 写入时进程退出，最后一行可能不完整
+                    continue
+                self.send_message(UniversalMessageWrapper(**record['message']))
+                count += 1
+        os.remove(replay_path)
+        log.info(f"Replayed {count} dead letters from {path}")
+        return count
+
+    def _handle_response(self, res):
+        # 如果请求成功，则将响应的内容放入接收队列
+        data = res.get('data', None)
+        if data is not None:
+            self.recv_queue.put(data)
+
+        message = res.get('message', None)
+        if message is not None:
+            log.info(message)
+
+    def status(self):
+        """
+        返回消息管理器的运行指标。
+
+        - transport: 传输方式的连接状态和指标。
+        - send_backlog、recv_backlog: 发送队列和接收队列中的消息数。
+        - in_flight: 正在发送的请求数。
+        - retry_pending: 等待重试的消息数。
+
+        :return: 指标字典。
+        """
+        return {
+            'transport': self.transport.status(),
+            'send_backlog': self.send_queue.qsize(),
+            'recv_backlog': self.recv_queue.qsize(),
+            'in_flight': len(self.in_flight),
+            'retry_pending': len(self.retry_heap)
+        }
 
     def process_send_queue(self):
-        while True:
-            if not self.send_queue.empty():
-                message_data = self.send_queue.get()
-                log.info('🚀🚀🚀🚀🚀🚀取到接收消息队列里的消息开始处理')
-                current_time = time.time()
-                if current_time - message_data['timestamp'] > self.retry_delay:
-                    message_data['retry_count'] += 1
-                    message_data['timestamp'] = current_time
-                asyncio.run(self.async_send_message(message_data))
+        running = True
+        while running:
+            # 阻塞等待，空闲时不占用 CPU
+            message_data = self.send_queue.get()
+            if message_data is STOP_SIGNAL:
+                break
+            log.info('🚀🚀🚀🚀🚀🚀取到接收消息队列里的消息开始处理')
+            batch = [message_data]
+            if self.transport.max_batch > 1:
+                running = self._fill_batch(batch)
+            # 在途请求达到上限时在这里等待，未发送的消息留在队列中
+            self.in_flight_slots.acquire()
+            future = asyncio.run_coroutine_threadsafe(
+                self.async_send_batch(batch), self.loop)
+            self.in_flight.add(future)
+            future.add_done_callback(self._on_send_done)
+        wait_futures(list(self.in_flight))
+
+    def _fill_batch(self, batch):
+        """
+        在传输方式的 batch_window 秒内继续从发送队列收集消息，直到达到 max_batch 条。
+
+        :param batch: 已取到的消息，收集到的消息追加在后面。
+        :return: 收到停止信号时返回 False。
+        """
+        deadline = time.monotonic() + self.transport.batch_window
+        while len(batch) < self.transport.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    message_data = self.send_queue.get(timeout=remaining)
+                else:
+                    # 窗口已过，只取队列中已有的消息
+                    message_data = self.send_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message_data is STOP_SIGNAL:
+                return False
+            batch.append(message_data)
+        return True
+
+    def _on_send_done(self, future):
+        self.in_flight.discard(future)
+        self.in_flight_slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            log.error(f"Failed to send message to backend: {future.exception()}")
 
     def process_recv_queue(self):
         while True:
-            if not self.recv_queue.empty():
-                message = self.recv_queue.get()
-                log.info('🚀🚀🚀🚀🚀🚀取到发送队列里的消息开始处理')
+            message = self.recv_queue.get()
+            if message is STOP_SIGNAL:
+                break
+            log.info('🚀🚀🚀🚀🚀🚀取到发送队列里的消息开始处理')
+            try:
                 self.process_fn(message)
+            except Exception as e:
+                log.error(f"Failed to process message from backend: {e}")
 
 
 # 使用示例
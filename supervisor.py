@@ -0,0 +1,263 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import wait
+from typing import Any, Dict, List
+
+from message.universal_message import UniversalMessageWrapper, message_to_dict
+from message_manager import MessageManager
+from utils.log_setup import log
+
+
+def shard_accounts(accounts: List[str], process_count: int) -> List[List[str]]:
+    """
+    把账号按轮询方式分配到各个工作进程。
+
+    :param accounts: 账号名列表。
+    :param process_count: 工作进程数量。
+    :return: 每个工作进程负责的账号列表。
+    """
+    process_count = max(1, min(process_count, len(accounts)))
+    return [accounts[i::process_count] for i in range(process_count)]
+
+
+class PipeMessageSink:
+    """
+    工作进程中的入站消息通道，把规范化后的消息通过管道交给主进程。
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send_message(self, message: UniversalMessageWrapper):
+        data = message_to_dict(message)
+        # Connection.send 不是线程安全的，而回调会在多个分发线程中执行
+        with self.lock:
+            self.conn.send(('message', data))
+
+
+def run_worker(accounts: List[str], conn, status_dir: str):
+    """
+    工作进程入口：登录分配到的账号，把消息交给主进程，并发送主进程转来的回复。
+
+    每个账号都开启热重载，进程重启后通过 load_login_status 恢复登录状态。
+
+    :param accounts: 本进程负责的账号列表。
+    :param conn: 与主进程通信的管道。
+    :param status_dir: 热重载文件所在目录。
+    """
+    import try_wechat_channal
+    from utils.qr_callback import qrCallback
+
+    pool = try_wechat_channal.pool
+    try_wechat_channal.message_sink = PipeMessageSink(conn)
+
+    for account in accounts:
+        core = pool.new_core(account,
+                             os.path.join(status_dir, f"{account}.pkl"))
+        core.receivingRetryCount = 600
+        pool.auto_login(account,
+                        hotReload=True,
+                        enableCmdQR=2,
+                        qrCallback=qrCallback)
+        log.info(f"[Worker {os.getpid()}] account {account} logged in as "
+                 f"{core.storageClass.nickName}")
+
+    def reply_loop():
+        while True:
+            try:
+                kind, message = conn.recv()
+            except (EOFError, OSError):
+                # 主进程已退出
+                os._exit(0)
+            if kind == 'reply':
+                if pool.get_core(message['receiver_id']) is not None:
+                    try_wechat_channal.send_message(message)
+
+    threading.Thread(target=reply_loop, daemon=True).start()
+    pool.run()
+
+
+class Supervisor:
+    """
+    多进程账号管理器。
+
+    账号被分片到多个工作进程中，每个进程运行自己的 CorePool。工作进程通过管道把
+    规范化后的消息交给主进程，由主进程统一交给 MessageManager 发送到后端；后端的回复
+    按接收者路由回对应的工作进程。工作进程崩溃后会自动重启并通过热重载恢复登录。
+
+    属性:
+        accounts (list): 所有账号名。
+        shards (list): 每个工作进程负责的账号列表。
+        workers (dict): 分片序号到 (进程, 管道) 的映射。
+        routes (OrderedDict): 接收者ID到分片序号的映射，只保留最近 max_routes 个接收者。
+    """
+
+    def __init__(self,
+                 accounts: List[str],
+                 base_url: str,
+                 process_count: int = None,
+                 status_dir: str = '.',
+                 restart_delay: float = 5,
+                 max_restart_delay: float = 300,
+                 max_routes: int = 100000):
+        self.accounts = accounts
+        self.base_url = base_url
+        self.shards = shard_accounts(accounts, process_count
+                                     or os.cpu_count() or 1)
+        self.status_dir = status_dir
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = {}
+        self.routes = OrderedDict()
+        self.max_routes = max_routes
+        self.restart_state = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        启动消息管理器和所有工作进程，然后阻塞监控工作进程。
+        """
+        MessageManager(self.base_url, self.send_reply).start()
+        for shard_id in range(len(self.shards)):
+            self._start_worker(shard_id)
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        try:
+            self._monitor_loop()
+        except KeyboardInterrupt:
+            log.info('Supervisor received an ^C and exit.')
+            # 先把队列中已收到的消息发完，再等待工作进程退出
+            MessageManager().stop()
+            for process, _ in self.workers.values():
+                process.join(timeout=10)
+            for shard_id, (process, _) in self.workers.items():
+                if process.is_alive():
+                    log.warning(f"Worker {shard_id} did not exit, terminating")
+                    process.terminate()
+                    process.join()
+
+    def _start_worker(self, shard_id: int):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=run_worker,
+                                       args=(self.shards[shard_id],
+                                             child_conn, self.status_dir),
+                                       name=f"wechat-worker-{shard_id}")
+        process.start()
+        child_conn.close()
+        with self.lock:
+            self.workers[shard_id] = (process, parent_conn)
+        self.restart_state.setdefault(shard_id, {
+            'delay': self.restart_delay
+        })['started_at'] = time.time()
+        log.info(f"Worker {shard_id} started, pid={process.pid}, "
+                 f"accounts={self.shards[shard_id]}")
+
+    def _monitor_loop(self):
+        """
+        检查工作进程是否存活，崩溃的进程按指数退避重启。
+        """
+        while True:
+            time.sleep(1)
+            for shard_id, (process, conn) in list(self.workers.items()):
+                if process.is_alive():
+                    continue
+                state = self.restart_state[shard_id]
+                if 'restart_at' not in state:
+                    if time.time() - state['started_at'] > self.max_restart_delay:
+                        # 运行足够久之后退出视为偶发错误，重置退避时间
+                        state['delay'] = self.restart_delay
+                    log.error(f"Worker {shard_id} exited with code "
+                              f"{process.exitcode}, restart in {state['delay']}s")
+                    conn.close()
+                    state['restart_at'] = time.time() + state['delay']
+                    state['delay'] = min(state['delay'] * 2,
+                                         self.max_restart_delay)
+                elif time.time() >= state['restart_at']:
+                    del state['restart_at']
+                    self._start_worker(shard_id)
+
+    def _read_loop(self):
+        """
+        读取所有工作进程发来的消息并交给 MessageManager。
+        """
+        while True:
+            with self.lock:
+                conn_map = {
+                    conn: shard_id
+                    for shard_id, (_, conn) in self.workers.items()
+                    if not conn.closed
+                }
+            try:
+                ready = wait(list(conn_map), timeout=1)
+            except OSError:
+                # 管道刚被监控线程关闭
+                continue
+            for conn in ready:
+                try:
+                    kind, data = conn.recv()
+                except (EOFError, OSError):
+                    # 进程已退出，由监控线程负责重启
+                    conn.close()
+                    continue
+                if kind == 'message':
+                    self._set_route(data['sender_id'], conn_map[conn])
+                    MessageManager().send_message(
+                        UniversalMessageWrapper(**data))
+
+    def _set_route(self, sender_id: str, shard_id: int):
+        """
+        记录发送者所在的分片，超过 max_routes 时丢弃最久没有发来消息的发送者。
+
+        :param sender_id: 发送者ID。
+        :param shard_id: 分片序号。
+        """
+        with self.lock:
+            self.routes[sender_id] = shard_id
+            self.routes.move_to_end(sender_id)
+            while len(self.routes) > self.max_routes:
+                self.routes.popitem(last=False)
+
+    def send_reply(self, message: Dict[str, Any]):
+        """
+        把后端回复转发给负责该接收者的工作进程。路由未知时发给所有工作进程，
+        由拥有该联系人的进程发送。
+
+        :param message: 后端返回的回复消息。
+        """
+        with self.lock:
+            shard_id = self.routes.get(message['receiver_id'])
+            if shard_id in self.workers:
+                targets = [self.workers[shard_id][1]]
+            else:
+                targets = [conn for _, conn in self.workers.values()]
+        for conn in targets:
+            try:
+                conn.send(('reply', message))
+            except (OSError, ValueError) as e:
+                log.error(f"Failed to pass reply to worker: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程微信账号管理')
+    parser.add_argument('accounts', nargs='+', help='账号名，用于命名热重载文件')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--processes',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='工作进程数量，默认为 CPU 核数')
+    parser.add_argument('--status-dir', default='.', help='热重载文件目录')
+    args = parser.parse_args()
+
+    Supervisor(args.accounts,
+               args.base_url,
+               process_count=args.processes,
+               status_dir=args.status_dir).start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message.universal_message import UniversalMessageWrapper  # noqa: E402
+from message_manager import MessageManager  # noqa: E402
+
+
+def make_message(msg_id, **raw) -> UniversalMessageWrapper:
+    """
+    生成一条测试用的文本消息。
+    """
+    raw.setdefault('Type', 'Text')
+    raw.setdefault('Text', f'message {msg_id}')
+    return UniversalMessageWrapper(raw_message=dict(raw, MsgId=msg_id),
+                                   source='itchat',
+                                   app='wechat',
+                                   receiver_id='tester',
+                                   sender_id='@sender')
+
+
+@pytest.fixture
+def new_manager(tmp_path):
+    """
+    创建独立的 MessageManager（绕过单例），重试间隔很短，死信写入临时目录。
+    测试结束时停止所有创建的实例。
+    """
+    managers = []
+
+    def factory(transport, process_fn=None):
+        manager = MessageManager.__wrapped__('http://127.0.0.1:1',
+                                             process_fn or (lambda m: None),
+                                             transport)
+        manager.retry_interval = 0.01
+        manager.dead_letter_path = str(tmp_path / 'dead_letters.jsonl')
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        if manager.threads:
+            manager.stop(timeout=5)
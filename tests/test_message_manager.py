@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+
+from conftest import make_message
+from utils.transport import MessageTransport, SendError
+
+
+class ScriptedTransport(MessageTransport):
+    """
+    按预设的结果依次应答 send：SendError 或其他异常会被抛出，列表作为响应返回，
+    None 表示按消息生成成功响应。预设用完后一直成功。
+    """
+
+    def __init__(self, script=(), max_batch=1):
+        self.script = list(script)
+        self.max_batch = max_batch
+        self.batch_window = 0.05
+        self.calls = []
+        self.delivered = []
+        self.lock = threading.Lock()
+
+    async def send(self, messages):
+        ids = [m.raw_message['MsgId'] for m in messages]
+        with self.lock:
+            self.calls.append(ids)
+            result = self.script.pop(0) if self.script else None
+        if isinstance(result, Exception):
+            raise result
+        if result is not None:
+            return result
+        with self.lock:
+            self.delivered.extend(ids)
+        return [{'data': {'reply': i}} for i in ids]
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def read_dead_letters(manager):
+    try:
+        with open(manager.dead_letter_path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def test_send_and_receive_reply(new_manager):
+    replies = []
+    transport = ScriptedTransport()
+    manager = new_manager(transport, replies.append)
+    manager.start()
+    for i in range(5):
+        manager.send_message(make_message(i))
+    assert wait_for(lambda: len(replies) == 5)
+    assert sorted(r['reply'] for r in replies) == list(range(5))
+
+
+def test_retry_until_sent(new_manager):
+    replies = []
+    transport = ScriptedTransport([SendError('down'), SendError('down', 503)])
+    manager = new_manager(transport, replies.append)
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: replies == [{'reply': 1}])
+    assert transport.calls == [[1], [1], [1]]
+    assert read_dead_letters(manager) == []
+
+
+def test_unexpected_transport_error_is_retried(new_manager):
+    replies = []
+    transport = ScriptedTransport([RuntimeError('bug in encoder')])
+    manager = new_manager(transport, replies.append)
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: replies == [{'reply': 1}])
+    assert len(transport.calls) == 2
+
+
+def test_dead_letter_after_max_retry(new_manager):
+    transport = ScriptedTransport([SendError('down')] * 10)
+    manager = new_manager(transport)
+    manager.max_retry = 2
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: len(read_dead_letters(manager)) == 1)
+    record = read_dead_letters(manager)[0]
+    assert len(transport.calls) == 3
+    assert record['retry_count'] == 3
+    assert record['error'] == 'down'
+    assert record['message']['raw_message']['MsgId'] == 1
+
+
+def test_client_error_goes_to_dead_letter_at_once(new_manager):
+    transport = ScriptedTransport([SendError('bad request', 400)])
+    manager = new_manager(transport)
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: len(read_dead_letters(manager)) == 1)
+    assert transport.calls == [[1]]
+
+
+def test_throttling_is_retried(new_manager):
+    transport = ScriptedTransport([SendError('slow down', 429)])
+    manager = new_manager(transport)
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: transport.delivered == [1])
+    assert read_dead_letters(manager) == []
+
+
+def test_replay_dead_letters(new_manager):
+    transport = ScriptedTransport([SendError('bad request', 400)] * 2)
+    manager = new_manager(transport)
+    manager.start()
+    manager.send_message(make_message(1))
+    manager.send_message(make_message(2))
+    assert wait_for(lambda: len(read_dead_letters(manager)) == 2)
+    assert manager.replay_dead_letters() == 2
+    assert wait_for(lambda: sorted(transport.delivered) == [1, 2])
+    assert read_dead_letters(manager) == []
+
+
+def test_pending_retries_go_to_dead_letter_on_stop(new_manager):
+    transport = ScriptedTransport([SendError('down')])
+    manager = new_manager(transport)
+    manager.retry_interval = 60
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: manager.status()['retry_pending'] == 1)
+    manager.stop(timeout=5)
+    records = read_dead_letters(manager)
+    assert [r['error'] for r in records] == ['stopped before retry']
+
+
+def test_batch_with_missing_responses_is_retried(new_manager):
+    replies = []
+    # 第一次只返回了第一条消息的响应，第二次响应不是列表
+    transport = ScriptedTransport([[{'data': {'reply': 0}}], {'oops': 1}],
+                                  max_batch=3)
+    manager = new_manager(transport, replies.append)
+    for i in range(3):
+        manager.send_message(make_message(i))
+    manager.start()
+    assert wait_for(lambda: len(replies) == 3)
+    assert sorted(r['reply'] for r in replies) == [0, 1, 2]
+    assert transport.calls[0] == [0, 1, 2]
+    assert read_dead_letters(manager) == []
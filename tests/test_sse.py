@@ -0,0 +1,92 @@
+from utils.sse import ServerSentEvent, SSEDecoder
+
+
+def feed_all(decoder, *chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(decoder.feed(chunk))
+    return events
+
+
+def test_single_event():
+    events = SSEDecoder().feed(b'event: reply\nid: 1\ndata: hello\n\n')
+    assert events == [ServerSentEvent('reply', 'hello', '1')]
+
+
+def test_default_event_type_is_message():
+    assert SSEDecoder().feed(b'data: x\n\n') == [
+        ServerSentEvent('message', 'x', None)
+    ]
+
+
+def test_event_split_across_chunks():
+    decoder = SSEDecoder()
+    events = feed_all(decoder, b'da', b'ta: hel', b'lo\n', b'\n')
+    assert events == [ServerSentEvent('message', 'hello', None)]
+
+
+def test_several_events_in_one_chunk():
+    events = SSEDecoder().feed(b'data: a\n\ndata: b\n\n')
+    assert [event.data for event in events] == ['a', 'b']
+
+
+def test_multiline_data_is_joined_with_newline():
+    events = SSEDecoder().feed(b'data: line1\ndata: line2\n\n')
+    assert events[0].data == 'line1\nline2'
+
+
+def test_crlf_and_cr_line_endings():
+    events = SSEDecoder().feed(b'data: a\r\n\r\ndata: b\r\rdata: c\n\n')
+    assert [event.data for event in events] == ['a', 'b', 'c']
+
+
+def test_crlf_split_between_chunks_is_one_line_break():
+    decoder = SSEDecoder()
+    events = feed_all(decoder, b'data: a\r', b'\ndata: b\r', b'\n\r\n')
+    # \r 和 \n 分在两块时不能被当成两个换行，否则 a 会单独成为一个事件
+    assert events == [ServerSentEvent('message', 'a\nb', None)]
+
+
+def test_comments_are_ignored():
+    events = SSEDecoder().feed(b': keep-alive\n\n: ping\ndata: x\n\n')
+    assert events == [ServerSentEvent('message', 'x', None)]
+
+
+def test_event_without_data_is_not_dispatched():
+    decoder = SSEDecoder()
+    assert decoder.feed(b'event: reply\n\ndata\n\ndata:\n\n') == []
+    # 空事件的类型不会带到下一个事件
+    assert decoder.feed(b'data: x\n\n')[0].event == 'message'
+
+
+def test_field_without_space_after_colon():
+    assert SSEDecoder().feed(b'data:x\n\n')[0].data == 'x'
+
+
+def test_last_event_id_and_retry():
+    decoder = SSEDecoder()
+    decoder.feed(b'id: 7\nretry: 1500\ndata: x\n\n')
+    assert decoder.last_event_id == '7'
+    assert decoder.retry == 1500
+    # 不合法的 retry 和带 NUL 的 id 被忽略
+    events = decoder.feed(b'retry: soon\nid: a\0b\ndata: y\n\n')
+    assert decoder.retry == 1500
+    assert decoder.last_event_id == '7'
+    assert events[0].id is None
+
+
+def test_reset_drops_partial_event_but_keeps_last_event_id():
+    decoder = SSEDecoder(last_event_id='3')
+    decoder.feed(b'id: 4\ndata: partial\n')
+    decoder.reset()
+    assert decoder.feed(b'data: next\n\n') == [
+        ServerSentEvent('message', 'next', None)
+    ]
+    assert decoder.last_event_id == '4'
+
+
+def test_utf8_split_inside_character():
+    data = 'data: 你好\n\n'.encode('utf-8')
+    decoder = SSEDecoder()
+    events = feed_all(decoder, data[:7], data[7:])
+    assert events[0].data == '你好'
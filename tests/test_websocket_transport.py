@@ -0,0 +1,127 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from aiohttp import WSMsgType, web  # noqa: E402
+
+from benchmarks.ws_echo_harness import make_app  # noqa: E402
+from conftest import make_message  # noqa: E402
+from test_message_manager import read_dead_letters, wait_for  # noqa: E402
+from utils.transport import WebSocketTransport  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def serve():
+    """
+    在后台线程的事件循环中运行 aiohttp 应用，返回 WebSocket 地址。
+    """
+    servers = []
+
+    def start(app):
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(app)
+        port = free_port()
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        servers.append((loop, runner, thread))
+        return f'ws://127.0.0.1:{port}/ws'
+
+    yield start
+    for loop, runner, thread in servers:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+
+
+def run_echo(new_manager, url, wire_format, count):
+    received = []
+    transport = WebSocketTransport(url, retry_interval=0.05)
+    transport.wire_format = wire_format
+    manager = new_manager(transport, received.append)
+    manager.max_retry = 100
+    manager.start()
+    for i in range(count):
+        manager.send_message(make_message(i))
+    assert wait_for(lambda: len(received) >= count * 2, timeout=20)
+    acks = {m['ack']['MsgId'] for m in received if 'ack' in m}
+    replies = {m['reply']['MsgId'] for m in received if 'reply' in m}
+    assert acks == replies == {str(i) for i in range(count)}
+    assert read_dead_letters(manager) == []
+    return transport
+
+
+@pytest.mark.parametrize('wire_format', [
+    'json', 'compact',
+    pytest.param('msgpack',
+                 marks=pytest.mark.skipif(
+                     __import__('importlib').util.find_spec('msgpack') is None,
+                     reason='msgpack is not installed'))
+])
+def test_ack_and_reply(serve, new_manager, wire_format):
+    transport = run_echo(new_manager, serve(make_app()), wire_format, 50)
+    status = transport.status()
+    assert status['state'] == 'connected'
+    assert status['acks'] == 50
+    assert status['replies'] == 50
+    assert status['pending'] == 0
+
+
+def test_reconnect_and_retry_after_disconnect(serve, new_manager):
+    # 后端每 7 帧断开一次，断开时等待确认的消息要重试，最终全部送达
+    transport = run_echo(new_manager, serve(make_app(drop_every=7)), 'json',
+                         30)
+    assert transport.status()['connects'] > 1
+
+
+def error_app(status):
+
+    async def handle_ws(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                frame = msg.json()
+                await ws.send_json({
+                    'type': 'error',
+                    'id': frame['id'],
+                    'status': status,
+                    'error': 'rejected'
+                })
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handle_ws)
+    return app
+
+
+def test_rejected_message_goes_to_dead_letter(serve, new_manager):
+    transport = WebSocketTransport(serve(error_app(400)))
+    manager = new_manager(transport)
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: len(read_dead_letters(manager)) == 1)
+    record = read_dead_letters(manager)[0]
+    assert record['error'] == 'rejected'
+    assert record['retry_count'] == 1
+
+
+def test_backend_error_is_retried_then_dead_lettered(serve, new_manager):
+    transport = WebSocketTransport(serve(error_app(500)))
+    manager = new_manager(transport)
+    manager.max_retry = 2
+    manager.start()
+    manager.send_message(make_message(1))
+    assert wait_for(lambda: len(read_dead_letters(manager)) == 1)
+    assert read_dead_letters(manager)[0]['retry_count'] == 3
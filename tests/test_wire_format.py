@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from conftest import make_message
+from message.universal_message import message_to_wire_dict
+from message.wire_message import (WIRE_FIELD_IDS, WIRE_SCHEMA_VERSION,
+                                  WireMessage, decode_wire, encode_wire,
+                                  msgpack, pack_msgpack, unpack_msgpack)
+from utils.transport import MessageTransport
+
+
+def wire_message():
+    return WireMessage.from_wrapper(make_message(42, Text='hi', IsAt=True))
+
+
+def test_from_wrapper():
+    message = wire_message()
+    assert message.message_id == '42'
+    assert message.raw_type == 'Text'
+    assert message.content == 'hi'
+    assert message.sender_id == '@sender'
+    assert message.receiver_id == 'tester'
+    assert message.is_at is True
+    assert message.is_group is False
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_encode_decode_round_trip(binary):
+    message = wire_message()
+    data = encode_wire(message, binary=binary)
+    key = int if binary else str
+    assert data[key(0)] == WIRE_SCHEMA_VERSION
+    assert all(isinstance(k, key) for k in data)
+    assert decode_wire(data) == message
+
+
+def test_none_and_false_fields_are_not_encoded():
+    data = encode_wire(wire_message())
+    assert str(WIRE_FIELD_IDS['is_group']) not in data
+    assert str(WIRE_FIELD_IDS['media_url']) not in data
+    assert data[str(WIRE_FIELD_IDS['is_at'])] is True
+
+
+def test_unknown_field_ids_are_ignored():
+    data = encode_wire(wire_message())
+    data['999'] = 'from a newer client'
+    assert decode_wire(data) == wire_message()
+
+
+def test_newer_schema_version_is_rejected():
+    data = encode_wire(wire_message())
+    data['0'] = WIRE_SCHEMA_VERSION + 1
+    with pytest.raises(ValueError):
+        decode_wire(data)
+    with pytest.raises(ValueError):
+        decode_wire({'1': 'no version'})
+
+
+@pytest.mark.parametrize('wire_format', ['json', 'compact'])
+def test_transport_json_formats(wire_format):
+    transport = MessageTransport()
+    transport.wire_format = wire_format
+    message = make_message(7)
+    encoded = transport.encode_message(message)
+    body = json.loads(transport.dump({'message': encoded}))
+    if wire_format == 'json':
+        assert body['message'] == json.loads(
+            json.dumps(message_to_wire_dict(message)))
+    else:
+        assert decode_wire(body['message']) == WireMessage.from_wrapper(message)
+
+
+def test_transport_msgpack_format():
+    pytest.importorskip('msgpack')
+    transport = MessageTransport()
+    transport.wire_format = 'msgpack'
+    message = make_message(7)
+    frame = unpack_msgpack(
+        transport.dump({'message': transport.encode_message(message)}))
+    assert decode_wire(frame['message']) == WireMessage.from_wrapper(message)
+
+
+def test_unknown_wire_format_is_rejected_on_start():
+    transport = MessageTransport()
+    transport.wire_format = 'xml'
+    with pytest.raises(ValueError):
+        transport.start(manager=None)
+
+
+@pytest.mark.skipif(msgpack is not None, reason='msgpack is installed')
+def test_msgpack_requires_msgpack():
+    transport = MessageTransport()
+    transport.wire_format = 'msgpack'
+    with pytest.raises(ImportError):
+        transport.start(manager=None)
+    with pytest.raises(ImportError):
+        pack_msgpack({})
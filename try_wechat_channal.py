@@ -3,15 +3,27 @@ import os
 from typing import Any, Dict
 import requests
 from lib import itchat
-from lib.itchat.content import TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING
+from lib.itchat.content import TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING, VIDEO
 from message.meta_message import MetaMessageType
 from message.reply_message import Reply, ReplyType
 from message_manager import MessageManager
 from utils.log_setup import log
 from message.universal_message import UniversalMessageWrapper
-from utils.massage_saver import save_message_to_json
+from utils.massage_saver import archive_message
+from utils.conversation_sequencer import ConversationSequencer
+from utils.media_store import MediaStore
 from utils.qr_callback import qrCallback
 
+# 所有登录账号共用一个账号池和消息分发器
+pool = itchat.CorePool()
+
+# 入站消息的去向，需提供 send_message 方法。为 None 时交给 MessageManager，
+# 多进程模式下由 supervisor 设置为通往主进程的管道通道
+message_sink = None
+
+# 这些类型的消息先在后台下载媒体文件，再带着文件引用（raw_message['Media']）发送
+MEDIA_TYPES = (PICTURE, VOICE, ATTACHMENT, VIDEO)
+
 
 def process_message(msg: Dict[str, Any], group_flag: int):
     """
@@ -33,16 +45,45 @@ def process_message(msg: Dict[str, Any], group_flag: int):
                                               receiver_id=receiver_id,
                                               sender_id=sender_id,
                                               group_flag=group_flag)
-        save_message_to_json(wrapped_msg)
-        # 发送消息
-        MessageManager().send_message(wrapped_msg)
+        # 同一会话中的消息按收到的顺序交付，后到的文字消息不会越过还在下载的媒体消息
+        conversation = tuple(sorted((sender_id, receiver_id)))
+        entry = sequencer.add(conversation, wrapped_msg)
+        if msg.get('Type') in MEDIA_TYPES and callable(msg.get('Text')):
+            # 下载不阻塞消息分发线程，完成后再发送
+            try:
+                MediaStore().submit(
+                    msg['Text'], msg.get('FileName'),
+                    lambda media: sequencer.complete(conversation, entry, media))
+            except Exception as e:
+                log.error(f"[WX] Failed to start media download: {e}")
+                sequencer.complete(conversation, entry)
+        else:
+            sequencer.complete(conversation, entry)
     except NotImplementedError as e:
         log.debug(
             f"[WX] Skipped processing message with ID {msg['MsgId']}: {e}")
 
 
+def deliver_message(wrapped_msg: UniversalMessageWrapper, media=None):
+    """
+    把消息交给后端并归档。
+
+    :param wrapped_msg: 封装后的消息。
+    :param media: MediaStore 返回的文件引用，下载失败或不是媒体消息时为 None。
+    """
+    if media is not None:
+        wrapped_msg.raw_message['Media'] = media
+    # 发送消息
+    (message_sink or MessageManager()).send_message(wrapped_msg)
+    # 归档在后台线程中完成，这里只入队
+    archive_message(wrapped_msg)
+
+
+sequencer = ConversationSequencer(deliver_message)
+
+
 # 注册处理个人消息的函数
-@itchat.msg_register([TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING])
+@pool.msg_register([TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING, VIDEO])
 def handle_individual_message(msg: Dict[str, Any]):
     """
     处理单个微信消息。
@@ -56,8 +97,8 @@ def handle_individual_message(msg: Dict[str, Any]):
 
 
 # 注册处理群聊消息的函数
-@itchat.msg_register([TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING],
-                     isGroupChat=True)
+@pool.msg_register([TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING, VIDEO],
+                   isGroupChat=True)
 def handle_group_message(msg: Dict[str, Any]):
     """
     处理微信群聊消息。
@@ -72,49 +113,54 @@ def handle_group_message(msg: Dict[str, Any]):
 
 def send_message(message: UniversalMessageWrapper):
     """
-    根据回复类型发送消息。
+    根据回复类型发送消息。根据接收者选择负责发送的账号。
 
     :param reply: 包含回复内容和类型的字典。
     :param context: 包含消息上下文信息的字典。
     """
     receiver = message["receiver_id"]
     reply = message['raw_message']
+    core = pool.get_core(receiver)
+    if core is None:
+        log.error(f"[WX] No logged in account can reach receiver={receiver}")
+        return
     try:
         if reply['type'] in [
                 ReplyType.TEXT.value, ReplyType.ERROR.value,
                 ReplyType.INFO.value
         ]:
             # 发送文本消息
-            itchat.send(reply['content'], toUserName=receiver)
+            core.send(reply['content'], toUserName=receiver)
             log.info(f"[WX] sendMsg={reply}, receiver={receiver}")
 
         elif reply['type'] == ReplyType.VOICE.value:
             # 发送语音文件
-            itchat.send_file(reply['content'], toUserName=receiver)
+            core.send_file(reply['content'], toUserName=receiver)
             log.info(f"[WX] sendFile={reply['content']}, receiver={receiver}")
 
         elif reply['type'] in [
                 ReplyType.IMAGE_URL.value, ReplyType.VIDEO_URL.value
         ]:
             # 从URL下载图片或视频并发送
-            send_media_from_url(reply, receiver)
+            send_media_from_url(core, reply, receiver)
 
         elif reply['type'] in [
                 ReplyType.IMAGE.value, ReplyType.FILE.value,
                 ReplyType.VIDEO.value
         ]:
             # 直接发送文件（图片、普通文件或视频）
-            itchat.send_file(reply['content'], toUserName=receiver)
+            core.send_file(reply['content'], toUserName=receiver)
             log.info(f"[WX] sendFile, receiver={receiver}")
 
     except Exception as e:
         log.error(f"Error sending message: {e}")
 
 
-def send_media_from_url(reply, receiver):
+def send_media_from_url(core, reply, receiver):
     """
     从URL下载媒体文件（图片或视频）并发送。
 
+    :param core: 负责发送的账号实例。
     :param reply: 包含媒体URL的回复字典。
     :param receiver: 消息接收者。
     """
@@ -133,42 +179,44 @@ def send_media_from_url(reply, receiver):
     media_storage.seek(0)
 
     if reply['type'] == ReplyType.IMAGE_URL.value:
-        itchat.send_image(media_storage, toUserName=receiver)
+        core.send_image(media_storage, toUserName=receiver)
         log.info(f"[WX] sendImage url={media_url}, receiver={receiver}")
     else:
-        itchat.send_video(media_storage, toUserName=receiver)
+        core.send_video(media_storage, toUserName=receiver)
         log.info(f"[WX] sendVideo url={media_url}, receiver={receiver}")
 
 
 def main():
     # toDo: 之后写到配置项里
     hotReload = False
-    status_path = "itchat.pkl"
+    accounts = ["itchat"]  # 每个账号使用独立的热重载文件 <账号>.pkl
     base_url = 'http://127.0.0.1:8000'
 
     # 启动消息管理
     manager = MessageManager(base_url, send_message)
     manager.start()
 
-    # 修改断线超时时间
-    itchat.instance.receivingRetryCount = 600
-
-    # 登陆
-    itchat.auto_login(
-        enableCmdQR=2,
-        hotReload=hotReload,
-        statusStorageDir=status_path,
-        qrCallback=qrCallback,
-    )
-
-    # 用户登陆提示
-    user_id = itchat.instance.storageClass.userName
-    name = itchat.instance.storageClass.nickName
-    log.info("Wechat login success, user_id: {}, nickname: {}".format(
-        user_id, name))
+    for account in accounts:
+        core = pool.new_core(account)
+        # 修改断线超时时间
+        core.receivingRetryCount = 600
+
+        # 登陆
+        pool.auto_login(
+            account,
+            enableCmdQR=2,
+            hotReload=hotReload,
+            qrCallback=qrCallback,
+        )
+
+        # 用户登陆提示
+        user_id = core.storageClass.userName
+        name = core.storageClass.nickName
+        log.info("Wechat login success, account: {}, user_id: {}, nickname: {}".
+                 format(account, user_id, name))
 
     # start message listener
-    itchat.run()
+    pool.run()
 
 
 if __name__ == '__main__':
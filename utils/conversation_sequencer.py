@@ -0,0 +1,66 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Hashable
+
+from utils.log_setup import log
+
+
+class ConversationSequencer:
+    """
+    按会话保持消息的交付顺序。
+
+    媒体消息要等后台下载完成才能交付，同一会话中后到的文字消息不能越过它。每条消息
+    进入时在所属会话的队列末尾占一个位置，完成后只有当它前面的消息都已交付时才交付；
+    不同会话之间互不等待。同一时刻每个会话只有一个线程在交付，交付函数在锁外调用。
+
+    属性:
+        deliver_fn (Callable): 交付函数，参数为消息和 complete 传入的结果。
+        conversations (dict): 会话 -> 等待交付的消息队列，队列为空时删除。
+    """
+
+    def __init__(self, deliver_fn: Callable[[Any, Any], None]):
+        self.deliver_fn = deliver_fn
+        self.lock = threading.Lock()
+        self.conversations: Dict[Hashable, deque] = {}
+        self.draining = set()
+
+    def add(self, conversation: Hashable, message: Any) -> list:
+        """
+        在会话队列末尾为消息占位。
+
+        :param conversation: 会话标识。
+        :param message: 消息。
+        :return: 占位条目，传给 complete。
+        """
+        entry = [message, None, False]
+        with self.lock:
+            self.conversations.setdefault(conversation, deque()).append(entry)
+        return entry
+
+    def complete(self, conversation: Hashable, entry: list, result: Any = None):
+        """
+        标记消息已准备好，并按顺序交付会话中所有已准备好的消息。
+
+        :param conversation: 会话标识。
+        :param entry: add 返回的条目。
+        :param result: 交给 deliver_fn 的第二个参数，例如媒体文件引用。
+        """
+        with self.lock:
+            entry[1], entry[2] = result, True
+            if conversation in self.draining:
+                # 正在交付这个会话的线程会接着交付它
+                return
+            self.draining.add(conversation)
+        while True:
+            with self.lock:
+                queue = self.conversations.get(conversation)
+                if not queue or not queue[0][2]:
+                    self.draining.discard(conversation)
+                    if queue is not None and not queue:
+                        del self.conversations[conversation]
+                    return
+                message, result, _ = queue.popleft()
+            try:
+                self.deliver_fn(message, result)
+            except Exception as e:
+                log.error(f"Failed to deliver message: {e}")
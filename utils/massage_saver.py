@@ -1,42 +1,158 @@
-import json
-import os
-from datetime import datetime
+import atexit
+import queue
+import threading
+from typing import Any, Dict, Optional, Union
 
+from message.universal_message import UniversalMessageWrapper, message_to_dict
+from utils.log_setup import log
+from utils.message_archive import MessageArchive
+from utils.message_journal import MessageJournal
+from utils.singleton import singleton
 
-def save_message_to_json(msg, directory="json_messages"):
+_journals: Dict[str, MessageJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(directory: str = "json_messages") -> MessageJournal:
     """
-    将消息保存为 JSON 文件。文件名包含时间戳和序号。
+    获取指定目录的消息日志，同一目录在进程内只打开一次。
 
-    :param msg: 要保存的消息，应为字典格式。
-    :param directory: 存储 JSON 文件的目录，默认为 'json_messages'。
+    :param directory: 日志目录。
+    :return: MessageJournal 实例。
     """
-    os.makedirs(directory, exist_ok=True)
+    with _journals_lock:
+        if directory not in _journals:
+            _journals[directory] = MessageJournal(directory)
+        return _journals[directory]
 
-    # 获取当前目录下最大的序号
-    sequence_number = get_max_sequence_number(directory) + 1
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"message_{timestamp}_{sequence_number}.json"
-    file_path = os.path.join(directory, filename)
+def save_message_to_json(msg: Union[UniversalMessageWrapper, Dict[str, Any]],
+                         directory="json_messages") -> int:
+    """
+    将消息追加到消息日志中。日志按段存放，每条消息一行 JSON，可用
+    utils.message_journal.read_journal 读取。
 
-    with open(file_path, "w", encoding="utf-8") as file:
-        json.dump(msg, file, ensure_ascii=False, indent=4)
+    :param msg: 要保存的消息，可以是 UniversalMessageWrapper 或字典。
+    :param directory: 日志目录，默认为 'json_messages'。
+    :return: 消息在日志中的序号。
+    """
+    if isinstance(msg, UniversalMessageWrapper):
+        msg = message_to_dict(msg)
+    return get_journal(directory).append(msg)
 
 
-def get_max_sequence_number(directory):
+@singleton
+class MessageArchiver:
     """
-    获取指定目录下最大的文件序号。
+    后台消息归档器。
 
-    :param directory: 文件所在目录。
-    :return: 最大序号。
+    消息处理函数只把消息放入有界队列，由后台线程批量序列化并写入消息日志，
+    磁盘变慢不会拖慢消息发往后端。队列满时丢弃新消息并记录警告，而不是阻塞调用者。
+    SQLite 归档默认关闭。需要查询历史消息时，在第一条消息归档前创建实例并指定路径，
+    例如 MessageArchiver(archive_path="json_messages/messages.db")，
+    同一批消息就会同时写入日志和归档。
+
+    属性:
+        directory (str): 日志目录。
+        message_archive (MessageArchive): SQLite 归档，可用于查询历史消息，未启用时为 None。
+        batch_size (int): 每次最多写入的消息条数。
+        queue (queue.Queue): 等待归档的消息。
+        dropped (int): 因队列已满被丢弃的消息数。
     """
-    max_seq = 0
-    for filename in os.listdir(directory):
-        parts = filename.split('_')
-        if len(parts) == 3 and parts[0] == 'message':
+
+    def __init__(self,
+                 directory: str = "json_messages",
+                 queue_size: int = 10000,
+                 batch_size: int = 500,
+                 archive_path: Optional[str] = None):
+        self.directory = directory
+        self.message_archive = MessageArchive(archive_path) if archive_path else None
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self._stop_signal = object()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._archive_loop,
+                                                name='message-archiver',
+                                                daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def archive(self, msg: Union[UniversalMessageWrapper, Dict[str, Any]]):
+        """
+        把消息交给后台归档，不会阻塞。
+
+        :param msg: 要归档的消息。
+        """
+        if self._thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                log.warning(f"Archive queue is full, {self.dropped} messages "
+                            f"dropped so far")
+
+    def stop(self, timeout: float = 10):
+        """
+        写完队列中剩余的消息后停止后台线程。
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self.queue.put(self._stop_signal)
+        thread.join(timeout)
+
+    def _archive_loop(self):
+        journal = get_journal(self.directory)
+        running = True
+        while running:
             try:
-                seq = int(parts[2].split('.')[0])
-                max_seq = max(max_seq, seq)
-            except ValueError:
-                pass
-    return max_seq
+                # 空闲时提交已写入的记录，保证安静期也能落盘
+                batch = [self.queue.get(timeout=journal.fsync_interval)]
+            except queue.Empty:
+                journal.commit()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = []
+            for msg in batch:
+                if msg is self._stop_signal:
+                    running = False
+                    continue
+                try:
+                    records.append(
+                        message_to_dict(msg) if isinstance(
+                            msg, UniversalMessageWrapper) else msg)
+                except Exception as e:
+                    log.error(f"Failed to serialize message for archive: {e}")
+            if records:
+                try:
+                    journal.append_many(records)
+                except Exception as e:
+                    log.error(f"Failed to archive {len(records)} messages: {e}")
+                if self.message_archive is not None:
+                    try:
+                        self.message_archive.insert_many(records)
+                    except Exception as e:
+                        log.error(f"Failed to index {len(records)} messages: {e}")
+        journal.commit()
+
+
+def archive_message(msg: Union[UniversalMessageWrapper, Dict[str, Any]]):
+    """
+    把消息交给后台归档器，立即返回。
+
+    :param msg: 要归档的消息。
+    """
+    MessageArchiver().archive(msg)
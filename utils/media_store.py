@@ -0,0 +1,191 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from utils.log_setup import log
+from utils.singleton import singleton
+
+
+@singleton
+class MediaStore:
+    """
+    本地媒体文件库。
+
+    图片、语音、文件和视频在后台线程中下载，按内容的 SHA-256 保存为
+    ``<目录>/<哈希><扩展名>``，相同内容只保存一份。发往后端的消息只带文件引用，
+    不带文件内容或下载函数。目录总大小超过 max_bytes 时删除最久未使用的文件。
+
+    每次保存或引用文件后，文件在 pin_seconds 秒内不会被淘汰，覆盖消息在发送队列和
+    重试中等待的时间。后端应在收到消息后尽快读取或复制文件，超过这个时间的文件随时
+    可能被删除。
+
+    属性:
+        directory (str): 媒体文件目录。
+        max_bytes (int): 目录总大小上限。
+        pin_seconds (float): 文件被引用后保证保留的秒数。
+        base_url (str): 访问媒体目录的地址前缀，设置后引用中带有 url。
+        total_bytes (int): 目录中文件的总大小。
+    """
+
+    def __init__(self,
+                 directory: str = "./tmp/media",
+                 max_bytes: int = 1024 * 1024 * 1024,
+                 workers: int = 4,
+                 base_url: Optional[str] = None,
+                 pin_seconds: float = 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pin_seconds = pin_seconds
+        self.base_url = base_url
+        self.executor = ThreadPoolExecutor(workers,
+                                           thread_name_prefix='media-download')
+        self.lock = threading.Lock()
+        # 哈希 -> (文件名, 大小)，按最近使用排序
+        self.files = OrderedDict()
+        # 哈希 -> 保留截止时间（time.monotonic）
+        self.pinned_until = {}
+        self.total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """
+        按修改时间重建索引，文件每次被使用时会更新修改时间。
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                # 写入时进程退出留下的临时文件
+                os.remove(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self.files[os.path.splitext(name)[0]] = (name, size)
+            self.total_bytes += size
+
+    def put(self, data: bytes, file_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        保存文件内容，已有相同内容时直接返回已有文件的引用。
+
+        :param data: 文件内容。
+        :param file_name: 原始文件名，用于确定扩展名。
+        :return: 文件引用。
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            entry = self.files.get(digest)
+            if entry is not None:
+                self.files.move_to_end(digest)
+                self._pin(digest)
+                self._touch(entry[0])
+                return self._reference(digest, entry, file_name)
+        extension = os.path.splitext(file_name or '')[1].lower()
+        name = digest + extension
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            entry = self.files.get(digest)
+            self._pin(digest)
+            if entry is None:
+                entry = self.files[digest] = (name, len(data))
+                self.total_bytes += len(data)
+                self._evict(keep=digest)
+            elif entry[0] != name:
+                # 另一个线程已用不同的扩展名保存了相同内容
+                os.remove(path)
+            return self._reference(digest, entry, file_name)
+
+    def download(self,
+                 download_fn: Callable[[], bytes],
+                 file_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        调用 itchat 消息的下载函数（Text）取得文件内容并保存。
+
+        :param download_fn: 不带参数调用时返回文件内容的函数。
+        :param file_name: 原始文件名。
+        :return: 文件引用。
+        """
+        return self.put(download_fn(), file_name)
+
+    def submit(self,
+               download_fn: Callable[[], bytes],
+               file_name: Optional[str],
+               callback: Callable[[Optional[Dict[str, Any]]], None]) -> Future:
+        """
+        在后台下载并保存文件，完成后调用 callback。下载失败时 callback 收到 None。
+
+        :param download_fn: 下载函数。
+        :param file_name: 原始文件名。
+        :param callback: 接收文件引用的回调。
+        :return: 下载任务。
+        """
+
+        def task():
+            try:
+                media = self.download(download_fn, file_name)
+            except Exception as e:
+                log.warning(f"Failed to download media {file_name}: {e}")
+                media = None
+            callback(media)
+
+        return self.executor.submit(task)
+
+    def path(self, digest: str) -> Optional[str]:
+        """
+        返回哈希对应的本地文件路径，文件不存在时返回 None。
+        """
+        with self.lock:
+            entry = self.files.get(digest)
+            if entry is None:
+                return None
+            self.files.move_to_end(digest)
+        return os.path.join(self.directory, entry[0])
+
+    def _reference(self, digest, entry, file_name):
+        name, size = entry
+        media = {
+            'sha256': digest,
+            'size': size,
+            'file_name': file_name,
+            'path': os.path.abspath(os.path.join(self.directory, name)),
+        }
+        if self.base_url:
+            media['url'] = self.base_url.rstrip('/') + '/' + name
+        return media
+
+    def _pin(self, digest):
+        self.pinned_until[digest] = time.monotonic() + self.pin_seconds
+
+    def _touch(self, name):
+        try:
+            os.utime(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def _evict(self, keep):
+        now = time.monotonic()
+        for digest, (name, size) in list(self.files.items()):
+            if self.total_bytes <= self.max_bytes:
+                return
+            if digest == keep or self.pinned_until.get(digest, 0) > now:
+                # 还可能被发送中的消息引用
+                continue
+            del self.files[digest]
+            self.pinned_until.pop(digest, None)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            log.debug(f"Evicted media {name}, {size} bytes")
+        if self.total_bytes > self.max_bytes:
+            log.warning(f"Pinned media exceed quota: "
+                        f"{self.total_bytes} > {self.max_bytes} bytes")
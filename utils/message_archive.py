@@ -0,0 +1,153 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    msg_id TEXT,
+    sender_id TEXT,
+    receiver_id TEXT,
+    chatroom_id TEXT,
+    create_time INTEGER,
+    msg_type TEXT,
+    content TEXT,
+    source TEXT,
+    app TEXT,
+    group_flag INTEGER,
+    raw TEXT,
+    UNIQUE (msg_id, receiver_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_msg_id ON messages (msg_id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_id, create_time);
+CREATE INDEX IF NOT EXISTS idx_messages_chatroom ON messages (chatroom_id, create_time);
+CREATE INDEX IF NOT EXISTS idx_messages_create_time ON messages (create_time);
+"""
+
+COLUMNS = ('msg_id', 'sender_id', 'receiver_id', 'chatroom_id', 'create_time',
+           'msg_type', 'content', 'source', 'app', 'group_flag', 'raw')
+
+
+def message_to_row(record: Dict[str, Any]) -> tuple:
+    """
+    把 message_to_dict 得到的消息转换为一行数据。
+
+    群聊消息的发送者取 ActualUserName，群ID取消息两端中以 @@ 开头的一方。
+
+    :param record: 消息字典。
+    :return: 按 COLUMNS 顺序排列的元组。
+    """
+    raw = record.get('raw_message') or {}
+    from_user = raw.get('FromUserName') or record.get('sender_id')
+    to_user = raw.get('ToUserName') or record.get('receiver_id')
+    chatroom_id = None
+    for user_name in (from_user, to_user):
+        if user_name and user_name.startswith('@@'):
+            chatroom_id = user_name
+            break
+    sender_id = raw.get('ActualUserName') if chatroom_id else None
+    content = raw.get('Text') if isinstance(raw.get('Text'), str) \
+        else raw.get('Content')
+    return (str(raw.get('MsgId')) if raw.get('MsgId') is not None else None,
+            sender_id or from_user, to_user, chatroom_id,
+            raw.get('CreateTime'), raw.get('Type'), content,
+            record.get('source'), record.get('app'), record.get('group_flag'),
+            json.dumps(raw, ensure_ascii=False, default=str))
+
+
+class MessageArchive:
+    """
+    基于 SQLite（WAL 模式）的本地消息归档，支持按群、发送者和时间快速查询。
+
+    写入按批次在一个事务中完成；每个线程使用自己的连接，WAL 模式下读取不会被写入阻塞。
+
+    属性:
+        path (str): 数据库文件路径。
+    """
+
+    def __init__(self, path: str = "messages.db"):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def insert_many(self, records: List[Dict[str, Any]]) -> int:
+        """
+        在一个事务中批量写入消息，已存在的 (MsgId, 接收者) 会被忽略。
+
+        :param records: message_to_dict 得到的消息列表。
+        :return: 实际写入的条数。
+        """
+        rows = [message_to_row(record) for record in records]
+        conn = self._connection()
+        with self._write_lock, conn:
+            before = conn.total_changes
+            conn.executemany(
+                f"INSERT OR IGNORE INTO messages ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            return conn.total_changes - before
+
+    def insert(self, record: Dict[str, Any]) -> int:
+        return self.insert_many([record])
+
+    def get_by_msg_id(self, msg_id: str) -> List[Dict[str, Any]]:
+        """
+        按 MsgId 查找消息（多个账号可能收到同一条群消息）。
+        """
+        return self._query("SELECT * FROM messages WHERE msg_id = ?",
+                           (str(msg_id), ))
+
+    def last_in_room(self, chatroom_id: str, n: int = 20) -> List[Dict[str, Any]]:
+        """
+        返回群里最近的 n 条消息，按时间先后排列。
+
+        :param chatroom_id: 群 UserName。
+        :param n: 条数。
+        """
+        rows = self._query(
+            "SELECT * FROM messages WHERE chatroom_id = ? "
+            "ORDER BY create_time DESC, id DESC LIMIT ?", (chatroom_id, n))
+        rows.reverse()
+        return rows
+
+    def from_user_since(self,
+                        sender_id: str,
+                        since: int,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        返回某个用户从时间 since（秒级时间戳，含）起发出的消息，按时间先后排列。
+
+        :param sender_id: 发送者 UserName，群消息为群成员的 UserName。
+        :param since: 起始 CreateTime。
+        :param limit: 最多返回的条数，为 None 时不限制。
+        """
+        return self._query(
+            "SELECT * FROM messages WHERE sender_id = ? AND create_time >= ? "
+            "ORDER BY create_time, id LIMIT ?",
+            (sender_id, since, -1 if limit is None else limit))
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        rows = []
+        for row in self._connection().execute(sql, params):
+            data = dict(row)
+            data['raw'] = json.loads(data['raw']) if data['raw'] else None
+            rows.append(data)
+        return rows
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
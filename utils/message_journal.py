@@ -0,0 +1,236 @@
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.log_setup import log
+
+SEGMENT_PREFIX = 'messages_'
+SEGMENT_PATTERN = re.compile(r'messages_(\d+)_(\d{8}_\d{6})\.jsonl(\.gz)?')
+
+
+class MessageJournal:
+    """
+    分段的追加写入消息日志，替代每条消息一个 JSON 文件的保存方式。
+
+    每条记录是一行 JSON（JSON Lines），包含序号、写入时间和消息内容。日志按段存放，
+    段文件名为 ``messages_<起始序号>_<创建时间>.jsonl``，开启压缩时以 ``.gz`` 结尾。
+
+    - 序号保存在内存中，启动时只读取最后一个段来恢复，不再扫描整个目录。
+    - 当前段超过大小或时长限制后切换到新段。
+    - 写入先进入操作系统缓存，累计到一定条数或时间后统一 fsync（组提交）。
+
+    属性:
+        directory (str): 日志目录。
+        max_segment_bytes (int): 单个段的最大字节数。
+        max_segment_seconds (float): 单个段的最长写入时间。
+        compress (bool): 是否用 gzip 压缩新段。
+        fsync_interval (float): 两次 fsync 之间的最长时间。
+        fsync_batch (int): 累计多少条未同步记录后立即 fsync。
+    """
+
+    def __init__(self,
+                 directory: str = "json_messages",
+                 max_segment_bytes: int = 64 * 1024 * 1024,
+                 max_segment_seconds: float = 24 * 3600,
+                 compress: bool = False,
+                 fsync_interval: float = 1.0,
+                 fsync_batch: int = 256):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.compress = compress
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.lock = threading.Lock()
+        self._file = None
+        self._raw_file = None
+        self._segment_bytes = 0
+        self._segment_started = 0.0
+        self._unsynced = 0
+        self._last_sync = time.time()
+        os.makedirs(directory, exist_ok=True)
+        self.sequence = self._recover_sequence()
+
+    def _recover_sequence(self) -> int:
+        """
+        读取最后一个段中最后一条完整记录的序号。
+        """
+        segments = list_segments(self.directory)
+        if not segments:
+            return 0
+        last_seq = segment_start(segments[-1]) - 1
+        for record in iter_segment(os.path.join(self.directory,
+                                                segments[-1])):
+            last_seq = record['seq']
+        return last_seq
+
+    def append(self, message: Dict[str, Any]) -> int:
+        """
+        追加一条消息。
+
+        :param message: 可以序列化为 JSON 的消息字典。
+        :return: 分配给这条消息的序号。
+        """
+        return self.append_many([message])[-1]
+
+    def append_many(self, messages: List[Dict[str, Any]]) -> List[int]:
+        """
+        一次追加多条消息，只写一次文件。
+
+        :param messages: 消息字典列表。
+        :return: 分配给这些消息的序号。
+        """
+        now = time.time()
+        with self.lock:
+            if self._should_rotate(now):
+                self._open_segment(now)
+            lines, seqs = [], []
+            for message in messages:
+                self.sequence += 1
+                seqs.append(self.sequence)
+                lines.append(
+                    json.dumps({
+                        'seq': self.sequence,
+                        'ts': now,
+                        'message': message
+                    },
+                               ensure_ascii=False,
+                               default=str))
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+            self._file.write(data)
+            self._file.flush()
+            self._segment_bytes += len(data)
+            self._unsynced += len(messages)
+            if self._unsynced >= self.fsync_batch or \
+                    now - self._last_sync >= self.fsync_interval:
+                self._sync()
+        return seqs
+
+    def commit(self):
+        """
+        把已写入的记录 fsync 到磁盘。
+        """
+        with self.lock:
+            if self._file is not None and self._unsynced:
+                self._sync()
+
+    def close(self):
+        """
+        提交并关闭当前段。
+        """
+        with self.lock:
+            self._close_segment()
+
+    def _should_rotate(self, now: float) -> bool:
+        return self._file is None or \
+            self._segment_bytes >= self.max_segment_bytes or \
+            now - self._segment_started >= self.max_segment_seconds
+
+    def _open_segment(self, now: float):
+        self._close_segment()
+        timestamp = datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S")
+        filename = f"{SEGMENT_PREFIX}{self.sequence + 1:012d}_{timestamp}.jsonl"
+        if self.compress:
+            filename += '.gz'
+        path = os.path.join(self.directory, filename)
+        self._raw_file = open(path, 'ab')
+        self._file = gzip.GzipFile(fileobj=self._raw_file, mode='ab') \
+            if self.compress else self._raw_file
+        self._segment_bytes = 0
+        self._segment_started = now
+        log.debug(f"Message journal segment opened: {path}")
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        if self._file is not self._raw_file:
+            self._file.close()
+        self._raw_file.flush()
+        os.fsync(self._raw_file.fileno())
+        self._raw_file.close()
+        self._file = self._raw_file = None
+        self._unsynced = 0
+
+    def _sync(self):
+        # GzipFile.flush 会把已压缩的数据刷到底层文件
+        self._file.flush()
+        if self._file is not self._raw_file:
+            self._raw_file.flush()
+        os.fsync(self._raw_file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+
+def list_segments(directory: str) -> List[str]:
+    """
+    按起始序号返回目录中的段文件名。以段前缀开头但无法解析的文件会被跳过。
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    segments = []
+    for name in names:
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        match = SEGMENT_PATTERN.fullmatch(name)
+        try:
+            datetime.strptime(match.group(2), "%Y%m%d_%H%M%S")
+        except (AttributeError, ValueError):
+            log.warning(f"Ignored unrecognized journal file: {name}")
+            continue
+        segments.append(name)
+    return sorted(segments, key=segment_start)
+
+
+def segment_start(name: str) -> int:
+    return int(name[len(SEGMENT_PREFIX):].split('_')[0])
+
+
+def iter_segment(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐条读取一个段。进程崩溃时最后一行可能不完整，会被忽略。
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rb') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    log.debug(f"Skipped torn record in {path}")
+                    return
+    except (EOFError, OSError) as e:
+        # 压缩段的最后一个 gzip 块可能没有写完
+        log.debug(f"Stopped reading {path}: {e}")
+
+
+def read_journal(directory: str = "json_messages",
+                 start_seq: int = 0,
+                 end_seq: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    按序号顺序遍历日志中的记录。
+
+    :param directory: 日志目录。
+    :param start_seq: 从这个序号开始（包含）。
+    :param end_seq: 到这个序号结束（包含），为 None 时读到末尾。
+    :return: 记录迭代器，每条记录包含 seq、ts 和 message。
+    """
+    segments = list_segments(directory)
+    for i, name in enumerate(segments):
+        # 下一个段的起始序号不大于 start_seq 时，这个段可以整体跳过
+        if i + 1 < len(segments) and segment_start(segments[i + 1]) <= start_seq:
+            continue
+        if end_seq is not None and segment_start(name) > end_seq:
+            return
+        for record in iter_segment(os.path.join(directory, name)):
+            if record['seq'] < start_seq:
+                continue
+            if end_seq is not None and record['seq'] > end_seq:
+                return
+            yield record
@@ -15,4 +15,6 @@ def singleton(cls):
             instances[cls] = cls(*args, **kwargs)
         return instances[cls]
 
+    # 原始类，测试等场合需要单独的实例时使用
+    get_instance.__wrapped__ = cls
     return get_instance
@@ -0,0 +1,133 @@
+from typing import Iterator, List, NamedTuple, Optional
+
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+
+class ServerSentEvent(NamedTuple):
+    """
+    一个完整的 SSE 事件。
+
+    属性:
+        event (str): 事件类型，未指定时为 'message'。
+        data (str): 事件数据，多行 data 字段以换行符连接。
+        id (str): 事件自带的ID，没有 id 字段时为 None。
+    """
+    event: str
+    data: str
+    id: Optional[str]
+
+
+class SSEDecoder:
+    """
+    增量的 text/event-stream 解码器。
+
+    按 WHATWG 规范解析：支持 \\n、\\r\\n 和 \\r 三种换行，多行 data 字段，注释行，
+    以及 id 和 retry 字段。每次只处理新收到的字节，不完整的行留在缓冲区中等待下一块数据，
+    因此事件可以被拆到多个块里，一个块里也可以有多个事件。
+
+    属性:
+        last_event_id (str): 最后一次收到的事件ID，重连时作为 Last-Event-ID 发送。
+        retry (int): 服务器通过 retry 字段指定的重连等待毫秒数，未指定时为 None。
+    """
+
+    def __init__(self, last_event_id: Optional[str] = None):
+        self.last_event_id = last_event_id
+        self.retry = None
+        self._buffer = b''
+        self._pending_cr = False
+        self._event = ''
+        self._id = None
+        self._data = []
+
+    def feed(self, chunk: bytes) -> List[ServerSentEvent]:
+        """
+        处理一块新数据。
+
+        :param chunk: 从连接读到的字节。
+        :return: 这块数据补全的事件。
+        """
+        # 上一块以 \r 结尾时，这一块开头的 \n 属于同一个换行
+        if self._pending_cr and chunk[:1] == b'\n':
+            chunk = chunk[1:]
+        self._pending_cr = chunk[-1:] == b'\r'
+        data = self._buffer + chunk if self._buffer else chunk
+        if b'\r' in data:
+            data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        lines = data.split(b'\n')
+        self._buffer = lines.pop()
+        events = []
+        for line in lines:
+            event = self._process_line(line.decode('utf-8', 'replace'))
+            if event is not None:
+                events.append(event)
+        return events
+
+    def reset(self):
+        """
+        丢弃未完成的事件，用于重新连接。last_event_id 和 retry 会保留。
+        """
+        self._buffer = b''
+        self._pending_cr = False
+        self._event = ''
+        self._id = None
+        self._data = []
+
+    def _process_line(self, line: str) -> Optional[ServerSentEvent]:
+        if not line:
+            return self._dispatch()
+        if line[0] == ':':
+            # 注释行，通常是服务器的心跳
+            return None
+        field, sep, value = line.partition(':')
+        if sep and value[:1] == ' ':
+            value = value[1:]
+        if field == 'data':
+            self._data.append(value)
+        elif field == 'event':
+            self._event = value
+        elif field == 'id':
+            if '\0' not in value:
+                self.last_event_id = self._id = value
+        elif field == 'retry':
+            if value.isdigit():
+                self.retry = int(value)
+        return None
+
+    def _dispatch(self) -> Optional[ServerSentEvent]:
+        event = None
+        data = '\n'.join(self._data)
+        # 没有数据的事件不分发，包括只有一个空 data 字段的事件
+        if data:
+            event = ServerSentEvent(self._event or 'message', data, self._id)
+        self._event = ''
+        self._id = None
+        self._data = []
+        return event
+
+
+def iter_chunks(response, chunk_size: int = 65536) -> Iterator[bytes]:
+    """
+    按到达顺序读取 requests 流式响应中的数据，已到达的数据立即返回，
+    而不是等到凑满 chunk_size 字节。
+
+    读取错误和 iter_content 一样转换为 requests 的异常，读取超时为
+    requests.exceptions.ConnectionError。
+
+    :param response: stream=True 的 requests.Response。
+    :param chunk_size: 单次读取的最大字节数。
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size=None)
+        return
+    while True:
+        try:
+            chunk = read1(chunk_size)
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+        if not chunk:
+            return
+        yield chunk
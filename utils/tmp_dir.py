@@ -1,20 +1,58 @@
+import os
 import pathlib
+import threading
+import time
+import uuid
+from typing import Dict, Tuple
 
+from utils.log_setup import log
+from utils.singleton import singleton
 
+
+@singleton
 class TmpDir:
     """
-    一个表示临时目录的类。该目录在对象销毁时被删除。
+    临时文件目录，下载的媒体文件先保存在这里。
+
+    new_file 返回不会重名的文件路径并为它登记一次引用，使用完后调用 release。
+    后台线程定期清理目录：没有引用且超过 ttl 秒未使用的文件被删除；登记超过
+    max_age 秒仍未释放的引用视为泄漏，文件同样删除；目录总大小超过 max_bytes 时，
+    按最近使用时间（mtime）从旧到新删除没有引用的文件。只管理目录下的文件，
+    子目录（例如 MediaStore 的 media 目录）不在清理范围内。
 
     属性:
-        tmp_file_path (pathlib.Path): 临时文件的路径。
+        tmp_file_path (pathlib.Path): 临时目录的路径。
+        max_bytes (int): 目录中文件总大小的上限。
+        ttl (float): 没有引用的文件保留的秒数。
+        max_age (float): 有引用的文件最多保留的秒数。
+        cleanup_interval (float): 后台清理的间隔秒数。
+        total_bytes (int): 上一次清理后目录中文件的总大小。
     """
 
-    def __init__(self):
+    def __init__(self,
+                 directory: str = "./tmp/",
+                 max_bytes: int = 512 * 1024 * 1024,
+                 ttl: float = 600,
+                 max_age: float = 24 * 3600,
+                 cleanup_interval: float = 60):
         """
-        初始化TmpDir类的实例，如果临时目录不存在，则创建它。
+        初始化TmpDir类的实例，如果临时目录不存在，则创建它，并启动后台清理线程。
         """
-        self.tmp_file_path = pathlib.Path("./tmp/")
+        self.tmp_file_path = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_age = max_age
+        self.cleanup_interval = cleanup_interval
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        # 文件名 -> (引用计数, 登记时间)
+        self.refs: Dict[str, Tuple[int, float]] = {}
+        self.stop_event = threading.Event()
         self._create_tmp_directory()
+        self.cleanup_thread = threading.Thread(target=self._cleanup_loop,
+                                               name='tmp-cleanup',
+                                               daemon=True)
+        self.cleanup_thread.start()
 
     def _create_tmp_directory(self):
         """
@@ -30,3 +68,119 @@ class TmpDir:
         :return: 临时目录的路径字符串。
         """
         return str(self.tmp_file_path) + "/"
+
+    def new_file(self, file_name: str = "") -> str:
+        """
+        生成一个不会重名的文件路径并登记一次引用。文件由调用方创建。
+
+        :param file_name: 原始文件名，保留在新文件名的末尾。
+        :return: 文件路径。
+        """
+        name = uuid.uuid4().hex
+        base_name = os.path.basename(file_name or "")
+        if base_name:
+            name += "_" + base_name
+        with self.lock:
+            self.refs[name] = (1, time.time())
+        return self.path() + name
+
+    def acquire(self, path: str):
+        """
+        为已有的临时文件增加一次引用，并把它标记为最近使用。
+
+        :param path: new_file 返回的路径。
+        """
+        name = os.path.basename(path)
+        with self.lock:
+            count, registered_at = self.refs.get(name, (0, time.time()))
+            self.refs[name] = (count + 1, registered_at)
+        self._touch(name)
+
+    def release(self, path: str):
+        """
+        释放一次引用。引用为零的文件在 ttl 秒后或超出配额时被删除。
+
+        :param path: new_file 返回的路径。
+        """
+        name = os.path.basename(path)
+        with self.lock:
+            count, registered_at = self.refs.get(name, (0, 0))
+            if count > 1:
+                self.refs[name] = (count - 1, registered_at)
+            else:
+                self.refs.pop(name, None)
+        self._touch(name)
+
+    def cleanup(self):
+        """
+        执行一次清理，删除过期文件并把目录大小控制在 max_bytes 以内。
+        """
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.tmp_file_path):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+
+        with self.lock:
+            kept = []
+            total = 0
+            for mtime, name, size in files:
+                ref = self.refs.get(name)
+                referenced = ref is not None
+                # 有引用的文件按登记时间判断是否泄漏，旧文件刚被 acquire 时不会被删
+                if now - mtime > self.ttl if ref is None \
+                        else now - ref[1] > self.max_age:
+                    self.refs.pop(name, None)
+                    self._remove(name)
+                else:
+                    kept.append((name, size, referenced))
+                    total += size
+            # 超出配额时从最久未使用的文件开始删除
+            for name, size, referenced in kept:
+                if total <= self.max_bytes:
+                    break
+                if not referenced:
+                    self._remove(name)
+                    total -= size
+            # 登记后一直没有创建的文件
+            existing = {name for _, name, _ in files}
+            for name, (_, registered_at) in list(self.refs.items()):
+                if name not in existing and now - registered_at > self.max_age:
+                    del self.refs[name]
+            if total > self.max_bytes:
+                log.warning(f"Temporary files in use exceed quota: "
+                            f"{total} > {self.max_bytes} bytes")
+            self.total_bytes = total
+
+    def close(self):
+        """
+        停止后台清理线程。
+        """
+        self.stop_event.set()
+        self.cleanup_thread.join()
+
+    def _cleanup_loop(self):
+        while not self.stop_event.wait(self.cleanup_interval):
+            try:
+                self.cleanup()
+            except Exception as e:
+                log.error(f"Failed to clean up {self.tmp_file_path}: {e}")
+
+    def _touch(self, name):
+        try:
+            os.utime(self.tmp_file_path / name)
+        except OSError:
+            pass
+
+    def _remove(self, name):
+        try:
+            os.remove(self.tmp_file_path / name)
+            log.debug(f"Removed temporary file {name}")
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,572 @@
+import asyncio
+import functools
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from message.universal_message import (UniversalMessageWrapper, dumps_wire,
+                                       message_to_wire_dict)
+from message.wire_message import (WireMessage, encode_wire, msgpack,
+                                  pack_msgpack, unpack_msgpack)
+from utils.log_setup import log
+from utils.sse import SSEDecoder, iter_chunks
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class SendError(Exception):
+    """
+    消息没有被后端接收。
+
+    属性:
+        status (int): HTTP 状态码或后端返回的错误码，网络错误时为 None。
+    """
+
+    def __init__(self, error: str, status: Optional[int] = None):
+        super().__init__(error)
+        self.status = status
+
+
+class AiohttpClient:
+    """
+    基于 aiohttp 的异步 HTTP 客户端，连接池中的连接保持长连接并在请求间复用。
+
+    会话在第一次请求时创建，因此必须始终在同一个事件循环中使用。
+
+    属性:
+        pool_size (int): 连接池大小。
+        timeout (float): 单个请求的总超时秒数。
+    """
+
+    def __init__(self, pool_size: int = 32, timeout: float = 30):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = None
+
+    async def post(self,
+                   url: str,
+                   data: bytes,
+                   headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        """
+        发送 POST 请求。
+
+        :return: (状态码, 响应内容)。
+        """
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self.session.post(url, data=data, headers=headers) as r:
+            return r.status, await r.read()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class RequestsClient:
+    """
+    未安装 aiohttp 时使用的客户端：带连接池的 requests.Session，阻塞请求在线程池中执行。
+
+    属性:
+        pool_size (int): 连接池大小，同时也是执行请求的线程数。
+        timeout (float): 单个请求的超时秒数。
+    """
+
+    def __init__(self, pool_size: int = 32, timeout: float = 30):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(pool_size,
+                                           thread_name_prefix='http-client')
+
+    async def post(self,
+                   url: str,
+                   data: bytes,
+                   headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        response = await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            functools.partial(self.session.post,
+                              url,
+                              data=data,
+                              headers=headers,
+                              timeout=self.timeout))
+        return response.status_code, response.content
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+def create_http_client(pool_size: int = 32, timeout: float = 30):
+    """
+    创建异步 HTTP 客户端，优先使用 aiohttp，未安装时退回 requests。
+
+    :param pool_size: 连接池大小。
+    :param timeout: 单个请求的超时秒数。
+    :return: AiohttpClient 或 RequestsClient。
+    """
+    if aiohttp is not None:
+        return AiohttpClient(pool_size, timeout)
+    return RequestsClient(pool_size, timeout)
+
+
+class MessageTransport:
+    """
+    MessageManager 与后端之间的传输方式。
+
+    send 在 MessageManager 的事件循环中执行，返回每条消息的后端响应；后端主动推送的回复
+    由传输方式放入 manager.recv_queue。
+
+    消息的编码由 wire_format 决定：
+
+    - 'json': message_to_wire_dict 生成的 JSON，默认。
+    - 'compact': message.wire_message 中以字段编号为键的精简结构，JSON 编码。
+    - 'msgpack': 同 compact，用 MessagePack 编码，需要安装 msgpack。
+
+    属性:
+        max_batch (int): 一次 send 最多包含的消息数，为 1 时不合并发送。
+        batch_window (float): 合并发送时等待更多消息的最长秒数。
+        wire_format (str): 消息编码方式。
+    """
+    max_batch = 1
+    batch_window = 0.0
+    wire_format = 'json'
+
+    def start(self, manager):
+        """
+        开始接收后端消息，在 MessageManager 的事件循环启动后调用。
+
+        :param manager: MessageManager 实例。
+        """
+        if self.wire_format not in ('json', 'compact', 'msgpack'):
+            raise ValueError(f"Unknown wire format: {self.wire_format}")
+        if self.wire_format == 'msgpack' and msgpack is None:
+            raise ImportError('MessagePack wire format requires msgpack')
+        self.manager = manager
+
+    async def send(self,
+                   messages: List[UniversalMessageWrapper]) -> List[Optional[Dict]]:
+        """
+        发送消息。
+
+        :param messages: 要发送的消息。
+        :return: 按相同顺序排列的每条消息的响应，格式为 {'data': ..., 'message': ...}，
+            长度与 messages 相同。
+        :raises SendError: 后端没有接收这些消息，或响应无法与消息一一对应。
+        """
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+    def status(self) -> Dict[str, Any]:
+        return {}
+
+    def encode_message(self, message: UniversalMessageWrapper) -> Dict[str, Any]:
+        """
+        生成发往后端的消息字典，只包含后端需要的字段。
+        """
+        if self.wire_format == 'json':
+            return message_to_wire_dict(message)
+        return encode_wire(WireMessage.from_wrapper(message),
+                           binary=self.wire_format == 'msgpack')
+
+    def dump(self, obj: Any) -> bytes:
+        """
+        按 wire_format 把请求体或帧编码为字节串。
+        """
+        if self.wire_format == 'msgpack':
+            return pack_msgpack(obj)
+        return dumps_wire(obj)
+
+
+class HttpSseTransport(MessageTransport):
+    """
+    默认的传输方式：每条消息 POST 到 message_post_path，回复通过 sse_path 的 SSE 流接收。
+
+    设置 batch_path 后开启批量发送：在 batch_window 秒内最多合并 batch_size 条消息，
+    以 JSON 数组发往该路径，后端按相同顺序返回每条消息的响应组成的数组。
+
+    SSE 断开后按指数退避重连，并带上 Last-Event-ID 继续接收；超过 sse_heartbeat_timeout
+    秒没有收到任何数据（包括心跳注释）视为连接已断开。
+
+    属性:
+        base_url (str): 后端地址。
+        pool_size (int): 连接池大小。
+        timeout (float): 单个 POST 请求的超时秒数。
+    """
+
+    def __init__(self,
+                 base_url: str,
+                 message_post_path: str = '/send',
+                 sse_path: str = '/events',
+                 batch_path: Optional[str] = None,
+                 pool_size: int = 32,
+                 timeout: float = 30):
+        self.base_url = base_url
+        self.message_post_path = message_post_path
+        self.sse_path = sse_path
+        self.batch_path = batch_path
+        self.batch_size = 50
+        self.batch_window = 0.05
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.http_client = None
+        self.retry_interval = 1
+        self.sse_decoder = SSEDecoder()
+        self.sse_heartbeat_timeout = 30
+        self.sse_max_backoff = 60
+        self.sse_seen_size = 10000  # 记住最近多少个事件ID，用于丢弃重连后重复推送的事件
+        self.sse_seen_ids = OrderedDict()
+        self.sse_state = 'disconnected'
+        self.sse_stats = {
+            'connects': 0,
+            'disconnects': 0,
+            'events': 0,
+            'duplicates': 0,
+            'connected_at': None,
+            'last_data_at': None,
+            'last_event_at': None,
+            'lag': None,
+            'reconnect_delay': 0
+        }
+        self.closing = threading.Event()
+
+    @property
+    def max_batch(self):
+        return self.batch_size if self.batch_path else 1
+
+    def start(self, manager):
+        super().start(manager)
+        self.closing.clear()
+        self.http_client = create_http_client(self.pool_size, self.timeout)
+        # SSE 读取可能阻塞到超时，设为守护线程以免拖住进程退出
+        threading.Thread(target=self.listen_sse, name='message-sse',
+                         daemon=True).start()
+
+    async def send(self, messages):
+        if self.batch_path:
+            path = self.batch_path
+            body = [self.encode_message(message) for message in messages]
+        else:
+            path = self.message_post_path
+            body = self.encode_message(messages[0])
+        headers = {
+            'Content-Type':
+            'application/msgpack'
+            if self.wire_format == 'msgpack' else 'application/json'
+        }
+        try:
+            status, content = await self.http_client.post(
+                self.base_url + path,
+                data=self.dump(body),
+                headers=headers)
+        except Exception as e:
+            raise SendError(f"{type(e).__name__}: {e}")
+        log.debug(f'🚀🚀🚀🚀🚀🚀请求回复：{status}')
+        if status != 200:
+            raise SendError(f"HTTP {status}", status)
+        try:
+            res = json.loads(content)
+        except ValueError:
+            raise SendError(f"Undecodable response: {content[:200]!r}", status)
+        if not self.batch_path:
+            res = [res]
+        elif not isinstance(res, list) or len(res) != len(messages):
+            # 无法确定哪些消息被接收，整批重新发送
+            raise SendError(f"Batch of {len(messages)} messages got a "
+                            f"malformed response: {content[:200]!r}", status)
+        return res
+
+    async def close(self):
+        self.closing.set()
+        if self.http_client is not None:
+            await self.http_client.close()
+
+    def listen_sse(self):
+        decoder = self.sse_decoder
+        stats = self.sse_stats
+        failures = 0
+        while not self.closing.is_set():
+            received = False
+            try:
+                log.debug('listening...')
+                self.sse_state = 'connecting'
+                headers = {'Accept': 'text/event-stream'}
+                if decoder.last_event_id is not None:
+                    # 让后端从断开处继续推送
+                    headers['Last-Event-ID'] = decoder.last_event_id
+                decoder.reset()
+                # 读取超时即心跳超时：后端空闲时应定期发送注释行保持连接
+                with requests.get(self.base_url + self.sse_path,
+                                  stream=True,
+                                  headers=headers,
+                                  timeout=(10, self.sse_heartbeat_timeout)) as r:
+                    r.raise_for_status()
+                    self.sse_state = 'connected'
+                    stats['connects'] += 1
+                    stats['connected_at'] = time.time()
+                    for chunk in iter_chunks(r):
+                        received = True
+                        stats['last_data_at'] = time.time()
+                        for event in decoder.feed(chunk):
+                            self._handle_event(event)
+                log.warning('SSE stream closed by backend')
+            except requests.exceptions.RequestException as e:
+                # 处理网络请求相关的异常，包括心跳超时
+                log.error(f"Network error occurred: {e}")
+            except Exception as e:
+                # 处理其他可能的异常
+                log.error(f"An error occurred: {e}")
+            if self.sse_state == 'connected':
+                stats['disconnects'] += 1
+            # 收到过数据说明连接曾经正常，重新从最短等待时间开始退避
+            failures = 1 if received else failures + 1
+            # 后端可以用 retry 字段指定最短等待时间
+            base = self.retry_interval if decoder.retry is None \
+                else decoder.retry / 1000
+            delay = min(self.sse_max_backoff, base * 2**(failures - 1))
+            delay *= random.uniform(0.5, 1)
+            stats['reconnect_delay'] = delay
+            self.sse_state = 'backoff'
+            log.info(f"Reconnect SSE in {delay:.1f}s")
+            self.closing.wait(delay)
+        self.sse_state = 'stopped'
+
+    def _handle_event(self, event):
+        stats = self.sse_stats
+        now = time.time()
+        stats['last_event_at'] = now
+        if event.id is not None:
+            if event.id in self.sse_seen_ids:
+                # 后端从 Last-Event-ID 之前开始重放时，已处理的事件不再处理
+                stats['duplicates'] += 1
+                return
+            self.sse_seen_ids[event.id] = None
+            if len(self.sse_seen_ids) > self.sse_seen_size:
+                self.sse_seen_ids.popitem(last=False)
+        stats['events'] += 1
+        try:
+            # 事件数据是 JSON，其中的 data 字段是要处理的回复
+            json_data = json.loads(event.data)
+        except ValueError:
+            log.warning(f"Ignored non-JSON SSE event {event.id}: "
+                        f"{event.data[:200]}")
+            return
+        if not isinstance(json_data, dict):
+            return
+        if isinstance(json_data.get('timestamp'), (int, float)):
+            stats['lag'] = now - json_data['timestamp']
+        data = json_data.get('data', None)
+        if data is not None:
+            self.manager.recv_queue.put(data)
+
+    def status(self):
+        """
+        返回 SSE 连接的状态和指标。
+
+        - state: disconnected、connecting、connected、backoff 或 stopped。
+        - connects、disconnects、events、duplicates: 累计次数。
+        - idle_seconds: 距离上次收到任何数据（包括心跳）的秒数。
+        - lag: 最近一个带 timestamp 字段的事件从后端发出到收到的秒数。
+        """
+        status = dict(self.sse_stats,
+                      state=self.sse_state,
+                      last_event_id=self.sse_decoder.last_event_id)
+        last_data_at = status['last_data_at']
+        status['idle_seconds'] = None if last_data_at is None \
+            else time.time() - last_data_at
+        return status
+
+
+class WebSocketTransport(MessageTransport):
+    """
+    全双工 WebSocket 传输：发送和回复共用一条长连接，需要安装 aiohttp。
+
+    每个帧都是一个 JSON 对象（wire_format 为 msgpack 时是 MessagePack 编码的二进制帧）：
+
+    - 发送: {"type": "send", "id": <消息ID>, "message": {...}}
+    - 确认: {"type": "ack", "id": <消息ID>, "response": {"data": ..., "message": ...}}
+    - 拒绝: {"type": "error", "id": <消息ID>, "status": <错误码>, "error": <原因>}
+    - 推送: {"type": "reply", "data": {...}}
+
+    确认和拒绝按消息ID对应到等待中的发送。连接断开时等待中的发送全部失败，交给
+    MessageManager 重试；连接按指数退避重连，空闲时用 WebSocket ping 检测连接是否存活。
+
+    属性:
+        url (str): WebSocket 地址，例如 ws://127.0.0.1:8000/ws。
+        heartbeat (float): 发送 ping 的间隔秒数，收不到 pong 时断开重连。
+        send_timeout (float): 等待连接和确认的最长秒数。
+    """
+
+    def __init__(self,
+                 url: str,
+                 heartbeat: float = 15,
+                 send_timeout: float = 30,
+                 retry_interval: float = 1,
+                 max_backoff: float = 60):
+        if aiohttp is None:
+            raise ImportError('WebSocketTransport requires aiohttp')
+        self.url = url
+        self.heartbeat = heartbeat
+        self.send_timeout = send_timeout
+        self.retry_interval = retry_interval
+        self.max_backoff = max_backoff
+        self.ws = None
+        self.task = None
+        self.closing = False
+        self.connected = None
+        self.pending = {}
+        self.state = 'disconnected'
+        self.stats = {
+            'connects': 0,
+            'disconnects': 0,
+            'acks': 0,
+            'replies': 0,
+            'last_frame_at': None
+        }
+
+    def start(self, manager):
+        super().start(manager)
+        self.closing = False
+        self.connected = asyncio.Event()
+        manager.loop.call_soon_threadsafe(self._start_task)
+
+    def _start_task(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        failures = 0
+        async with aiohttp.ClientSession() as session:
+            while not self.closing:
+                self.state = 'connecting'
+                try:
+                    async with session.ws_connect(self.url,
+                                                  heartbeat=self.heartbeat) as ws:
+                        self.ws = ws
+                        self.state = 'connected'
+                        self.stats['connects'] += 1
+                        self.connected.set()
+                        failures = 0
+                        async for frame in ws:
+                            if frame.type == aiohttp.WSMsgType.TEXT:
+                                self._handle_frame(frame.data)
+                            elif frame.type == aiohttp.WSMsgType.BINARY:
+                                self._handle_frame(frame.data, binary=True)
+                            elif frame.type == aiohttp.WSMsgType.ERROR:
+                                break
+                    self.stats['disconnects'] += 1
+                    log.warning('WebSocket closed by backend')
+                except Exception as e:
+                    log.error(f"WebSocket error occurred: {e}")
+                finally:
+                    self.connected.clear()
+                    self.ws = None
+                    self._fail_pending('WebSocket disconnected')
+                if self.closing:
+                    break
+                failures += 1
+                delay = min(self.max_backoff,
+                            self.retry_interval * 2**(failures - 1))
+                delay *= random.uniform(0.5, 1)
+                self.state = 'backoff'
+                log.info(f"Reconnect WebSocket in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        self.state = 'stopped'
+
+    def _handle_frame(self, data, binary=False):
+        self.stats['last_frame_at'] = time.time()
+        try:
+            frame = unpack_msgpack(data) if binary else json.loads(data)
+        except ValueError:
+            log.warning(f"Ignored undecodable WebSocket frame: {data[:200]}")
+            return
+        kind = frame.get('type')
+        if kind in ('ack', 'error'):
+            future = self.pending.get(frame.get('id'))
+            if future is None or future.done():
+                return
+            if kind == 'ack':
+                self.stats['acks'] += 1
+                future.set_result(frame.get('response') or {})
+            else:
+                future.set_exception(
+                    SendError(frame.get('error') or 'rejected by backend',
+                              frame.get('status')))
+        elif kind == 'reply':
+            data = frame.get('data')
+            if data is not None:
+                self.stats['replies'] += 1
+                self.manager.recv_queue.put(data)
+
+    def _fail_pending(self, error):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(SendError(error))
+
+    async def send(self, messages):
+        return list(await asyncio.gather(
+            *(self._send_one(message) for message in messages)))
+
+    async def _send_one(self, message):
+        try:
+            await asyncio.wait_for(self.connected.wait(), self.send_timeout)
+        except asyncio.TimeoutError:
+            raise SendError('WebSocket is not connected')
+        msg_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[msg_id] = future
+        try:
+            frame = self.dump({
+                'type': 'send',
+                'id': msg_id,
+                'message': self.encode_message(message)
+            })
+            # msgpack 编码时使用二进制帧
+            if self.wire_format == 'msgpack':
+                await self.ws.send_bytes(frame)
+            else:
+                await self.ws.send_str(frame.decode('utf-8'))
+            return await asyncio.wait_for(future, self.send_timeout)
+        except asyncio.TimeoutError:
+            raise SendError('WebSocket ack timed out')
+        except (ConnectionError, AttributeError, aiohttp.ClientError) as e:
+            # ws 为 None 说明发送前连接刚好断开
+            raise SendError(f"{type(e).__name__}: {e}")
+        finally:
+            self.pending.pop(msg_id, None)
+
+    async def close(self):
+        self.closing = True
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def status(self):
+        """
+        返回 WebSocket 连接的状态和指标：state、connects、disconnects、acks、replies、
+        pending（等待确认的消息数）和 idle_seconds（距离上次收到帧的秒数）。
+        """
+        last_frame_at = self.stats['last_frame_at']
+        return dict(self.stats,
+                    state=self.state,
+                    pending=len(self.pending),
+                    idle_seconds=None if last_frame_at is None else
+                    time.time() - last_frame_at)